@@ -0,0 +1,71 @@
+import socket
+
+# Minimal client side of the adb server smart-socket protocol
+# (see SERVICES.TXT / OVERVIEW.TXT in the adb sources).
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 5037
+
+
+class AdbProtocolError(Exception):
+    pass
+
+
+def connect(host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=None):
+    """Open a socket to the adb server."""
+    sock = socket.create_connection((host, port), timeout=timeout)
+    return sock
+
+
+def read_exact(sock, size):
+    """Read exactly `size` bytes or raise if the peer closes early."""
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise AdbProtocolError("Connection closed by adb server")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def read_hex_block(sock):
+    """Read a 4-hex-digit length prefixed payload."""
+    length = int(read_exact(sock, 4), 16)
+    if length == 0:
+        return b""
+    return read_exact(sock, length)
+
+
+def send_request(sock, request):
+    """Send a service request and wait for OKAY, raising with the FAIL message otherwise."""
+    data = request.encode("utf-8")
+    sock.sendall(b"%04x" % len(data) + data)
+    status = read_exact(sock, 4)
+    if status == b"OKAY":
+        return
+    if status == b"FAIL":
+        message = read_hex_block(sock).decode("utf-8", errors="replace")
+        raise AdbProtocolError(f"{request}: {message}")
+    raise AdbProtocolError(f"{request}: unexpected status {status!r}")
+
+
+def open_device_service(serial, service, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=None):
+    """Switch a new connection to the transport of `serial` and open `service` on it."""
+    sock = connect(host, port, timeout)
+    try:
+        send_request(sock, f"host:transport:{serial}")
+        send_request(sock, service)
+    except Exception:
+        sock.close()
+        raise
+    return sock
+
+
+def parse_device_list(payload):
+    """Parse a `host:devices` / `host:track-devices` payload into {serial: state}."""
+    devices = {}
+    for line in payload.decode("utf-8", errors="replace").splitlines():
+        parts = line.strip().split("\t")
+        if len(parts) >= 2 and parts[0]:
+            devices[parts[0]] = parts[1]
+    return devices
@@ -1,35 +1,115 @@
 import os
-import shutil
 import json
 import time
+import uuid
+import base64
+import socket
+import threading
+import asyncio
+import hashlib
 import zipfile
 import plistlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from urllib.parse import urlparse, unquote
 from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
 from loguru import logger
 from pyaxmlparser import APK
+from .metadata_store import MetadataStore
+from .parse_cache import ParseCache
+from . import artifact_inspector
+from . import axml
+
+UPLOADS_MOUNT = "/uploads/"
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+# version_name values meaning the manifest still has to be (re)parsed
+UNPARSED_VERSIONS = ("Unknown", "IPA File", "Parse Error", None)
+
+def _local_hostnames():
+    names = {"localhost", "127.0.0.1", "::1", "0.0.0.0"}
+    try:
+        hostname = socket.gethostname()
+        names.add(hostname.lower())
+        names.add(socket.getfqdn().lower())
+        names.update(socket.gethostbyname_ex(hostname)[2])
+    except OSError:
+        pass
+    return names
+
+class InvalidCursor(ValueError):
+    pass
 
 class ApkManager:
-    def __init__(self, upload_dir: str):
+    def __init__(self, upload_dir: str, events=None, server_port=8791):
         self.upload_dir = upload_dir
         self.metadata_file = os.path.join(upload_dir, "metadata.json")
         os.makedirs(self.upload_dir, exist_ok=True)
-        self.metadata = self._load_metadata()
-
-    def _load_metadata(self):
+        self.store = MetadataStore(os.path.join(upload_dir, "metadata.db"))
+        # Legacy metadata.json from older versions is imported once
         if os.path.exists(self.metadata_file):
-            try:
-                with open(self.metadata_file, "r") as f:
-                    return json.load(f)
-            except Exception:
-                return {}
-        return {}
+            self.store.import_json(self.metadata_file)
+        self.local_hosts = _local_hostnames()
+        # Port this server listens on: /uploads URLs of another instance on the same host aren't ours
+        self.server_port = server_port
+        # Manifest parsing is CPU/IO heavy, keep it off the event loop and the request pool
+        self._parse_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="apk-parse")
+        # Parse results shared by upload, listing repair and the install flow
+        self.parse_cache = ParseCache()
+        # Rich metadata (ABIs, SDK range, signers, sizes) is extracted in the background after the fast parse
+        self._inspect_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="apk-inspect")
+        self._inspect_queued = set()
+        self._inspect_lock = threading.Lock()
+        # Cached /apks listing, rebuilt only when the upload dir or the metadata changes
+        self._listing = None
+        self._listing_etag = None
+        self._listing_key = None
+        self._generation = 0
+        self._listing_lock = threading.Lock()
+        self._synced_mtime = None  # upload dir mtime the metadata index was last synced with
+        # Optional EventBus; clients are told to reload the listing instead of polling it
+        self.events = events
+
+    def _changed(self):
+        """Invalidate the cached listing after a metadata write."""
+        self._generation += 1
+        if self.events:
+            self.events.publish("artifacts", {"generation": self._generation})
 
-    def _save_metadata(self):
-        with open(self.metadata_file, "w") as f:
-            json.dump(self.metadata, f, indent=4)
+    def _hash_file(self, file_path):
+        sha256 = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def _read_manifest_fast(self, file_path):
+        """
+        Read (version_name, version_code, package) straight from the binary manifest.
+        Returns None when a value is missing or a resource reference, so the caller
+        can fall back to pyaxmlparser.
+        """
+        try:
+            manifest = axml.read_manifest(file_path)
+        except Exception as e:
+            logger.debug(f"Fast manifest read failed for {file_path}: {e}")
+            return None
+        values = (manifest.get("versionName"), manifest.get("versionCode"), manifest.get("package"))
+        if any(v is None or v == "" or isinstance(v, axml.Reference) for v in values):
+            return None
+        vn, vc, pkg = values
+        return str(vn), str(vc), pkg
 
     def _parse_apk(self, file_path):
+        return self.parse_cache.get_or_parse(file_path, "apk", self._decode_apk)
+
+    def _parse_ipa(self, file_path):
+        return self.parse_cache.get_or_parse(file_path, "ipa", self._decode_ipa)
+
+    def _decode_apk(self, file_path):
+        fast = self._read_manifest_fast(file_path)
+        if fast:
+            return fast
         try:
             apk = APK(file_path)
             # Handle cases where attributes might be None
@@ -41,7 +121,7 @@ class ApkManager:
             logger.error(f"Failed to parse APK {file_path}: {e}")
             return "Parse Error", "Parse Error", "Unknown"
 
-    def _parse_ipa(self, file_path):
+    def _decode_ipa(self, file_path):
         try:
             with zipfile.ZipFile(file_path, 'r') as z:
                 # Find Info.plist
@@ -66,6 +146,193 @@ class ApkManager:
 
     def list_apks(self):
         """List all APK and IPA files with metadata."""
+        return self.list_apks_with_etag()[0]
+
+    def list_apks_with_etag(self):
+        """
+        Return (listing, etag). The listing is served from memory and only rebuilt
+        when the upload dir's mtime (files added/removed/renamed) or the metadata changed.
+        """
+        key = (os.stat(self.upload_dir).st_mtime_ns, self._generation)
+        if key == self._listing_key:
+            return self._listing, self._listing_etag
+        with self._listing_lock:
+            if key != self._listing_key:
+                listing = self._build_listing()
+                self._listing_etag = '"%s"' % hashlib.sha1(json.dumps(listing, sort_keys=True).encode()).hexdigest()
+                self._listing = listing
+                # Keyed on the state seen before the rebuild, so a change racing with it
+                # (or a repair done by it) just costs one more rebuild
+                self._listing_key = key
+        return self._listing, self._listing_etag
+
+    def search_apks(self, platform=None, package_name=None, version_code_min=None, version_code_max=None,
+                    q=None, sort="upload_time", order="desc", cursor=None, limit=50):
+        """
+        One page of the artifact listing, filtered and sorted in the metadata index.
+        Returns {"items": [...], "next_cursor": str or None}.
+        """
+        self._sync_index()
+
+        after = self._decode_cursor(cursor) if cursor else None
+        rows, next_after = self.store.query(
+            platform=platform, package_name=package_name,
+            version_code_min=version_code_min, version_code_max=version_code_max,
+            text=q, sort=sort, descending=(order != "asc"), after=after, limit=limit)
+        items = [dict(self._listing_item(row["filename"], row), platform=row["platform"]) for row in rows]
+
+        next_cursor = None
+        if next_after:
+            next_cursor = base64.urlsafe_b64encode(json.dumps(list(next_after)).encode()).decode()
+        return {"items": items, "next_cursor": next_cursor}
+
+    @staticmethod
+    def _decode_cursor(cursor):
+        """(sort_value, filename) from a next_cursor; InvalidCursor if it wasn't made by search_apks."""
+        try:
+            after = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        except (TypeError, ValueError):  # bad base64, bad UTF-8 and bad JSON are all ValueErrors
+            raise InvalidCursor("Invalid cursor")
+        if (not isinstance(after, list) or len(after) != 2 or not isinstance(after[1], str)
+                or isinstance(after[0], bool) or not isinstance(after[0], (str, int))):
+            raise InvalidCursor("Invalid cursor")
+        return after
+
+    def _sync_index(self):
+        """
+        Add rows for files dropped into the upload dir behind our back and drop rows of
+        removed ones. Only a listdir and a set diff, and only after the dir changed;
+        new files are parsed and inspected in the background.
+        """
+        mtime = os.stat(self.upload_dir).st_mtime_ns
+        if mtime == self._synced_mtime:
+            return
+        self._synced_mtime = mtime
+        files = {f for f in os.listdir(self.upload_dir) if f.endswith((".apk", ".ipa"))}
+        known = self.store.filenames()
+        gone, new = known - files, files - known
+        self.store.delete_many(list(gone))
+        # INSERT OR IGNORE: a save_apk racing with this keeps its own row
+        self.store.add_missing({filename: {"upload_time": self._mtime_str(filename)} for filename in new})
+        for filename in new:
+            self.schedule_inspection(filename)
+        if gone or new:
+            self._changed()
+
+    def _mtime_str(self, filename):
+        mtime = os.path.getmtime(os.path.join(self.upload_dir, filename))
+        return datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M:%S")
+
+    def _listing_item(self, filename, meta):
+        """One entry of the /apks listing (also used by search) from stored metadata."""
+        return {
+            "filename": filename,
+            "custom_name": meta.get("custom_name") or "",
+            "version_name": meta.get("version_name") or "Unknown",
+            "version_code": meta.get("version_code") or "Unknown",
+            "package_name": meta.get("package_name") or "Unknown",
+            "sha256": meta.get("sha256") or "",
+            "upload_time": meta.get("upload_time") or self._mtime_str(filename),
+        }
+
+    def schedule_inspection(self, filename):
+        """Queue background extraction of the detailed metadata of `filename`."""
+        with self._inspect_lock:
+            if filename in self._inspect_queued:
+                return
+            self._inspect_queued.add(filename)
+        self._inspect_pool.submit(self._inspect, filename)
+
+    def inspect_pending(self):
+        """Queue every artifact whose details are missing or older than the file."""
+        count = 0
+        for filename, meta in self.store.all().items():
+            file_path = os.path.join(self.upload_dir, filename)
+            try:
+                sig = self._file_sig(file_path)
+            except OSError:
+                continue
+            if meta.get("inspected_sig") != sig:
+                self.schedule_inspection(filename)
+                count += 1
+        if count:
+            logger.info(f"Queued {count} artifact(s) for metadata extraction")
+        return count
+
+    def _inspect(self, filename):
+        file_path = os.path.join(self.upload_dir, filename)
+        try:
+            sig = self._file_sig(file_path)
+            meta = self.store.get(filename)
+            if meta is None:
+                return
+            if meta.get("version_name") in UNPARSED_VERSIONS and meta.get("parse_error_sig") != sig:
+                # Files registered by _sync_index only have a placeholder row
+                vn, vc, pkg = self._parse_file(file_path)
+                if vn not in ("Unknown", "Parse Error"):
+                    self.store.update(filename, version_name=str(vn), version_code=str(vc), package_name=pkg,
+                                      sha256=meta.get("sha256") or self._hash_file(file_path), parse_error_sig=None)
+                else:
+                    self.store.update(filename, parse_error_sig=sig)
+                self._changed()
+            if meta.get("inspected_sig") == sig:
+                return
+            try:
+                details = self.parse_cache.get_or_parse(file_path, "inspect", artifact_inspector.inspect)
+                fields = artifact_inspector.to_store_fields(details)
+                fields["inspect_error"] = None
+            except Exception as e:
+                logger.warning(f"Metadata extraction failed for {filename}: {e}")
+                fields = {"inspect_error": str(e)}
+            self.store.update(filename, inspected_sig=sig, **fields)
+            self._changed()
+        except OSError:
+            pass  # Deleted while queued
+        except Exception:
+            logger.exception(f"Inspecting {filename} crashed")
+        finally:
+            with self._inspect_lock:
+                self._inspect_queued.discard(filename)
+
+    def get_details(self, filename):
+        """Stored metadata of `filename` with the extracted details decoded, or None."""
+        meta = self.store.get(filename)
+        if meta is None:
+            return None
+        details = self._decode_details(meta)
+        details["filename"] = filename
+        details["inspected"] = "inspected_sig" in meta
+        return details
+
+    def get_details_for_path(self, file_path):
+        """
+        Decoded details of any local artifact: stored ones for current upload-dir files,
+        otherwise extracted on the spot (through the parse cache).
+        """
+        sig = self._file_sig(file_path)
+        if os.path.dirname(os.path.abspath(file_path)) == os.path.abspath(self.upload_dir):
+            meta = self.store.get(os.path.basename(file_path))
+            if meta and meta.get("inspected_sig") == sig and "inspect_error" not in meta:
+                return self._decode_details(meta)
+        details = self.parse_cache.get_or_parse(file_path, "inspect", artifact_inspector.inspect)
+        meta = artifact_inspector.to_store_fields(details)
+        meta["version_name"], meta["version_code"], meta["package_name"] = self._parse_file(file_path)
+        return self._decode_details(meta)
+
+    def _decode_details(self, meta):
+        details = dict(meta)
+        for field in ("abis", "signature_schemes", "cert_sha256", "cert_hashcodes", "required_capabilities"):
+            details[field] = [v for v in details.get(field, "").split(",") if v]
+        details["device_family"] = [int(v) for v in details.get("device_family", "").split(",") if v.isdigit()]
+        details["requires_splits"] = bool(details.get("requires_splits"))
+        details["size_breakdown"] = json.loads(details.get("size_breakdown") or "{}")
+        return details
+
+    def _file_sig(self, file_path):
+        st = os.stat(file_path)
+        return f"{st.st_size}:{st.st_mtime_ns}"
+
+    def _build_listing(self):
         # Sync with actual files
         all_files = os.listdir(self.upload_dir)
         existing_apks = set(f for f in all_files if f.endswith(".apk"))
@@ -73,44 +340,41 @@ class ApkManager:
         existing_files = existing_apks.union(existing_ipas)
         
         # Remove metadata for missing files
-        for filename in list(self.metadata.keys()):
-            if filename not in existing_files:
-                del self.metadata[filename]
-        self._save_metadata()
+        metadata = self.store.all()
+        missing = [filename for filename in metadata if filename not in existing_files]
+        self.store.delete_many(missing)
+        if missing:
+            self._changed()
 
         # Build lists
         android_list = []
         ios_list = []
         
         for filename in existing_files:
-            meta = self.metadata.get(filename, {})
+            meta = metadata.get(filename, {})
             # Try to parse if unknown (auto-repair metadata)
-            if meta.get("version_name") in ["Unknown", "IPA File", "Parse Error", None]:
-                 if filename.endswith(".ipa"):
-                     vn, vc, pkg = self._parse_ipa(os.path.join(self.upload_dir, filename))
+            if meta.get("version_name") in UNPARSED_VERSIONS:
+                 file_path = os.path.join(self.upload_dir, filename)
+                 sig = self._file_sig(file_path)
+                 # Files known not to parse are left alone until they change
+                 if meta.get("parse_error_sig") != sig:
+                     vn, vc, pkg = self._parse_file(file_path)
                      if vn not in ["Unknown", "Parse Error"]:
-                         meta["version_name"] = str(vn)
-                         meta["version_code"] = str(vc)
-                         meta["package_name"] = pkg
-                         self.metadata[filename] = meta
-                         self._save_metadata()
-                 elif filename.endswith(".apk"):
-                     vn, vc, pkg = self._parse_apk(os.path.join(self.upload_dir, filename))
-                     if vn not in ["Unknown", "Parse Error"]:
-                         meta["version_name"] = str(vn)
-                         meta["version_code"] = str(vc)
-                         meta["package_name"] = pkg
-                         self.metadata[filename] = meta
-                         self._save_metadata()
-
-            file_info = {
-                "filename": filename,
-                "custom_name": meta.get("custom_name", ""),
-                "version_name": meta.get("version_name", "Unknown"),
-                "version_code": meta.get("version_code", "Unknown"),
-                "package_name": meta.get("package_name", "Unknown"),
-                "upload_time": meta.get("upload_time", datetime.fromtimestamp(os.path.getmtime(os.path.join(self.upload_dir, filename))).strftime("%Y-%m-%d %H:%M:%S"))
-            }
+                         repaired = {"version_name": str(vn), "version_code": str(vc), "package_name": pkg,
+                                     "parse_error_sig": None}
+                     else:
+                         repaired = {"parse_error_sig": sig}
+                     meta = dict(meta, **repaired)
+                     if filename in metadata:
+                         # Only the repaired fields: the inspection pool may have written the row meanwhile
+                         self.store.update(filename, **repaired)
+                     else:
+                         self.store.put(filename, meta)
+                     self._changed()
+            if not meta.get("inspected_sig"):
+                self.schedule_inspection(filename)
+
+            file_info = self._listing_item(filename, meta)
             
             if filename.endswith(".apk"):
                 android_list.append(file_info)
@@ -143,34 +407,55 @@ class ApkManager:
             filename = original_filename
 
         file_path = os.path.join(self.upload_dir, filename)
+        # Hidden temp name in the same directory so the final rename is atomic
+        tmp_path = os.path.join(self.upload_dir, f".{filename}.{uuid.uuid4().hex}.part")
         try:
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            
-            version_name = "Unknown"
-            version_code = "Unknown"
-            package_name = "Unknown"
-
-            # Parse APK/IPA info
-            # Parse APK/IPA info
-            if filename.lower().endswith(".apk"):
-                version_name, version_code, package_name = self._parse_apk(file_path)
-            elif filename.lower().endswith(".ipa"):
-                version_name, version_code, package_name = self._parse_ipa(file_path)
-
-            self.metadata[filename] = {
+            sha256 = await run_in_threadpool(self._stream_to_disk, file.file, tmp_path)
+            # Parsed under the temporary name, so the file and its metadata row show up together
+            loop = asyncio.get_running_loop()
+            version_name, version_code, package_name = await loop.run_in_executor(
+                self._parse_pool, self._parse_file, tmp_path, filename)
+
+            os.replace(tmp_path, file_path)
+            self.store.put(filename, {
                 "custom_name": remark if remark else "", # Use remark as custom_name (display name)
                 "version_name": str(version_name),
                 "version_code": str(version_code),
                 "package_name": package_name,
+                "sha256": sha256,
                 "upload_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            }
-            self._save_metadata()
+            })
+            self._changed()
+            self.schedule_inspection(filename)
 
-            return {"filename": filename, "status": "success"}
+            return {"filename": filename, "status": "success", "sha256": sha256}
         except Exception as e:
             logger.error(f"Error saving file: {e}")
             return {"status": "error", "message": str(e)}
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _stream_to_disk(self, src, dest_path):
+        """Copy an upload to disk in large chunks, hashing on the way. Returns the sha256."""
+        sha256 = hashlib.sha256()
+        with open(dest_path, "wb") as buffer:
+            while True:
+                chunk = src.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                sha256.update(chunk)
+                buffer.write(chunk)
+        return sha256.hexdigest()
+
+    def _parse_file(self, file_path, filename=None):
+        """(version_name, version_code, package_name); the type comes from `filename` if given."""
+        name = (filename or file_path).lower()
+        if name.endswith(".apk"):
+            return self._parse_apk(file_path)
+        elif name.endswith(".ipa"):
+            return self._parse_ipa(file_path)
+        return "Unknown", "Unknown", "Unknown"
 
     def delete_apk(self, filename):
         """Delete an APK file and its metadata."""
@@ -179,9 +464,8 @@ class ApkManager:
             if os.path.exists(file_path):
                 os.remove(file_path)
             
-            if filename in self.metadata:
-                del self.metadata[filename]
-                self._save_metadata()
+            self.store.delete(filename)
+            self._changed()
             
             return {"status": "success", "filename": filename}
         except Exception as e:
@@ -192,6 +476,49 @@ class ApkManager:
         """Get the full path of an APK file."""
         return os.path.join(self.upload_dir, filename)
 
+    def find_by_sha256(self, sha256):
+        """Return the filename of a stored artifact with this content hash, or None."""
+        if not sha256:
+            return None
+        for filename in self.store.find_by_sha256(sha256.lower()):
+            if os.path.exists(self.get_apk_path(filename)):
+                return filename
+        return None
+
+    def resolve_local(self, apk_url=None, sha256=None):
+        """
+        Map an install source onto a file already in the store, so it can be
+        installed in place instead of being downloaded again.
+        Matches this server's own /uploads URLs (host and port), or any stored
+        file with the same sha256.
+        Returns the local path or None.
+        """
+        filename = self.find_by_sha256(sha256)
+        if filename:
+            return self.get_apk_path(filename)
+
+        if not apk_url:
+            return None
+        parsed = urlparse(apk_url)
+        if not parsed.path.startswith(UPLOADS_MOUNT):
+            return None
+        if (parsed.hostname or "").lower() not in self.local_hosts:
+            return None
+        try:
+            port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        except ValueError:
+            return None
+        if port != self.server_port:
+            return None
+        filename = unquote(parsed.path[len(UPLOADS_MOUNT):])
+        # Only plain names inside the store, no traversal
+        if not filename or filename != os.path.basename(filename):
+            return None
+        file_path = self.get_apk_path(filename)
+        if os.path.isfile(file_path):
+            return file_path
+        return None
+
     def register_file(self, filename, remark=None):
         """Register an existing file (e.g. downloaded) into metadata."""
         file_path = os.path.join(self.upload_dir, filename)
@@ -199,19 +526,16 @@ class ApkManager:
             return {"status": "error", "message": "File not found"}
             
         # Parse APK/IPA info
-        if filename.lower().endswith(".apk"):
-            version_name, version_code, package_name = self._parse_apk(file_path)
-        elif filename.lower().endswith(".ipa"):
-            version_name, version_code, package_name = self._parse_ipa(file_path)
-        else:
-            version_name, version_code, package_name = "Unknown", "Unknown", "Unknown"
+        version_name, version_code, package_name = self._parse_file(file_path)
 
-        self.metadata[filename] = {
+        self.store.put(filename, {
             "custom_name": remark if remark else "",
             "version_name": str(version_name),
             "version_code": str(version_code),
             "package_name": package_name,
+            "sha256": self._hash_file(file_path),
             "upload_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-        self._save_metadata()
+        })
+        self._changed()
+        self.schedule_inspection(filename)
         return {"status": "success", "filename": filename}
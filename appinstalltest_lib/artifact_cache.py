@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import Future
+from loguru import logger
+from .http_client import default_client
+
+
+class ArtifactCache:
+    """
+    Persistent cache for artifacts downloaded from remote URLs.
+
+    Blobs are stored once per SHA-256 of their content; URLs map onto blobs
+    together with the ETag/Last-Modified they were served with, so a repeat
+    fetch is a conditional GET. Concurrent fetches of one URL share a single
+    download, and the least recently used blobs are evicted beyond `max_bytes`.
+    Paths returned by `fetch` are pinned against eviction until `release`.
+    """
+
+    def __init__(self, cache_dir, max_bytes=20 * 1024 * 1024 * 1024, http_client=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.http = http_client or default_client
+        self.index_file = os.path.join(cache_dir, "index.json")
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._in_flight = {}  # url -> Future resolving to the blob sha256
+        self._pins = {}       # sha256 -> number of users
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0       # fetches served by joining another fetch of the same URL
+        self._urls, self._blobs = self._load_index()
+
+    def _load_index(self):
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, "r") as f:
+                    data = json.load(f)
+                blobs = {sha: b for sha, b in data.get("blobs", {}).items()
+                         if os.path.exists(os.path.join(self.cache_dir, sha + b.get("suffix", "")))}
+                urls = {url: u for url, u in data.get("urls", {}).items() if u.get("sha256") in blobs}
+                return urls, blobs
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable cache index: {e}")
+        return {}, {}
+
+    def _save_index(self):
+        tmp_path = self.index_file + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"urls": self._urls, "blobs": self._blobs}, f)
+        os.replace(tmp_path, self.index_file)
+
+    def _blob_path(self, sha256):
+        return os.path.join(self.cache_dir, sha256 + self._blobs[sha256].get("suffix", ""))
+
+    def fetch(self, url, suffix=".apk"):
+        """Return a local path holding the content of `url`, downloading only if needed."""
+        while True:
+            with self._lock:
+                future = self._in_flight.get(url)
+                owner = future is None
+                if owner:
+                    future = Future()
+                    self._in_flight[url] = future
+
+            if owner:
+                try:
+                    future.set_result(self._fetch(url, suffix))
+                except Exception as e:
+                    future.set_exception(e)
+                finally:
+                    with self._lock:
+                        self._in_flight.pop(url, None)
+                # _fetch already pinned the blob for us
+                sha256 = future.result()
+                with self._lock:
+                    return self._blob_path(sha256)
+
+            sha256 = future.result()
+            with self._lock:
+                # The blob may have been evicted between the download and now; fetch again if so
+                if sha256 in self._blobs:
+                    self.shared += 1
+                    self._pin(sha256)
+                    return self._blob_path(sha256)
+
+    def _pin(self, sha256):
+        # Caller holds self._lock
+        self._pins[sha256] = self._pins.get(sha256, 0) + 1
+        self._blobs[sha256]["last_access"] = time.time()
+
+    def release(self, path):
+        """Unpin a path returned by `fetch`."""
+        sha256 = os.path.basename(path).split(".")[0]
+        with self._lock:
+            if self._pins.get(sha256, 0) > 1:
+                self._pins[sha256] -= 1
+            else:
+                self._pins.pop(sha256, None)
+            self._evict()
+
+    def owns(self, path):
+        return os.path.dirname(os.path.abspath(path)) == os.path.abspath(self.cache_dir)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared": self.shared,
+                "entries": len(self._blobs),
+                "urls": len(self._urls),
+                "bytes": sum(b["size"] for b in self._blobs.values()),
+                "max_bytes": self.max_bytes,
+            }
+
+    def _fetch(self, url, suffix):
+        headers = {}
+        with self._lock:
+            entry = self._urls.get(url)
+            if entry and entry["sha256"] in self._blobs:
+                if entry.get("etag"):
+                    headers["If-None-Match"] = entry["etag"]
+                if entry.get("last_modified"):
+                    headers["If-Modified-Since"] = entry["last_modified"]
+
+        logger.info(f"Fetching {url} (conditional: {bool(headers)})")
+        with self.http.get(url, stream=True, headers=headers) as r:
+            if r.status_code == 304 and entry:
+                with self._lock:
+                    if entry["sha256"] in self._blobs:
+                        self.hits += 1
+                        self._pin(entry["sha256"])
+                        logger.info(f"Cache hit for {url}")
+                        return entry["sha256"]
+                # Evicted while validating, so download it unconditionally
+                return self._fetch(url, suffix)
+            r.raise_for_status()
+
+            fd, tmp_path = tempfile.mkstemp(suffix=".part", dir=self.cache_dir)
+            sha256 = hashlib.sha256()
+            size = 0
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in r.iter_content(chunk_size=1024 * 1024):
+                        sha256.update(chunk)
+                        size += len(chunk)
+                        f.write(chunk)
+                digest = sha256.hexdigest()
+
+                with self._lock:
+                    self.misses += 1
+                    if digest in self._blobs:
+                        # Same content under another URL (or re-served without validators)
+                        os.remove(tmp_path)
+                    else:
+                        os.replace(tmp_path, os.path.join(self.cache_dir, digest + suffix))
+                        self._blobs[digest] = {"size": size, "suffix": suffix, "last_access": time.time()}
+                    self._urls[url] = {
+                        "sha256": digest,
+                        "etag": r.headers.get("ETag"),
+                        "last_modified": r.headers.get("Last-Modified"),
+                    }
+                    self._pin(digest)
+                    self._evict()
+                    self._save_index()
+                return digest
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+    def _evict(self):
+        # Caller holds self._lock
+        total = sum(b["size"] for b in self._blobs.values())
+        if total <= self.max_bytes:
+            return
+        for sha256, blob in sorted(self._blobs.items(), key=lambda item: item[1]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            if self._pins.get(sha256):
+                continue
+            try:
+                os.remove(self._blob_path(sha256))
+            except OSError as e:
+                logger.warning(f"Failed to evict cached artifact {sha256}: {e}")
+                continue
+            total -= blob["size"]
+            del self._blobs[sha256]
+            for url in [u for u, entry in self._urls.items() if entry["sha256"] == sha256]:
+                del self._urls[url]
+            logger.info(f"Evicted cached artifact {sha256}")
+        self._save_index()
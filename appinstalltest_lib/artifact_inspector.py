@@ -0,0 +1,252 @@
+import json
+import struct
+import hashlib
+import zipfile
+import plistlib
+from . import axml
+
+# APK Signing Block (v2+), see source.android.com/docs/security/features/apksigning/v2
+APK_SIG_BLOCK_MAGIC = b"APK Sig Block 42"
+APK_SIGNATURE_SCHEMES = (
+    (0x1b93ad61, "v3.1"),
+    (0xf05368c0, "v3"),
+    (0x7109871a, "v2"),
+)
+EOCD_MAGIC = b"PK\x05\x06"
+V1_SIGNATURE_SUFFIXES = (".RSA", ".DSA", ".EC")
+
+# Base APKs built from an app bundle declare this in <application>
+SPLITS_REQUIRED_META = "com.android.vending.splits.required"
+
+
+def java_hash_code(data):
+    """java.util.Arrays.hashCode(byte[]), i.e. what Signature.hashCode() prints in `dumpsys package`."""
+    h = 1
+    for b in data:
+        h = (31 * h + (b - 256 if b > 127 else b)) & 0xFFFFFFFF
+    return f"{h:x}"
+
+
+def describe_certificate(der):
+    return {"sha256": hashlib.sha256(der).hexdigest(), "hashcode": java_hash_code(der)}
+
+
+def _length_prefixed(buf, pos):
+    (length,) = struct.unpack_from("<I", buf, pos)
+    start = pos + 4
+    if start + length > len(buf):
+        raise ValueError("Truncated length-prefixed value")
+    return buf[start:start + length], start + length
+
+
+def _iter_length_prefixed(buf):
+    pos = 0
+    while pos < len(buf):
+        value, pos = _length_prefixed(buf, pos)
+        yield value
+
+
+def read_signing_block(f):
+    """Return {scheme_id: value} from the APK Signing Block, or {} if there is none."""
+    f.seek(0, 2)
+    file_size = f.tell()
+    tail_size = min(file_size, 65535 + 22)
+    f.seek(file_size - tail_size)
+    tail = f.read(tail_size)
+    eocd = tail.rfind(EOCD_MAGIC)
+    if eocd < 0 or eocd + 22 > len(tail):
+        return {}
+    (cd_offset,) = struct.unpack_from("<I", tail, eocd + 16)
+    if cd_offset < 32 or cd_offset == 0xFFFFFFFF:
+        return {}
+
+    f.seek(cd_offset - 24)
+    footer = f.read(24)
+    if footer[8:] != APK_SIG_BLOCK_MAGIC:
+        return {}
+    (block_size,) = struct.unpack_from("<Q", footer, 0)
+    block_start = cd_offset - block_size - 8
+    if block_start < 0:
+        return {}
+    f.seek(block_start)
+    block = f.read(block_size + 8)
+
+    pairs = {}
+    pos, end = 8, len(block) - 24
+    while pos + 12 <= end:
+        length, pair_id = struct.unpack_from("<QI", block, pos)
+        pairs[pair_id] = block[pos + 12:pos + 8 + length]
+        pos += 8 + length
+    return pairs
+
+
+def signer_certificates(scheme_value):
+    """First (signing) certificate of every signer in a v2/v3 signature scheme block."""
+    certs = []
+    signers, _ = _length_prefixed(scheme_value, 0)
+    for signer in _iter_length_prefixed(signers):
+        signed_data, _ = _length_prefixed(signer, 0)
+        _, pos = _length_prefixed(signed_data, 0)  # digests
+        certificates, _ = _length_prefixed(signed_data, pos)
+        for cert in _iter_length_prefixed(certificates):
+            certs.append(cert)
+            break
+    return certs
+
+
+def _der_element(buf, pos):
+    """Return (tag, content_start, end) of the DER element at `pos`."""
+    tag = buf[pos]
+    length = buf[pos + 1]
+    pos += 2
+    if length & 0x80:
+        n = length & 0x7F
+        if n == 0 or n > 4:
+            raise ValueError("Unsupported DER length")
+        length = int.from_bytes(buf[pos:pos + n], "big")
+        pos += n
+    return tag, pos, pos + length
+
+
+def _der_children(buf, start, end):
+    pos = start
+    while pos < end:
+        tag, content, child_end = _der_element(buf, pos)
+        yield tag, pos, content, child_end
+        pos = child_end
+
+
+def pkcs7_certificates(der):
+    """Certificates embedded in a PKCS#7 SignedData blob (META-INF/*.RSA|DSA|EC)."""
+    _, content, end = _der_element(der, 0)  # ContentInfo
+    for tag, _, inner, inner_end in _der_children(der, content, end):
+        if tag != 0xA0:  # [0] EXPLICIT content
+            continue
+        _, sd_content, sd_end = _der_element(der, inner)  # SignedData
+        for sd_tag, _, certs_start, certs_end in _der_children(der, sd_content, sd_end):
+            if sd_tag == 0xA0:  # [0] IMPLICIT certificates
+                return [der[start:cert_end] for _, start, _, cert_end in _der_children(der, certs_start, certs_end)]
+    return []
+
+
+def size_breakdown(infos):
+    """Compressed and uncompressed bytes per top-level directory; files at the root count as "/"."""
+    sizes = {}
+    for info in infos:
+        top = info.filename.split("/", 1)[0] if "/" in info.filename else "/"
+        entry = sizes.setdefault(top, {"compressed": 0, "size": 0})
+        entry["compressed"] += info.compress_size
+        entry["size"] += info.file_size
+    return sizes
+
+
+def _int_or_none(value):
+    if isinstance(value, axml.Reference) or isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def inspect_apk(path):
+    """
+    Extract what's needed to decide whether an APK can go to a device:
+    SDK range, native ABIs, signer certificates, split info and a size breakdown.
+    """
+    details = {"min_sdk": None, "target_sdk": None, "abis": [], "signature_schemes": [], "certificates": [],
+               "split_name": None, "requires_splits": False, "size_breakdown": {}}
+    with zipfile.ZipFile(path) as z:
+        infos = z.infolist()
+        details["size_breakdown"] = size_breakdown(infos)
+        abis = set()
+        v1_signature = None
+        for info in infos:
+            parts = info.filename.split("/")
+            if len(parts) == 3 and parts[0] == "lib" and parts[2].endswith(".so"):
+                abis.add(parts[1])
+            elif (len(parts) == 2 and parts[0] == "META-INF" and v1_signature is None
+                  and parts[1].upper().endswith(V1_SIGNATURE_SUFFIXES)):
+                v1_signature = info.filename
+        details["abis"] = sorted(abis)
+
+        manifest_data = z.read(axml.MANIFEST_ENTRY)
+        v1_der = z.read(v1_signature) if v1_signature else None
+
+    min_sdk = 1  # Absent uses-sdk means API 1
+    for tag, attributes in axml.iter_start_elements(manifest_data):
+        if tag == "manifest":
+            details["split_name"] = attributes.get("split")
+        elif tag == "uses-sdk":
+            min_sdk = _int_or_none(attributes.get("minSdkVersion")) or min_sdk
+            details["target_sdk"] = _int_or_none(attributes.get("targetSdkVersion"))
+        elif tag == "meta-data" and attributes.get("name") == SPLITS_REQUIRED_META:
+            details["requires_splits"] = attributes.get("value") in (True, "true")
+    details["min_sdk"] = min_sdk
+    if details["target_sdk"] is None:
+        details["target_sdk"] = min_sdk
+
+    # Signing certs of every scheme, newest first; they differ only after a key rotation
+    certs = []
+    with open(path, "rb") as f:
+        pairs = read_signing_block(f)
+    for scheme_id, scheme_name in APK_SIGNATURE_SCHEMES:
+        if scheme_id in pairs:
+            details["signature_schemes"].append(scheme_name)
+            certs.extend(signer_certificates(pairs[scheme_id]))
+    if v1_der:
+        details["signature_schemes"].append("v1")
+        certs.extend(pkcs7_certificates(v1_der)[:1])
+    details["signature_schemes"].reverse()
+    details["certificates"] = [describe_certificate(c) for c in dict.fromkeys(certs)]
+    return details
+
+
+def inspect_ipa(path):
+    """Minimum iOS version, required capabilities and a size breakdown of an IPA."""
+    details = {"min_os_version": None, "required_capabilities": [], "device_family": [], "size_breakdown": {}}
+    with zipfile.ZipFile(path) as z:
+        infos = z.infolist()
+        details["size_breakdown"] = size_breakdown(infos)
+        plist_path = None
+        for info in infos:
+            parts = info.filename.split("/")
+            if len(parts) == 3 and parts[0] == "Payload" and parts[1].endswith(".app") and parts[2] == "Info.plist":
+                plist_path = info.filename
+                break
+        if plist_path:
+            with z.open(plist_path) as f:
+                plist = plistlib.load(f)
+            details["min_os_version"] = plist.get("MinimumOSVersion")
+            capabilities = plist.get("UIRequiredDeviceCapabilities") or []
+            # Either a list of names or a {name: required} dict
+            if isinstance(capabilities, dict):
+                capabilities = [k for k, v in capabilities.items() if v]
+            details["required_capabilities"] = list(capabilities)
+            details["device_family"] = list(plist.get("UIDeviceFamily") or [])
+    return details
+
+
+def inspect(path):
+    if path.lower().endswith(".ipa"):
+        return inspect_ipa(path)
+    return inspect_apk(path)
+
+
+def to_store_fields(details):
+    """Flatten inspect() output into MetadataStore columns."""
+    fields = {
+        "min_sdk": details.get("min_sdk"),
+        "target_sdk": details.get("target_sdk"),
+        "abis": ",".join(details.get("abis", [])),
+        "signature_schemes": ",".join(details.get("signature_schemes", [])),
+        "cert_sha256": ",".join(c["sha256"] for c in details.get("certificates", [])),
+        "cert_hashcodes": ",".join(c["hashcode"] for c in details.get("certificates", [])),
+        "split_name": details.get("split_name"),
+        "requires_splits": int(bool(details.get("requires_splits"))),
+        "min_os_version": details.get("min_os_version"),
+        "required_capabilities": ",".join(details.get("required_capabilities", [])),
+        "device_family": ",".join(str(f) for f in details.get("device_family", [])),
+        "size_breakdown": json.dumps(details.get("size_breakdown", {})),
+    }
+    return {k: v for k, v in fields.items() if v is not None}
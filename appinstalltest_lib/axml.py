@@ -0,0 +1,144 @@
+import struct
+import zipfile
+
+# Minimal reader for Android binary XML (AXML), just enough to pull manifest
+# attributes without building a full pyaxmlparser.APK. Layout follows
+# ResourceTypes.h in the Android framework sources.
+
+RES_STRING_POOL_TYPE = 0x0001
+RES_XML_TYPE = 0x0003
+RES_XML_START_ELEMENT_TYPE = 0x0102
+RES_XML_RESOURCE_MAP_TYPE = 0x0180
+UTF8_FLAG = 0x00000100
+
+TYPE_REFERENCE = 0x01
+TYPE_STRING = 0x03
+TYPE_INT_DEC = 0x10
+TYPE_INT_HEX = 0x11
+TYPE_INT_BOOLEAN = 0x12
+
+# android:* attribute resource ids, used when attribute names are obfuscated away
+ATTRIBUTE_IDS = {
+    0x01010003: "name",
+    0x01010024: "value",
+    0x0101021b: "versionCode",
+    0x0101021c: "versionName",
+    0x0101020c: "minSdkVersion",
+    0x01010270: "targetSdkVersion",
+    0x0101055b: "isFeatureSplit",
+}
+
+MANIFEST_ENTRY = "AndroidManifest.xml"
+
+
+class AxmlError(Exception):
+    pass
+
+
+class Reference(int):
+    """An attribute value pointing at a resource (e.g. @string/app_version) that needs resources.arsc."""
+
+
+def _read_string_pool(data, offset):
+    (_, header_size, chunk_size, string_count, _, flags, strings_start, _) = struct.unpack_from("<HHIIIIII", data, offset)
+    offsets = struct.unpack_from(f"<{string_count}I", data, offset + header_size)
+    base = offset + strings_start
+    utf8 = flags & UTF8_FLAG
+    strings = []
+    for string_offset in offsets:
+        pos = base + string_offset
+        if utf8:
+            # utf-16 length then utf-8 length, each 1 or 2 bytes
+            pos += 2 if data[pos] & 0x80 else 1
+            length = data[pos]
+            if length & 0x80:
+                length = ((length & 0x7F) << 8) | data[pos + 1]
+                pos += 2
+            else:
+                pos += 1
+            strings.append(data[pos:pos + length].decode("utf-8", errors="replace"))
+        else:
+            length = struct.unpack_from("<H", data, pos)[0]
+            if length & 0x8000:
+                length = ((length & 0x7FFF) << 16) | struct.unpack_from("<H", data, pos + 2)[0]
+                pos += 4
+            else:
+                pos += 2
+            strings.append(data[pos:pos + length * 2].decode("utf-16-le", errors="replace"))
+    return strings
+
+
+def iter_start_elements(data):
+    """
+    Yield (tag, attributes) for every start element in document order.
+    `attributes` maps attribute names (or the android:* name for known
+    resource ids) to str / int / bool / Reference values.
+    """
+    if len(data) < 8 or struct.unpack_from("<H", data, 0)[0] != RES_XML_TYPE:
+        raise AxmlError("Not a binary XML document")
+    strings = []
+    resource_ids = []
+    offset = struct.unpack_from("<H", data, 2)[0]
+    end = len(data)
+
+    while offset + 8 <= end:
+        chunk_type, header_size, chunk_size = struct.unpack_from("<HHI", data, offset)
+        if chunk_size < 8:
+            raise AxmlError(f"Corrupt chunk at {offset}")
+
+        if chunk_type == RES_STRING_POOL_TYPE:
+            strings = _read_string_pool(data, offset)
+        elif chunk_type == RES_XML_RESOURCE_MAP_TYPE:
+            count = (chunk_size - header_size) // 4
+            resource_ids = struct.unpack_from(f"<{count}I", data, offset + header_size)
+        elif chunk_type == RES_XML_START_ELEMENT_TYPE:
+            ext = offset + header_size
+            _, name_index, attr_start, attr_size, attr_count = struct.unpack_from("<IIHHH", data, ext)
+            attributes = {}
+            for i in range(attr_count):
+                pos = ext + attr_start + i * attr_size
+                _, attr_name, raw_value, _, _, data_type, value = struct.unpack_from("<IIIHBBI", data, pos)
+                name = strings[attr_name] if attr_name < len(strings) else ""
+                if attr_name < len(resource_ids) and resource_ids[attr_name] in ATTRIBUTE_IDS:
+                    name = ATTRIBUTE_IDS[resource_ids[attr_name]]
+                if data_type == TYPE_STRING:
+                    attributes[name] = strings[value]
+                elif data_type == TYPE_INT_BOOLEAN:
+                    attributes[name] = value != 0
+                elif data_type in (TYPE_INT_DEC, TYPE_INT_HEX):
+                    attributes[name] = value
+                elif data_type == TYPE_REFERENCE:
+                    attributes[name] = Reference(value)
+                elif raw_value != 0xFFFFFFFF and raw_value < len(strings):
+                    attributes[name] = strings[raw_value]
+            yield strings[name_index], attributes
+
+        offset += chunk_size
+
+
+def read_manifest(apk_path, stop_at="application"):
+    """
+    Read package, versionCode and versionName from an APK's manifest.
+
+    Only the zip central directory and the AndroidManifest.xml entry are
+    read, and decoding stops at the `stop_at` element. Values that are
+    resource references come back as Reference instances. Returns a dict
+    with the <manifest> attributes plus the elements seen before `stop_at`
+    under "elements".
+    """
+    with zipfile.ZipFile(apk_path) as z:
+        data = z.read(MANIFEST_ENTRY)
+
+    manifest = None
+    elements = []
+    for tag, attributes in iter_start_elements(data):
+        if tag == "manifest":
+            manifest = dict(attributes)
+        elif tag == stop_at:
+            break
+        else:
+            elements.append((tag, attributes))
+    if manifest is None:
+        raise AxmlError("No <manifest> element")
+    manifest["elements"] = elements
+    return manifest
@@ -0,0 +1,105 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from .device_leases import DeviceBusy
+
+
+class BatchRunner:
+    """
+    Runs the upgrade test (install old -> launch -> install new -> verify)
+    for a list of version pairs on many devices at once.
+
+    Each device gets its own worker that walks the pairs in order, so one
+    device failing never affects another. Install steps across all devices
+    share `max_concurrency` slots because USB bandwidth is shared. A device
+    still leased by someone else after `lease_timeout` seconds is reported
+    as "busy" instead of holding a worker forever.
+    """
+
+    def __init__(self, test_runner, max_concurrency=4, max_jobs=100, leases=None, lease_timeout=600):
+        self.test_runner = test_runner
+        self.leases = leases
+        self.lease_timeout = lease_timeout
+        self.max_jobs = max_jobs
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="batch-device")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, serials, pairs):
+        """Start a batch job and return its job_id."""
+        job_id = str(uuid.uuid4())
+        job = {
+            "job_id": job_id,
+            "status": "running",
+            "created_at": time.time(),
+            "finished_at": None,
+            "pairs": pairs,
+            "results": {serial: [] for serial in serials},
+            "pending_devices": len(serials),
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+
+        logger.info(f"Batch job {job_id}: {len(pairs)} pair(s) on {len(serials)} device(s)")
+        for serial in serials:
+            self._executor.submit(self._run_device, job, serial)
+        return job_id
+
+    def get_job(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                return None
+            snapshot = dict(job)
+            snapshot["results"] = {serial: list(r) for serial, r in job["results"].items()}
+        snapshot["summary"] = self._summarize(snapshot["results"])
+        return snapshot
+
+    def list_jobs(self):
+        with self._lock:
+            job_ids = list(self._jobs.keys())
+        return [self.get_job(job_id) for job_id in job_ids]
+
+    def _summarize(self, results):
+        summary = {"passed": 0, "failed": 0, "busy": 0}
+        for device_results in results.values():
+            for r in device_results:
+                if r["status"] == "busy":
+                    summary["busy"] += 1
+                else:
+                    summary["passed" if r["status"] == "success" else "failed"] += 1
+        return summary
+
+    def _run_device(self, job, serial):
+        owner = f"batch:{job['job_id']}"
+        try:
+            if self.leases:
+                # Wait for whoever holds the device (a queued job, a dashboard install) to finish
+                self.leases.acquire(serial, owner, timeout=self.lease_timeout)
+            for pair in job["pairs"]:
+                result = self.test_runner._run_upgrade_sync(serial, pair, self._slots)
+                with self._lock:
+                    job["results"][serial].append(result)
+        except DeviceBusy as e:
+            logger.warning(f"Batch job {job['job_id']}: {e}, skipping the device")
+            with self._lock:
+                job["results"][serial].append({"status": "busy", "message": str(e)})
+        except Exception as e:
+            logger.exception(f"Batch worker for {serial} crashed")
+            with self._lock:
+                job["results"][serial].append({"status": "error", "message": str(e)})
+        finally:
+            if self.leases:
+                self.leases.release(serial, owner)
+            with self._lock:
+                job["pending_devices"] -= 1
+                if job["pending_devices"] == 0:
+                    job["status"] = "finished"
+                    job["finished_at"] = time.time()
+                    logger.info(f"Batch job {job['job_id']} finished")
@@ -0,0 +1,163 @@
+import time
+import threading
+from loguru import logger
+from .metadata_store import version_code_num
+
+
+def _version_tuple(version):
+    parts = []
+    for part in str(version).split("."):
+        try:
+            parts.append(int(part))
+        except ValueError:
+            break
+    # "16.4" and "16.4.0" are the same version
+    while parts and parts[-1] == 0:
+        parts.pop()
+    return tuple(parts)
+
+
+def evaluate(details, device, installed=None):
+    """
+    Compare artifact details (ApkManager.get_details format) with a device
+    entry (registry format). `installed` is the {"version_code", "signatures"}
+    of the package the install would replace, if any.
+
+    Returns a list of {"check", "reason"}; empty means nothing rules the
+    install out. Checks whose data isn't known are skipped, never failed.
+    """
+    problems = []
+
+    def fail(check, reason):
+        problems.append({"check": check, "reason": reason})
+
+    if device.get("platform") == "ios":
+        min_os, os_version = details.get("min_os_version"), device.get("os_version")
+        if min_os and os_version and _version_tuple(os_version) < _version_tuple(min_os):
+            fail("min_os_version", f"Requires iOS {min_os}, device runs {os_version}")
+        return problems
+
+    sdk, min_sdk = device.get("sdk"), details.get("min_sdk")
+    if sdk and min_sdk and min_sdk > sdk:
+        fail("min_sdk", f"minSdkVersion {min_sdk} is above the device API level {sdk}")
+
+    abis, device_abis = details.get("abis"), device.get("abilist")
+    if abis and device_abis and not set(abis) & set(device_abis):
+        fail("abi", f"Native libraries only for {', '.join(abis)}; device supports {', '.join(device_abis)}")
+
+    if details.get("split_name"):
+        fail("split", f"Split APK '{details['split_name']}' can't be installed on its own")
+    elif details.get("requires_splits"):
+        fail("split", "Base APK of an app bundle; it can't be installed without its split APKs")
+
+    if installed:
+        ours, theirs = set(details.get("cert_hashcodes") or []), set(installed.get("signatures") or [])
+        if ours and theirs and not ours & theirs:
+            fail("signature", f"Signed with {', '.join(sorted(ours))} but the installed package is signed with "
+                              f"{', '.join(sorted(theirs))}; install -r would fail")
+        code, installed_code = version_code_num(details.get("version_code")), installed.get("version_code")
+        if code is not None and installed_code is not None and code < installed_code:
+            fail("downgrade", f"versionCode {code} is lower than the installed {installed_code}")
+    return problems
+
+
+class CompatibilityChecker:
+    """
+    Pre-flight check of artifacts against devices, answered from the registry's
+    cached properties and the extracted artifact details, so an install that
+    can't succeed is rejected before any byte goes over USB.
+
+    Installed package info (`dumpsys package`) is cached per (serial, package)
+    for `package_ttl` seconds and dropped by `forget` after installs.
+    """
+
+    def __init__(self, device_registry, device_manager, apk_manager, package_ttl=60.0):
+        self.device_registry = device_registry
+        self.device_manager = device_manager
+        self.apk_manager = apk_manager
+        self.package_ttl = package_ttl
+        self._packages = {}  # (serial, package) -> (fetched_at, info or None)
+        self._lock = threading.Lock()
+
+    def installed_package(self, serial, package_name, device=None, cached_only=False):
+        key = (serial, package_name)
+        with self._lock:
+            entry = self._packages.get(key)
+        if entry and time.time() - entry[0] < self.package_ttl:
+            return entry[1]
+        if cached_only:
+            return None
+        device = device or self.device_manager.get_device(serial)
+        info = self.device_manager.get_installed_package(device, package_name)
+        with self._lock:
+            self._packages[key] = (time.time(), info)
+        return info
+
+    def forget(self, serial, package_name=None):
+        """Drop cached package info after something was installed or removed."""
+        with self._lock:
+            for key in [k for k in self._packages if k[0] == serial and package_name in (None, k[1])]:
+                del self._packages[key]
+
+    def check(self, serial, file_path, replace=False, device=None):
+        """
+        Check one local artifact against one device. With `replace`, the installed
+        package of the same name (if any) is looked up for signature and downgrade checks.
+        """
+        started = time.monotonic()
+        details = self.apk_manager.get_details_for_path(file_path)
+        entry = self.device_registry.get_device(serial) or {}
+        installed = None
+        if replace and entry.get("platform") != "ios" and details.get("package_name") not in (None, "Unknown"):
+            installed = self.installed_package(serial, details["package_name"], device)
+        problems = evaluate(details, entry, installed)
+        return self._verdict(problems, started)
+
+    def check_pair(self, serial, old_path, new_path):
+        """
+        Check an upgrade pair before step 1: both builds against the device,
+        and the new build against the old one it is going to replace.
+        """
+        started = time.monotonic()
+        entry = self.device_registry.get_device(serial) or {}
+        old = self.apk_manager.get_details_for_path(old_path)
+        new = self.apk_manager.get_details_for_path(new_path)
+        problems = [dict(p, build="old") for p in evaluate(old, entry)]
+        as_installed = {"version_code": version_code_num(old.get("version_code")), "signatures": old.get("cert_hashcodes")}
+        problems += [dict(p, build="new") for p in evaluate(new, entry, as_installed)]
+        if old.get("package_name") and new.get("package_name") and old["package_name"] != new["package_name"]:
+            problems.append({"check": "package", "build": "new",
+                             "reason": f"Package name mismatch: {old['package_name']} -> {new['package_name']}"})
+        return self._verdict(problems, started)
+
+    def matrix(self, serials=None, filenames=None):
+        """
+        Compatibility of every (device, artifact) pair of the same platform.
+        Only already-cached installed-package info is used, so no device is queried.
+        """
+        devices = [d for d in self.device_registry.list_devices()
+                   if d.get("state") == "device" and (not serials or d["serial"] in serials)]
+        artifacts = [self.apk_manager.get_details(f) for f in (filenames or sorted(self.apk_manager.store.filenames()))]
+        artifacts = [a for a in artifacts if a]
+
+        results = {}
+        for device in devices:
+            row = results[device["serial"]] = {}
+            for details in artifacts:
+                platform = "ios" if details["filename"].lower().endswith(".ipa") else "android"
+                if platform != device.get("platform"):
+                    continue
+                installed = None
+                if platform == "android" and details.get("package_name"):
+                    installed = self.installed_package(device["serial"], details["package_name"], cached_only=True)
+                problems = evaluate(details, device, installed)
+                row[details["filename"]] = {"compatible": not problems, "problems": problems,
+                                            "inspected": details.get("inspected", False)}
+        return {"devices": [d["serial"] for d in devices], "artifacts": [a["filename"] for a in artifacts],
+                "results": results}
+
+    def _verdict(self, problems, started):
+        elapsed_ms = round((time.monotonic() - started) * 1000, 1)
+        if problems:
+            logger.info(f"Pre-flight rejected ({elapsed_ms} ms): " + "; ".join(p["reason"] for p in problems))
+        return {"compatible": not problems, "problems": problems, "elapsed_ms": elapsed_ms}
@@ -0,0 +1,49 @@
+import threading
+from contextlib import contextmanager
+
+
+class DeviceBusy(Exception):
+    pass
+
+
+class DeviceLeases:
+    """Per-device mutual exclusion shared by every code path that installs to a device."""
+
+    def __init__(self):
+        self._holders = {}  # serial -> owner
+        self._cond = threading.Condition()
+
+    def try_acquire(self, serial, owner):
+        with self._cond:
+            if serial in self._holders:
+                return False
+            self._holders[serial] = owner
+            return True
+
+    def acquire(self, serial, owner, timeout=None):
+        """Block until `serial` is free (or `timeout` passes) and lease it to `owner`."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: serial not in self._holders, timeout=timeout):
+                raise DeviceBusy(f"Device {serial} is busy ({self._holders.get(serial)})")
+            self._holders[serial] = owner
+
+    def release(self, serial, owner):
+        with self._cond:
+            if self._holders.get(serial) == owner:
+                del self._holders[serial]
+                self._cond.notify_all()
+
+    def holder(self, serial):
+        return self._holders.get(serial)
+
+    def snapshot(self):
+        with self._cond:
+            return dict(self._holders)
+
+    @contextmanager
+    def lease(self, serial, owner, timeout=None):
+        self.acquire(serial, owner, timeout)
+        try:
+            yield
+        finally:
+            self.release(serial, owner)
@@ -1,4 +1,8 @@
+import re
+import time
+import threading
 import adbutils
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from loguru import logger
 try:
     import tidevice
@@ -6,129 +10,335 @@ except ImportError:
     tidevice = None
     logger.warning("tidevice not installed, iOS support disabled")
 
+# (command, markers): the state holds if any marker appears in the command output.
+# probe_state runs them all at once and takes the first positive answer.
+SCREEN_ON_CHECKS = [
+    ("dumpsys power", ("mWakefulness=Awake",)),
+    ("dumpsys deviceidle", ("mScreenOn=true",)),
+    ("dumpsys display", ("state=ON",)),
+]
+UNLOCKED_CHECKS = [
+    ("dumpsys window policy", ("mShowingLockscreen=false", "mDreamingLockscreen=false")),
+    ("dumpsys trust", ("mDeviceLocked=false",)),
+    ("dumpsys activity activities", ("mKeyguardShowing=false",)),
+]
+
+# `dumpsys package <pkg>` lines: "versionCode=42 minSdk=21 ..." and either
+# "signatures=PackageSignatures{5c1f3e0 version:2, signatures:[a1b2c3d4], past signatures:[]}" (API 28+)
+# or "signatures=PackageSignatures{41f3a7b0 [41f3e260]}" (older releases)
+PACKAGE_VERSION_RE = re.compile(r"versionCode=(\d+)")
+PACKAGE_SIGNATURES_RE = re.compile(r"signatures=PackageSignatures\{[0-9a-f]+ (?:version:\d+, signatures:)?\[([0-9a-f, ]*)\]")
+
+# One shell round-trip for both states: every dumpsys is filtered on the device,
+# so only the few relevant lines cross USB. Sections are introduced by "#name".
+STATE_PROBE_COMMAND = "; ".join([
+    "echo '#power'", "dumpsys power | grep -E 'mWakefulness='",
+    "echo '#deviceidle'", "dumpsys deviceidle | grep -E 'mScreenOn='",
+    "echo '#display'", "dumpsys display | grep -E 'Display Power: state=|state=ON'",
+    "echo '#window'", "dumpsys window policy | grep -E 'mShowingLockscreen=|mDreamingLockscreen='",
+    "echo '#trust'", "dumpsys trust | grep -E 'mDeviceLocked='",
+    "echo '#activity'", "dumpsys activity activities | grep -E 'mKeyguardShowing='",
+])
+STATE_PROBE_SECTIONS = {
+    "screen_on": {"power": SCREEN_ON_CHECKS[0][1], "deviceidle": SCREEN_ON_CHECKS[1][1], "display": SCREEN_ON_CHECKS[2][1]},
+    "unlocked": {"window": UNLOCKED_CHECKS[0][1], "trust": UNLOCKED_CHECKS[1][1], "activity": UNLOCKED_CHECKS[2][1]},
+}
+
+def parse_state_probe(output):
+    """
+    Parse the output of STATE_PROBE_COMMAND into {"screen_on": ..., "unlocked": ...}.
+    A state is True if any of its markers shows up, False if its sections returned
+    data without a marker, and None if none of them returned anything usable
+    (e.g. grep missing on old devices), in which case the caller should fall back.
+    """
+    sections = {}
+    current = None
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith("#"):
+            current = sections.setdefault(line[1:], [])
+        elif line and current is not None and "not found" not in line:
+            current.append(line)
+
+    result = {}
+    for state, markers_by_section in STATE_PROBE_SECTIONS.items():
+        value = None
+        for section, markers in markers_by_section.items():
+            lines = sections.get(section)
+            if not lines:
+                continue
+            if any(m in line for line in lines for m in markers):
+                value = True
+                break
+            value = False
+        result[state] = value
+    return result
+
 class DeviceManager:
+    def __init__(self, watcher=None, max_workers=16, probe_timeout=5.0, probe_mode="combined"):
+        # Optional DeviceWatcher; when its streams are live, platform and
+        # serial lookups are answered from its map instead of polling.
+        self.watcher = watcher
+        self.probe_timeout = probe_timeout
+        # "combined": one filtered shell command, falling back per state to
+        # "legacy": the full dumpsys commands, all in flight at once.
+        self.probe_mode = probe_mode
+        self._combined_unsupported = set()  # serials whose shell can't run the combined probe's filters
+        # Device-level tasks wait on command-level tasks, so they need separate
+        # pools to avoid starving each other.
+        self._device_pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="device-probe")
+        self._command_pool = ThreadPoolExecutor(max_workers=max_workers * 2, thread_name_prefix="probe-cmd")
+        # serial -> {future: timed out} of probe commands still running on the command
+        # pool. A device with one that already timed out gets no new ones until it
+        # returns, so a hung device can't fill the pool up.
+        self._running_probes = {}
+        self._running_lock = threading.Lock()
+
     def list_devices(self):
         """List all connected devices with their status."""
         devices = []
         
-        # Android Devices
+        # Android Devices, probed concurrently so one hung device can't stall the listing
         try:
-            for d in adbutils.adb.device_list():
-                model = d.prop.get("ro.product.model", "Unknown")
-                product = d.prop.get("ro.product.name", "Unknown")
-                device_name = d.prop.get("ro.product.device", "Unknown")
-                
-                info = {
-                    "serial": d.serial,
-                    "state": d.get_state(),
-                    "model": model,
-                    "product": product,
-                    "device": device_name,
-                    "screen_on": self.is_screen_on(d),
-                    "unlocked": self.is_unlocked(d),
-                    "platform": "android"
-                }
+            results = self.fan_out(self._describe_android, adbutils.adb.device_list(), self.probe_timeout * 2)
+            for d, info, error in results:
+                if error is not None:
+                    logger.warning(f"Probing {d.serial} failed: {error!r}")
+                    info = {"serial": d.serial, "model": "Unknown", "product": "Unknown", "device": "Unknown",
+                            "state": "timeout" if isinstance(error, TimeoutError) else "unknown",
+                            "screen_on": False, "unlocked": False, "platform": "android"}
                 devices.append(info)
         except Exception as e:
             logger.error(f"Error listing Android devices: {e}")
 
         # iOS Devices
+        devices.extend(self.list_ios_devices())
+
+        return devices
+
+    def _describe_android(self, d):
+        info = {"serial": d.serial}
+        info.update(self.get_android_properties(d))
+        info.update(self.get_android_state(d))
+        info["platform"] = "android"
+        return info
+
+    def fan_out(self, func, items, timeout):
+        """
+        Run `func(item)` for all items on the device pool.
+        Returns a list of (item, result, error); items still running after
+        `timeout` seconds get a TimeoutError and are left to finish in the background.
+        """
+        items = list(items)
+        futures = [self._device_pool.submit(func, item) for item in items]
+        wait(futures, timeout=timeout)
+        results = []
+        for item, future in zip(items, futures):
+            if not future.done():
+                results.append((item, None, TimeoutError(f"probe exceeded {timeout}s")))
+            elif future.exception() is not None:
+                results.append((item, None, future.exception()))
+            else:
+                results.append((item, future.result(), None))
+        return results
+
+    def get_android_properties(self, d):
+        """Read the static build properties of an Android device."""
+        abilist = d.prop.get("ro.product.cpu.abilist") or d.prop.get("ro.product.cpu.abi") or ""
+        return {
+            "model": d.prop.get("ro.product.model", "Unknown"),
+            "product": d.prop.get("ro.product.name", "Unknown"),
+            "device": d.prop.get("ro.product.device", "Unknown"),
+            "abilist": [abi for abi in abilist.split(",") if abi],
+            "sdk": int(d.prop.get("ro.build.version.sdk") or 0) or None,
+        }
+
+    def get_installed_package(self, d, package_name):
+        """
+        Return {"version_code", "signatures"} of an installed package, or None if it isn't installed.
+        Signatures are the hex Signature.hashCode() values `dumpsys package` prints.
+        """
+        output = d.shell(f"dumpsys package {package_name}")
+        signatures = PACKAGE_SIGNATURES_RE.search(output)
+        version = PACKAGE_VERSION_RE.search(output)
+        if not signatures and not version:
+            return None
+        return {
+            "version_code": int(version.group(1)) if version else None,
+            "signatures": [s.strip() for s in signatures.group(1).split(",") if s.strip()] if signatures else [],
+        }
+
+    def get_android_state(self, d):
+        """Read the volatile state (connection, screen, lock) of an Android device."""
+        info = {"state": d.get_state()}
+        info.update(self.probe_state(d))
+        return info
+
+    def probe_state(self, device):
+        """
+        Check screen and lock state with all fallback commands in flight at once.
+        A probe that doesn't answer within probe_timeout counts as not ready.
+        """
+        result = {"screen_on": None, "unlocked": None}
+        if self.probe_mode == "combined" and device.serial not in self._combined_unsupported:
+            result = self.probe_state_combined(device)
+
+        unknown = [state for state, value in result.items() if value is None]
+        if unknown and self._probe_hung(device.serial):
+            logger.warning(f"Earlier state probes still hang on {device.serial}, not starting more")
+            result.update({state: False for state in unknown})
+            return result
+
+        deadline = time.monotonic() + self.probe_timeout
+        pending = {}
+        if result["screen_on"] is None:
+            pending["screen_on"] = self._submit_checks(device, SCREEN_ON_CHECKS)
+        if result["unlocked"] is None:
+            pending["unlocked"] = self._submit_checks(device, UNLOCKED_CHECKS)
+        for state, futures in pending.items():
+            result[state] = self._first_match(device, futures, deadline)
+        return result
+
+    def probe_state_combined(self, device):
+        """
+        Read screen and lock state with a single device-side filtered shell command.
+        A device whose shell ran it without usable output (no grep) isn't asked again;
+        a failed call (timeout, adb hiccup) only sends this one probe to the fallbacks.
+        """
+        try:
+            output = device.shell(STATE_PROBE_COMMAND, timeout=self.probe_timeout)
+        except Exception as e:
+            logger.warning(f"Combined state probe failed on {device.serial}: {e}")
+            return {"screen_on": None, "unlocked": None}
+        result = parse_state_probe(output)
+        # The section markers are plain echos: if they came back, the command ran
+        if result["screen_on"] is None and result["unlocked"] is None and "#power" in output:
+            logger.info(f"Combined state probe unsupported on {device.serial}, using dumpsys fallbacks")
+            self._combined_unsupported.add(device.serial)
+        return result
+
+    def _submit_checks(self, device, checks):
+        def run(command, markers):
+            output = device.shell(command, timeout=self.probe_timeout)
+            return any(m in output for m in markers)
+
+        futures = {self._command_pool.submit(run, command, markers) for command, markers in checks}
+        with self._running_lock:
+            self._running_probes.setdefault(device.serial, {}).update(dict.fromkeys(futures, False))
+        for future in futures:
+            future.add_done_callback(lambda f, serial=device.serial: self._probe_finished(serial, f))
+        return futures
+
+    def _probe_finished(self, serial, future):
+        with self._running_lock:
+            running = self._running_probes.get(serial)
+            if running is not None:
+                running.pop(future, None)
+                if not running:
+                    del self._running_probes[serial]
+
+    def _probe_hung(self, serial):
+        """True if a probe command of `serial` timed out and is still running."""
+        with self._running_lock:
+            return any(self._running_probes.get(serial, {}).values())
+
+    def _first_match(self, device, pending, deadline):
+        total = len(pending)
+        errors = 0
+        while pending:
+            done, pending = wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                logger.warning(f"State probe timed out on {device.serial}")
+                with self._running_lock:
+                    running = self._running_probes.get(device.serial, {})
+                    running.update((future, True) for future in pending if future in running)
+                return False
+            for future in done:
+                if future.exception() is not None:
+                    errors += 1
+                elif future.result():
+                    # Remaining fallbacks are moot; let them finish on their own
+                    return True
+        if errors == total:
+            logger.error(f"Error checking state of {device.serial}: all probes failed")
+            # Lenient: a device we can't read at all shouldn't block installs
+            return True
+        return False
+
+    def list_ios_devices(self, property_cache=None):
+        """List connected iOS devices, reusing properties from `property_cache` if given."""
+        devices = []
         if tidevice:
             try:
-                t = tidevice.Usbmux()
-                for d in t.device_list():
-                    # d is DeviceInfo(udid='...', name='...', ...)
-                    # We need to get more info if possible, but basic list is fine
-                    # tidevice doesn't give much info in device_list() other than udid and connection type
-                    # We can try to get device name
-                    try:
-                        dev = tidevice.Device(d.udid)
-                        name = dev.name
-                        model = dev.get_value(key="ProductType") # e.g. iPhone10,3
-                        # Check if locked? tidevice doesn't easily give lock state without pairing/lockdown
-                        # We'll assume ready for now or add basic check
-                    except:
-                        name = "iOS Device"
-                        model = "Unknown"
-
-                    info = {
-                        "serial": d.udid,
+                for udid in self.list_ios_udids():
+                    if property_cache is not None and udid in property_cache:
+                        props = property_cache[udid]
+                    else:
+                        props = self.get_ios_properties(udid)
+                        if property_cache is not None:
+                            property_cache[udid] = props
+
+                    info = {"serial": udid}
+                    info.update(props)
+                    info.update({
                         "state": "device", # Assume device if listed
-                        "model": name, # Use name as model for display
-                        "product": model,
-                        "device": "iPhone",
                         "screen_on": True, # Hard to detect without more permissions
                         "unlocked": True, # Hard to detect
                         "platform": "ios"
-                    }
+                    })
                     devices.append(info)
             except Exception as e:
                 logger.error(f"Error listing iOS devices: {e}")
-
         return devices
 
+    def list_android_serials(self):
+        """Return a list of (serial, state) for connected Android devices."""
+        if self.watcher and self.watcher.android_ready:
+            return self.watcher.android_devices()
+        return [(info.serial, info.state) for info in adbutils.adb.list()]
+
+    def list_ios_udids(self):
+        """Return the udids of connected iOS devices."""
+        if self.watcher and self.watcher.ios_ready:
+            return self.watcher.ios_devices()
+        return [d.udid for d in tidevice.Usbmux().device_list()]
+
+    def get_ios_properties(self, udid):
+        """Read the static properties of an iOS device."""
+        # tidevice doesn't give much info in device_list() other than udid and connection type
+        # We can try to get device name
+        try:
+            dev = tidevice.Device(udid)
+            name = dev.name
+            model = dev.get_value(key="ProductType") # e.g. iPhone10,3
+            os_version = dev.get_value(key="ProductVersion") # e.g. 16.4.1
+            # Check if locked? tidevice doesn't easily give lock state without pairing/lockdown
+            # We'll assume ready for now or add basic check
+        except:
+            name = "iOS Device"
+            model = "Unknown"
+            os_version = None
+
+        return {
+            "model": name, # Use name as model for display
+            "product": model,
+            "device": "iPhone",
+            "os_version": os_version,
+        }
+
     def get_device(self, serial):
         """Get a specific device by serial."""
         return adbutils.adb.device(serial=serial)
 
-    def is_screen_on(self, device):
-        """Check if the device screen is on."""
-        try:
-            # Method 1: dumpsys power (mWakefulness=Awake)
-            output = device.shell("dumpsys power")
-            if "mWakefulness=Awake" in output:
-                return True
-            
-            # Method 2: dumpsys deviceidle (mScreenOn=true)
-            output2 = device.shell("dumpsys deviceidle")
-            if "mScreenOn=true" in output2:
-                return True
-
-            # Method 3: dumpsys display (Display Power: state=ON)
-            output3 = device.shell("dumpsys display")
-            if "state=ON" in output3:
-                return True
-
-            logger.debug(f"Screen check failed for {device.serial}. Power output len: {len(output)}")
-            return False
-        except Exception as e:
-            logger.error(f"Error checking screen state: {e}")
-            # Fallback to True to avoid blocking if check fails
-            return True
-
-    def is_unlocked(self, device):
-        """Check if the device is unlocked."""
-        try:
-            # Method 1: dumpsys window (mShowingLockscreen=false)
-            output = device.shell("dumpsys window policy")
-            if "mShowingLockscreen=false" in output:
-                return True
-            
-            # Method 2: Check mDreamingLockscreen=false
-            if "mDreamingLockscreen=false" in output:
-                return True
-
-            # Method 3: dumpsys trust (mDeviceLocked=false) - Android 6+
-            output_trust = device.shell("dumpsys trust")
-            if "mDeviceLocked=false" in output_trust:
-                return True
-
-            # Method 4: Check if keyguard is showing via dumpsys activity
-            # mKeyguardShowing=false
-            output_activity = device.shell("dumpsys activity activities")
-            if "mKeyguardShowing=false" in output_activity:
-                return True
-
-            logger.debug(f"Lock check failed for {device.serial}. Window policy output len: {len(output)}")
-            # If we can't determine, but screen is on, maybe we should be lenient?
-            # But user wants to ensure it's usable.
-            # Let's try one more: input_method mInteractive=true usually implies unlocked/usable
-            return False
-        except Exception as e:
-            logger.error(f"Error checking lock state: {e}")
-            return True # Fallback to True
     def get_platform(self, serial):
         """Determine platform of the device."""
+        if self.watcher:
+            platform = self.watcher.get_platform(serial)
+            if platform:
+                return platform
+            if self.watcher.android_ready and (self.watcher.ios_ready or not tidevice):
+                return "unknown"
+
         # Check Android
         try:
             for d in adbutils.adb.device_list():
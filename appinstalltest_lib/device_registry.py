@@ -0,0 +1,204 @@
+import threading
+import time
+from loguru import logger
+
+
+class DeviceRegistry:
+    """
+    In-memory device inventory maintained by a background thread.
+
+    Static properties (model, product, ...) are read once per serial and cached.
+    Volatile state (screen/lock) is refreshed every `state_interval` seconds, so
+    `list_devices` answers from memory without touching any device.
+    """
+
+    def __init__(self, device_manager, poll_interval=2.0, state_interval=10.0, watcher=None, events=None):
+        self.device_manager = device_manager
+        self.poll_interval = poll_interval
+        self.state_interval = state_interval
+        self._properties = {}  # serial -> cached static properties
+        self._entries = {}     # serial -> last known device info
+        self._snapshot = []
+        self._in_flight = set()  # serials whose refresh is still running
+        # Serials that went away; a probe of one still running must not store it back
+        self._removed = set()
+        self._lock = threading.Lock()  # guards every dict and set above
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._thread = None
+        # Optional EventBus; connects, disconnects and state changes are pushed as "device" events
+        self.events = events
+        if watcher:
+            watcher.subscribe(self._on_device_event)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="device-registry", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def list_devices(self):
+        """Return the cached device list with a staleness value per entry."""
+        now = time.time()
+        with self._lock:
+            snapshot = self._snapshot
+        return [dict(e, stale_seconds=round(now - e["updated_at"], 1)) for e in snapshot]
+
+    def get_device(self, serial):
+        """Return the cached entry of `serial` (properties and state), or None if unknown."""
+        with self._lock:
+            entry = self._entries.get(serial)
+            return dict(entry) if entry else None
+
+    def get_properties(self, serial):
+        """Return cached static properties of a device, or None if unknown."""
+        with self._lock:
+            return self._properties.get(serial)
+
+    def invalidate(self, serial):
+        """Force a state refresh of `serial` on the next cycle."""
+        with self._lock:
+            entry = self._entries.get(serial)
+            if entry:
+                entry["updated_at"] = 0
+
+    def _publish(self, event, serial, **data):
+        if self.events:
+            self.events.publish("device", {"event": event, "serial": serial, **data})
+
+    def _on_device_event(self, event, serial, platform):
+        self._publish(event, serial, platform=platform)
+        with self._lock:
+            if event == "disconnected":
+                self._entries.pop(serial, None)
+                self._properties.pop(serial, None)
+                self._removed.add(serial)
+                self._snapshot = list(self._entries.values())
+            else:
+                self._removed.discard(serial)
+        # Pick up new devices (and state changes) right away instead of on the next tick
+        self._wake_event.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake_event.clear()
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Device registry refresh failed: {e}")
+            self._wake_event.wait(self.poll_interval)
+
+    def refresh(self):
+        """Sync the inventory with connected devices and refresh due states."""
+        now = time.time()
+        seen = set()
+
+        try:
+            due = []
+            serials = self.device_manager.list_android_serials()
+            with self._lock:
+                for serial, adb_state in serials:
+                    seen.add(serial)
+                    self._removed.discard(serial)
+                    if serial not in self._in_flight and self._is_due(serial, adb_state, now):
+                        self._in_flight.add(serial)
+                        due.append((serial, adb_state))
+            # Probe all due devices at once; a hung one is left running and skipped next cycle
+            results = self.device_manager.fan_out(self._refresh_android, due, self.device_manager.probe_timeout * 2)
+            for (serial, _), _, error in results:
+                if error is not None:
+                    logger.warning(f"Refreshing {serial} failed: {error!r}")
+        except Exception as e:
+            logger.error(f"Error listing Android devices: {e}")
+
+        # iOS state is not probed, so only the property lookup is worth caching
+        with self._lock:
+            property_cache = dict(self._properties)
+        ios_devices = self.device_manager.list_ios_devices(property_cache)
+        with self._lock:
+            for info in ios_devices:
+                seen.add(info["serial"])
+                self._removed.discard(info["serial"])
+                if info["serial"] in property_cache:
+                    self._properties[info["serial"]] = property_cache[info["serial"]]
+        for info in ios_devices:
+            self._store(info["serial"], info)
+
+        gone = []
+        with self._lock:
+            for serial in list(self._entries.keys()):
+                if serial not in seen:
+                    logger.info(f"Device {serial} disconnected")
+                    gone.append(self._entries.pop(serial))
+                    self._properties.pop(serial, None)
+                    self._removed.add(serial)
+            self._snapshot = list(self._entries.values())
+        for entry in gone:
+            self._publish("disconnected", entry["serial"], platform=entry.get("platform"))
+
+    def _is_due(self, serial, adb_state, now):
+        # Called with the lock held
+        entry = self._entries.get(serial)
+        return not entry or entry["state"] != adb_state or now - entry["updated_at"] >= self.state_interval
+
+    def _refresh_android(self, item):
+        serial, adb_state = item
+        try:
+            self._probe_android(serial, adb_state)
+        finally:
+            with self._lock:
+                self._in_flight.discard(serial)
+
+    def _probe_android(self, serial, adb_state):
+        unknown = {"model": "Unknown", "product": "Unknown", "device": "Unknown"}
+        if adb_state != "device":
+            # offline / unauthorized devices can't be probed
+            info = {"serial": serial}
+            info.update(self.get_properties(serial) or unknown)
+            info.update({"state": adb_state, "screen_on": False, "unlocked": False, "platform": "android"})
+            self._store(serial, info)
+            return
+
+        d = self.device_manager.get_device(serial)
+        props = self.get_properties(serial)
+        if props is None:
+            try:
+                props = self.device_manager.get_android_properties(d)
+                with self._lock:
+                    if serial not in self._removed:
+                        self._properties[serial] = props
+            except Exception as e:
+                logger.error(f"Error reading properties of {serial}: {e}")
+                props = unknown
+
+        try:
+            state = self.device_manager.get_android_state(d)
+        except Exception as e:
+            logger.error(f"Error reading state of {serial}: {e}")
+            state = {"state": "unknown", "screen_on": False, "unlocked": False}
+
+        info = {"serial": serial}
+        info.update(props)
+        info.update(state)
+        info["platform"] = "android"
+        self._store(serial, info)
+
+    def _store(self, serial, info):
+        info["updated_at"] = time.time()
+        with self._lock:
+            if serial in self._removed:
+                return  # Disconnected while it was being probed
+            previous = self._entries.get(serial)
+            self._entries[serial] = info
+            self._snapshot = list(self._entries.values())
+        if not previous or any(previous.get(k) != info.get(k) for k in ("state", "screen_on", "unlocked")):
+            self._publish("updated", serial, platform=info.get("platform"), state=info.get("state"),
+                          screen_on=info.get("screen_on"), unlocked=info.get("unlocked"))
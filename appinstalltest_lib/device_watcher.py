@@ -0,0 +1,160 @@
+import socket
+import threading
+from loguru import logger
+from . import adb_protocol
+try:
+    import tidevice
+except ImportError:
+    tidevice = None
+
+
+class DeviceWatcher:
+    """
+    Tracks device hotplug events instead of polling device lists.
+
+    Android devices are followed through the adb server's `host:track-devices`
+    stream, iOS devices through the usbmux listen channel. Subscribers are
+    called as `callback(event, serial, platform)` where event is
+    "connected", "disconnected" or, for an adb state change such as
+    unauthorized -> device, "changed".
+    """
+
+    def __init__(self, adb_host=adb_protocol.DEFAULT_HOST, adb_port=adb_protocol.DEFAULT_PORT, reconnect_interval=2.0):
+        self.adb_host = adb_host
+        self.adb_port = adb_port
+        self.reconnect_interval = reconnect_interval
+        self.android_ready = False
+        self.ios_ready = False
+        self._android = {}      # serial -> adb state
+        self._ios = {}          # usbmux DeviceID -> udid
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._adb_sock = None
+        self._threads = []
+
+    def subscribe(self, callback):
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop_event.clear()
+        self._threads = [threading.Thread(target=self._track_android, name="adb-track-devices", daemon=True)]
+        if tidevice and hasattr(tidevice.Usbmux, "watch_device"):
+            self._threads.append(threading.Thread(target=self._track_ios, name="usbmux-listen", daemon=True))
+        for t in self._threads:
+            t.start()
+
+    def stop(self):
+        self._stop_event.set()
+        sock = self._adb_sock
+        if sock:
+            try:
+                # close() alone doesn't wake a thread blocked in recv()
+                sock.shutdown(socket.SHUT_RDWR)
+                sock.close()
+            except OSError:
+                pass
+        for t in self._threads:
+            t.join(timeout=1)
+        self._threads = []
+
+    def get_platform(self, serial):
+        """Return "android"/"ios" for a tracked serial, or None if not tracked."""
+        if serial in self._android:
+            return "android"
+        if serial in self._ios.values():
+            return "ios"
+        return None
+
+    def android_devices(self):
+        """Return a list of (serial, state) for tracked Android devices."""
+        return list(self._android.items())
+
+    def ios_devices(self):
+        """Return the udids of tracked iOS devices."""
+        return sorted(set(self._ios.values()))
+
+    def _notify(self, event, serial, platform):
+        logger.info(f"Device {event}: {serial} ({platform})")
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(event, serial, platform)
+            except Exception as e:
+                logger.error(f"Device watcher subscriber failed: {e}")
+
+    def _apply_android(self, devices):
+        previous = self._android
+        self._android = devices
+        for serial in previous:
+            if serial not in devices:
+                self._notify("disconnected", serial, "android")
+        for serial, state in devices.items():
+            if serial not in previous:
+                self._notify("connected", serial, "android")
+            elif previous[serial] != state:
+                self._notify("changed", serial, "android")
+
+    def _track_android(self):
+        while not self._stop_event.is_set():
+            try:
+                sock = adb_protocol.connect(self.adb_host, self.adb_port)
+                self._adb_sock = sock
+                try:
+                    adb_protocol.send_request(sock, "host:track-devices")
+                    while not self._stop_event.is_set():
+                        payload = adb_protocol.read_hex_block(sock)
+                        self._apply_android(adb_protocol.parse_device_list(payload))
+                        # The first message is the full current list
+                        self.android_ready = True
+                finally:
+                    self._adb_sock = None
+                    sock.close()
+            except Exception as e:
+                if not self._stop_event.is_set():
+                    logger.warning(f"adb track-devices stream lost: {e}")
+            # The server is gone, so nothing we tracked can be trusted any more
+            self.android_ready = False
+            self._apply_android({})
+            self._stop_event.wait(self.reconnect_interval)
+
+    def _apply_ios(self, message):
+        device_id = message.get("DeviceID")
+        if message.get("MessageType") == "Attached":
+            udid = (message.get("Properties") or {}).get("SerialNumber")
+            if not udid:
+                return
+            known = udid in self._ios.values()
+            self._ios[device_id] = udid
+            if not known:
+                self._notify("connected", udid, "ios")
+        elif message.get("MessageType") == "Detached":
+            udid = self._ios.pop(device_id, None)
+            # The same device can be attached over USB and network at once
+            if udid and udid not in self._ios.values():
+                self._notify("disconnected", udid, "ios")
+
+    def _track_ios(self):
+        while not self._stop_event.is_set():
+            try:
+                for message in tidevice.Usbmux().watch_device():
+                    self.ios_ready = True
+                    if self._stop_event.is_set():
+                        break
+                    self._apply_ios(message)
+            except Exception as e:
+                if not self._stop_event.is_set():
+                    logger.warning(f"usbmux listen channel lost: {e}")
+            self.ios_ready = False
+            for device_id in list(self._ios.keys()):
+                self._apply_ios({"DeviceID": device_id, "MessageType": "Detached"})
+            self._stop_event.wait(self.reconnect_interval)
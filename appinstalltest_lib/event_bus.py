@@ -0,0 +1,85 @@
+import json
+import asyncio
+import itertools
+import threading
+
+TOPICS = ("progress", "install", "device", "artifacts", "log")
+
+
+class EventBus:
+    """
+    Fans server-side events out to Server-Sent Events clients.
+
+    `publish` may be called from any thread and never blocks: each client has
+    a bounded queue on the event loop serving it, and a client that falls
+    behind loses its oldest events rather than slowing the publisher down.
+    """
+
+    def __init__(self, queue_size=1000, keepalive=15.0, retry_ms=3000):
+        self.queue_size = queue_size
+        self.keepalive = keepalive
+        self.retry_ms = retry_ms
+        self._subscribers = {}  # id -> (loop, queue, topics or None for all)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def publish(self, topic, data):
+        with self._lock:
+            targets = [(loop, queue) for loop, queue, topics in self._subscribers.values()
+                       if topics is None or topic in topics]
+        if not targets:
+            return
+        event = (topic, json.dumps(data, ensure_ascii=False, default=str))
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, event)
+            except RuntimeError:
+                pass  # The client's loop is already closed
+
+    def close(self):
+        """End every open stream, e.g. on shutdown."""
+        with self._lock:
+            targets = [(loop, queue) for loop, queue, _ in self._subscribers.values()]
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, None)
+            except RuntimeError:
+                pass
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    @staticmethod
+    def _offer(queue, event):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+    async def stream(self, topics=None):
+        """SSE-formatted chunks for one client, subscribed to `topics` (all if empty)."""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        sub_id = next(self._ids)
+        with self._lock:
+            self._subscribers[sub_id] = (asyncio.get_running_loop(), queue, set(topics) if topics else None)
+        try:
+            yield f"retry: {self.retry_ms}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=self.keepalive)
+                except asyncio.TimeoutError:
+                    # Comment line: keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    return
+                topic, data = event
+                yield f"event: {topic}\ndata: {data}\n\n"
+        finally:
+            with self._lock:
+                self._subscribers.pop(sub_id, None)
+
+    def log_sink(self, message):
+        """loguru sink mirroring log records to the "log" topic."""
+        record = message.record
+        self.publish("log", {"time": record["time"].timestamp(), "level": record["level"].name,
+                             "message": record["message"]})
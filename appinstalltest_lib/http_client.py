@@ -0,0 +1,68 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_TIMEOUT = (10, 60)  # (connect, read) seconds
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class _Session(requests.Session):
+    """requests.Session with a default timeout, since requests has none."""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.default_timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.default_timeout)
+        return super().request(method, url, **kwargs)
+
+    def close(self):
+        # The adapters (and their pools) are shared with every other session; leave them open
+        pass
+
+
+class HttpClient:
+    """
+    Shared outbound HTTP layer.
+
+    One HTTPAdapter (a keep-alive pool per host, retries with backoff
+    on connection errors and 5xx) is mounted into every session
+    handed out, so TLS handshakes to Pgyer and its CDN are paid once per
+    connection rather than per request. Each task still gets its own
+    session and so its own cookies.
+
+    HTTP/2 isn't offered: requests/urllib3 only speak HTTP/1.1, and the
+    pooled keep-alive connections already avoid repeated handshakes.
+    """
+
+    def __init__(self, pool_connections=16, pool_maxsize=32, timeout=DEFAULT_TIMEOUT, retries=3, backoff_factor=0.5):
+        self.timeout = timeout
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset({"GET", "HEAD"}),
+            raise_on_status=False,
+            respect_retry_after_header=True,
+        )
+        self._adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+
+    def session(self, headers=None):
+        """A new session (own cookies and headers) on the shared connection pools."""
+        session = _Session(self.timeout)
+        session.mount("https://", self._adapter)
+        session.mount("http://", self._adapter)
+        if headers:
+            session.headers.update(headers)
+        return session
+
+    def get(self, url, **kwargs):
+        """One-off GET on the shared pools."""
+        return self.session().get(url, **kwargs)
+
+
+default_client = HttpClient()
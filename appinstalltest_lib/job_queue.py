@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from adbutils.errors import AdbConnectionError, AdbTimeout
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+
+JOB_KINDS = ("install_old", "install_new", "upgrade")
+
+# Failures worth retrying: the device or the adb connection went away briefly.
+# Matched on the exception type TestRunner reports as "error_type"...
+TRANSIENT_ERROR_TYPES = {cls.__name__ for cls in (
+    AdbTimeout,
+    AdbConnectionError,
+    ConnectionResetError,
+    ConnectionRefusedError,
+    ConnectionAbortedError,
+    BrokenPipeError,
+    TimeoutError,
+)}
+# ...and, for plain AdbErrors, on what the adb server said
+TRANSIENT_ADB_MESSAGES = (
+    "device offline",
+    "device '",  # device 'xxx' not found
+    "no devices/emulators found",
+    "connection closed",
+    "connection is closed",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    serial TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    not_before REAL NOT NULL DEFAULT 0,
+    result TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, priority DESC, created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_serial ON jobs (serial, status);
+"""
+
+
+def is_transient(result):
+    if result.get("status") != "error":
+        return False
+    error_type = result.get("error_type")
+    if error_type in TRANSIENT_ERROR_TYPES:
+        return True
+    message = str(result.get("message", "")).lower()
+    return error_type == "AdbError" and any(marker in message for marker in TRANSIENT_ADB_MESSAGES)
+
+
+class JobQueue:
+    """
+    Persistent queue of install jobs backed by a local SQLite file.
+
+    A dispatcher thread hands the highest-priority queued job to a worker
+    once its device lease is free, so a device never runs two installs at
+    once. Jobs failing with a transient adb error are requeued with
+    backoff, and jobs that were running when the process died are queued
+    again on start.
+    """
+
+    def __init__(self, db_path, test_runner, leases, workers=4, max_attempts=3, retry_delay=5.0):
+        self.db_path = db_path
+        self.test_runner = test_runner
+        self.leases = leases
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(SCHEMA)
+        self._db_lock = threading.Lock()
+        self._wake = threading.Condition()
+        self._running = 0
+        self._stop_event = threading.Event()
+        self._executor = None
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        recovered = self._execute("UPDATE jobs SET status = 'queued', updated_at = ? WHERE status = 'running'",
+                                  (time.time(),)).rowcount
+        if recovered:
+            logger.info(f"Requeued {recovered} job(s) interrupted by the last shutdown")
+        self._stop_event.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job-worker")
+        self._thread = threading.Thread(target=self._dispatch_loop, name="job-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._notify()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def submit(self, kind, serial, payload, priority=0, max_attempts=None):
+        """Queue a job and return its id."""
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, kind, serial, payload, priority, status, max_attempts, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+            (job_id, kind, serial, json.dumps(payload), int(priority), max_attempts or self.max_attempts, now, now))
+        logger.info(f"Queued {kind} job {job_id} on {serial} (priority {priority})")
+        self._notify()
+        return job_id
+
+    def get(self, job_id):
+        rows = self._query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return self._to_dict(rows[0]) if rows else None
+
+    def list(self, status=None, serial=None, limit=100):
+        sql = "SELECT * FROM jobs"
+        clauses, params = [], []
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if serial:
+            clauses.append("serial = ?")
+            params.append(serial)
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY created_at DESC LIMIT ?"
+        params.append(int(limit))
+        return [self._to_dict(r) for r in self._query(sql, params)]
+
+    def cancel(self, job_id):
+        """Cancel a job that hasn't started yet."""
+        cur = self._execute("UPDATE jobs SET status = 'cancelled', updated_at = ? WHERE id = ? AND status = 'queued'",
+                            (time.time(), job_id))
+        return cur.rowcount > 0
+
+    def stats(self):
+        rows = self._query("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")
+        return {r["status"]: r["n"] for r in rows}
+
+    def _execute(self, sql, params=()):
+        with self._db_lock:
+            cur = self._db.execute(sql, params)
+            self._db.commit()
+            return cur
+
+    def _query(self, sql, params=()):
+        with self._db_lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def _to_dict(self, row):
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def _notify(self):
+        with self._wake:
+            self._wake.notify_all()
+
+    def _dispatch_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                self._dispatch()
+            except Exception as e:
+                logger.error(f"Job dispatch failed: {e}")
+            with self._wake:
+                # Also re-check periodically: leases can be freed by other users and backoffs expire
+                self._wake.wait(timeout=1.0)
+
+    def _dispatch(self):
+        if self._running >= self.workers:
+            return
+        now = time.time()
+        candidates = self._query(
+            "SELECT * FROM jobs WHERE status = 'queued' AND not_before <= ? ORDER BY priority DESC, created_at",
+            (now,))
+        for row in candidates:
+            if self._running >= self.workers:
+                break
+            owner = f"job:{row['id']}"
+            if not self.leases.try_acquire(row["serial"], owner):
+                continue
+            claimed = self._execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ? "
+                "WHERE id = ? AND status = 'queued'", (now, row["id"])).rowcount
+            if not claimed:
+                # Cancelled between the select and now
+                self.leases.release(row["serial"], owner)
+                continue
+            with self._wake:
+                self._running += 1
+            self._executor.submit(self._run_job, self._to_dict(row), owner)
+
+    def _run_job(self, job, owner):
+        attempt = job["attempts"] + 1
+        logger.info(f"Running {job['kind']} job {job['id']} on {job['serial']} (attempt {attempt})")
+        try:
+            result = self._execute_job(job)
+        except Exception as e:
+            logger.exception(f"Job {job['id']} crashed")
+            result = {"status": "error", "message": str(e), "error_type": type(e).__name__}
+        finally:
+            self.leases.release(job["serial"], owner)
+
+        now = time.time()
+        if is_transient(result) and attempt < job["max_attempts"]:
+            delay = self.retry_delay * (2 ** (attempt - 1))
+            logger.warning(f"Job {job['id']} hit a transient error, retrying in {delay:.0f}s: {result.get('message')}")
+            self._execute("UPDATE jobs SET status = 'queued', not_before = ?, result = ?, updated_at = ? WHERE id = ?",
+                          (now + delay, json.dumps(result), now, job["id"]))
+        else:
+            status = "succeeded" if result.get("status") == "success" else "failed"
+            self._execute("UPDATE jobs SET status = ?, result = ?, updated_at = ? WHERE id = ?",
+                          (status, json.dumps(result), now, job["id"]))
+            logger.info(f"Job {job['id']} {status}")
+
+        with self._wake:
+            self._running -= 1
+            self._wake.notify_all()
+
+    def _execute_job(self, job):
+        p = job["payload"]
+        serial = job["serial"]
+        if job["kind"] == "install_old":
+            return self.test_runner._install_old_sync(serial, p.get("old_apk_name"), p.get("apk_url"), p.get("apk_sha256"),
+                                                      p.get("install_mode"))
+        if job["kind"] == "install_new":
+            return self.test_runner._install_new_sync(
+                serial, p.get("new_apk_name"), p.get("package_name"), p.get("apk_url"), p.get("apk_sha256"),
+                p.get("install_mode"))
+        return self.test_runner._run_upgrade_sync(serial, p)
@@ -7,10 +7,22 @@ from typing import List
 import uvicorn
 import os
 from .device_manager import DeviceManager
-from .apk_manager import ApkManager
+from .device_registry import DeviceRegistry
+from .device_watcher import DeviceWatcher
+from .apk_manager import ApkManager, InvalidCursor
 from .test_runner import TestRunner
+from .artifact_cache import ArtifactCache
+from .batch_runner import BatchRunner
+from .device_leases import DeviceLeases
+from .job_queue import JobQueue, JOB_KINDS
+from .compatibility import CompatibilityChecker
+from .http_client import HttpClient
+from .event_bus import EventBus, TOPICS
+from .task_registry import TaskRegistry
+from loguru import logger
 
 app = FastAPI()
+SERVER_PORT = 8791
 
 # CORS configuration
 app.add_middleware(
@@ -30,33 +42,63 @@ app.mount("/static", StaticFiles(directory=static_dir), name="static")
 os.makedirs("apks", exist_ok=True)
 app.mount("/uploads", StaticFiles(directory="apks"), name="uploads")
 
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, JSONResponse, Response, StreamingResponse
 
 from .pgyer_manager import PgyerManager
 
 
 
 @app.post("/pgyer/download")
-async def pgyer_download(background_tasks: BackgroundTasks, item: dict = Body(...)):
+async def pgyer_download(item: dict = Body(...)):
     url = item.get("url")
     remark = item.get("remark")
     if not url:
         return {"status": "error", "message": "Missing URL"}
     
-    task_id = str(uuid.uuid4())
-    background_tasks.add_task(pgyer_manager.download_app, url, task_id, remark)
-    
-    return {"status": "started", "task_id": task_id}
+    task_id, is_new = pgyer_manager.submit(url, remark)
+    # Same link already queued/downloading: the caller follows the existing task
+    return {"status": "started", "task_id": task_id, "deduplicated": not is_new}
 
 @app.get("/pgyer/progress/{task_id}")
 def get_pgyer_progress(task_id: str):
     return pgyer_manager.get_progress(task_id)
 
 # Initialize managers
-device_manager = DeviceManager()
-apk_manager = ApkManager("apks")
-test_runner = TestRunner(device_manager, apk_manager)
-pgyer_manager = PgyerManager("apks", apk_manager)
+http_client = HttpClient()
+event_bus = EventBus()
+device_watcher = DeviceWatcher()
+device_manager = DeviceManager(device_watcher)
+device_registry = DeviceRegistry(device_manager, watcher=device_watcher, events=event_bus)
+apk_manager = ApkManager("apks", events=event_bus, server_port=SERVER_PORT)
+artifact_cache = ArtifactCache("artifact_cache", http_client=http_client)
+device_leases = DeviceLeases()
+compatibility = CompatibilityChecker(device_registry, device_manager, apk_manager)
+test_runner = TestRunner(device_manager, apk_manager, artifact_cache, device_leases, compatibility=compatibility,
+                         http_client=http_client, events=event_bus)
+batch_runner = BatchRunner(test_runner, leases=device_leases)
+job_queue = JobQueue("jobs.db", test_runner, device_leases)
+pgyer_manager = PgyerManager("apks", apk_manager, http_client=http_client, events=event_bus,
+                             tasks=TaskRegistry(path=os.path.join("apks", "pgyer_tasks.json")))
+log_sink_id = None
+
+@app.on_event("startup")
+def start_background_services():
+    global log_sink_id
+    log_sink_id = logger.add(event_bus.log_sink, level="INFO", format="{message}")
+    device_watcher.start()
+    device_registry.start()
+    job_queue.start()
+    apk_manager.inspect_pending()
+
+@app.on_event("shutdown")
+def stop_background_services():
+    job_queue.stop()
+    device_registry.stop()
+    device_watcher.stop()
+    event_bus.close()
+    pgyer_manager.tasks.flush()
+    if log_sink_id is not None:
+        logger.remove(log_sink_id)
 
 @app.get("/")
 async def root():
@@ -64,13 +106,69 @@ async def root():
 
 
 
+@app.get("/events")
+async def stream_events(topics: str = None):
+    """
+    Server-Sent Events stream multiplexing every push topic over one connection.
+    `topics` is a comma-separated subset of progress, install, device, artifacts, log.
+    """
+    wanted = [t for t in topics.split(",") if t] if topics else None
+    unknown = set(wanted or []) - set(TOPICS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown topics: {', '.join(sorted(unknown))}")
+    return StreamingResponse(event_bus.stream(wanted), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.get("/devices")
-def get_devices():
-    return device_manager.list_devices()
+def get_devices(apk: str = None):
+    devices = device_registry.list_devices()
+    if apk:
+        # ?apk=<filename>: annotate every device with its compatibility with that build
+        results = compatibility.matrix(filenames=[apk])["results"]
+        for device in devices:
+            device["compatibility"] = results.get(device["serial"], {}).get(apk)
+    return devices
 
 @app.get("/apks")
-def get_apks():
-    return apk_manager.list_apks()
+def get_apks(request: Request, serial: str = None):
+    if serial:
+        # ?serial=<serial>: annotate every build with its compatibility with that device (not cached)
+        listing = apk_manager.list_apks()
+        row = compatibility.matrix(serials=[serial])["results"].get(serial, {})
+        return {platform: [dict(item, compatibility=row.get(item["filename"])) for item in items]
+                for platform, items in listing.items()}
+    listing, etag = apk_manager.list_apks_with_etag()
+    # no-cache: browsers revalidate every time and get a body-less 304 while nothing changed
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(listing, headers=headers)
+
+@app.get("/apks/search")
+def search_apks(
+    platform: str = None,
+    package_name: str = None,
+    version_code_min: int = None,
+    version_code_max: int = None,
+    q: str = None,
+    sort: str = "upload_time",
+    order: str = "desc",
+    cursor: str = None,
+    limit: int = 50
+):
+    """Paginated artifact listing; pass next_cursor back as cursor for the next page."""
+    if sort not in ("upload_time", "version_code", "filename"):
+        raise HTTPException(status_code=400, detail="sort must be upload_time, version_code or filename")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be asc or desc")
+    if platform and platform not in ("android", "ios"):
+        raise HTTPException(status_code=400, detail="platform must be android or ios")
+    limit = max(1, min(limit, 500))
+    try:
+        return apk_manager.search_apks(platform, package_name, version_code_min, version_code_max,
+                                       q, sort, order, cursor, limit)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 @app.post("/upload")
 async def upload_apk(
@@ -80,21 +178,32 @@ async def upload_apk(
 ):
     return await apk_manager.save_apk(file, custom_filename, remark)
 
-@app.post("/pgyer/download")
-async def pgyer_download(background_tasks: BackgroundTasks, item: dict = Body(...)):
-    url = item.get("url")
-    remark = item.get("remark")
-    if not url:
-        return {"status": "error", "message": "Missing URL"}
-    
-    task_id = str(uuid.uuid4())
-    background_tasks.add_task(pgyer_manager.download_app, url, task_id, remark)
-    
-    return {"status": "started", "task_id": task_id}
+@app.get("/compatibility")
+def get_compatibility(serials: str = None, filenames: str = None):
+    """Device x build compatibility matrix; both filters are comma-separated lists."""
+    return compatibility.matrix(
+        serials=[s for s in serials.split(",") if s] if serials else None,
+        filenames=[f for f in filenames.split(",") if f] if filenames else None)
 
-@app.get("/pgyer/progress/{task_id}")
-def get_pgyer_progress(task_id: str):
-    return pgyer_manager.get_progress(task_id)
+@app.get("/pgyer/tasks")
+def list_pgyer_tasks(active: bool = False):
+    """Known Pgyer tasks, oldest first; `active=true` leaves out finished ones."""
+    return pgyer_manager.list_tasks(active)
+
+@app.get("/pgyer/stats")
+def get_pgyer_stats():
+    return pgyer_manager.stats()
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    return {**artifact_cache.stats(), "parse": apk_manager.parse_cache.stats()}
+
+@app.get("/apks/{filename}/details")
+def get_apk_details(filename: str):
+    details = apk_manager.get_details(filename)
+    if details is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return details
 
 @app.delete("/apks/{filename}")
 def delete_apk(filename: str):
@@ -108,13 +217,15 @@ async def install_old(
     device_serial = item.get("device_serial")
     old_apk_name = item.get("old_apk_name")
     apk_url = item.get("apk_url") # Support remote URL
+    apk_sha256 = item.get("apk_sha256") # Lets the client reuse a local copy with the same content
+    install_mode = item.get("install_mode") # "stream": pipe apk_url into pm without staging it
     
     if not device_serial:
         return {"status": "error", "message": "Missing device_serial"}
     if not old_apk_name and not apk_url:
         return {"status": "error", "message": "Missing old_apk_name or apk_url"}
 
-    return await test_runner.install_old_apk(device_serial, old_apk_name, apk_url)
+    return await test_runner.install_old_apk(device_serial, old_apk_name, apk_url, apk_sha256, install_mode)
 
 @app.post("/install_new")
 async def install_new(
@@ -124,7 +235,9 @@ async def install_new(
     device_serial = item.get("device_serial")
     new_apk_name = item.get("new_apk_name")
     apk_url = item.get("apk_url") # Support remote URL
+    apk_sha256 = item.get("apk_sha256")
     package_name = item.get("package_name")
+    install_mode = item.get("install_mode")
 
     if not device_serial:
         return {"status": "error", "message": "Missing device_serial"}
@@ -133,7 +246,92 @@ async def install_new(
     if not package_name:
          return {"status": "error", "message": "Missing package_name"}
 
-    return await test_runner.install_new_apk(device_serial, new_apk_name, package_name, apk_url)
+    return await test_runner.install_new_apk(device_serial, new_apk_name, package_name, apk_url, apk_sha256, install_mode)
+
+BATCH_PAIR_KEYS = ("old_apk_name", "old_apk_url", "old_apk_sha256", "new_apk_name", "new_apk_url", "new_apk_sha256",
+                   "install_mode")
+
+@app.post("/batch")
+def start_batch(item: dict = Body(...)):
+    """Run the old -> new upgrade test for one or more version pairs on many devices at once."""
+    device_serials = item.get("device_serials") or []
+    pairs = item.get("pairs")
+    if not isinstance(device_serials, list) or not all(isinstance(s, str) and s for s in device_serials):
+        raise HTTPException(status_code=400, detail="device_serials must be a list of serials")
+    if pairs and (not isinstance(pairs, list) or not all(isinstance(p, dict) for p in pairs)):
+        raise HTTPException(status_code=400, detail="pairs must be a list of objects")
+    if not pairs:
+        pairs = [{k: item.get(k) for k in BATCH_PAIR_KEYS}]
+
+    if not device_serials:
+        return {"status": "error", "message": "Missing device_serials"}
+    for pair in pairs:
+        if not pair.get("old_apk_name") and not pair.get("old_apk_url"):
+            return {"status": "error", "message": "Missing old_apk_name or old_apk_url"}
+        if not pair.get("new_apk_name") and not pair.get("new_apk_url"):
+            return {"status": "error", "message": "Missing new_apk_name or new_apk_url"}
+
+    job_id = batch_runner.submit(list(dict.fromkeys(device_serials)), pairs)
+    return {"status": "started", "job_id": job_id}
+
+@app.get("/batch")
+def list_batches():
+    return batch_runner.list_jobs()
+
+@app.get("/batch/{job_id}")
+def get_batch(job_id: str):
+    job = batch_runner.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/jobs")
+def submit_job(item: dict = Body(...)):
+    """Queue an install job; it runs once the device is free and survives restarts."""
+    kind = item.pop("kind", "upgrade")
+    device_serial = item.pop("device_serial", None)
+    priority = item.pop("priority", 0)
+    max_attempts = item.pop("max_attempts", None)
+
+    if kind not in JOB_KINDS:
+        return {"status": "error", "message": f"Unknown kind, expected one of {', '.join(JOB_KINDS)}"}
+    if not device_serial:
+        return {"status": "error", "message": "Missing device_serial"}
+    if not isinstance(priority, int) or not isinstance(max_attempts, (int, type(None))):
+        raise HTTPException(status_code=400, detail="priority and max_attempts must be integers")
+    # Same requirements as the matching /install_old, /install_new and /batch requests
+    if kind == "install_old" and not item.get("old_apk_name") and not item.get("apk_url"):
+        return {"status": "error", "message": "Missing old_apk_name or apk_url"}
+    if kind == "install_new":
+        if not item.get("new_apk_name") and not item.get("apk_url"):
+            return {"status": "error", "message": "Missing new_apk_name or apk_url"}
+        if not item.get("package_name"):
+            return {"status": "error", "message": "Missing package_name"}
+    if kind == "upgrade":
+        if not item.get("old_apk_name") and not item.get("old_apk_url"):
+            return {"status": "error", "message": "Missing old_apk_name or old_apk_url"}
+        if not item.get("new_apk_name") and not item.get("new_apk_url"):
+            return {"status": "error", "message": "Missing new_apk_name or new_apk_url"}
+
+    job_id = job_queue.submit(kind, device_serial, item, priority, max_attempts)
+    return {"status": "queued", "job_id": job_id}
+
+@app.get("/jobs")
+def list_jobs(status: str = None, serial: str = None, limit: int = 100):
+    return {"jobs": job_queue.list(status, serial, limit), "counts": job_queue.stats(), "leases": device_leases.snapshot()}
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    if job_queue.cancel(job_id):
+        return {"status": "success", "job_id": job_id}
+    return {"status": "error", "message": "Job not found or already started"}
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8791)
+    uvicorn.run(app, host="0.0.0.0", port=SERVER_PORT)
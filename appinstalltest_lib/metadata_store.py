@@ -0,0 +1,279 @@
+import os
+import json
+import sqlite3
+import threading
+from loguru import logger
+
+# parse_error_sig: "size:mtime_ns" of a file that failed to parse, so it isn't retried until it changes
+BASE_FIELDS = ("custom_name", "version_name", "version_code", "package_name", "sha256", "upload_time", "parse_error_sig")
+# Filled in later by the background inspection (see artifact_inspector.to_store_fields).
+# List values are comma-joined; inspected_sig is the "size:mtime_ns" they were extracted from.
+DETAIL_FIELDS = ("min_sdk", "target_sdk", "abis", "signature_schemes", "cert_sha256", "cert_hashcodes", "split_name",
+                 "requires_splits", "min_os_version", "required_capabilities", "device_family", "size_breakdown",
+                 "inspected_sig", "inspect_error")
+FIELDS = BASE_FIELDS + DETAIL_FIELDS
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    filename TEXT PRIMARY KEY,
+    platform TEXT NOT NULL,
+    custom_name TEXT NOT NULL DEFAULT '',
+    version_name TEXT,
+    version_code TEXT,
+    version_code_num INTEGER,
+    package_name TEXT,
+    sha256 TEXT,
+    upload_time TEXT,
+    parse_error_sig TEXT,
+    min_sdk INTEGER,
+    target_sdk INTEGER,
+    abis TEXT,
+    signature_schemes TEXT,
+    cert_sha256 TEXT,
+    cert_hashcodes TEXT,
+    split_name TEXT,
+    requires_splits INTEGER,
+    min_os_version TEXT,
+    required_capabilities TEXT,
+    device_family TEXT,
+    size_breakdown TEXT,
+    inspected_sig TEXT,
+    inspect_error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_artifacts_package_name ON artifacts (package_name);
+CREATE INDEX IF NOT EXISTS idx_artifacts_version_code ON artifacts (version_code_num);
+CREATE INDEX IF NOT EXISTS idx_artifacts_upload_time ON artifacts (upload_time);
+CREATE INDEX IF NOT EXISTS idx_artifacts_sha256 ON artifacts (sha256);
+-- Keyset pagination: these match the ORDER BY of query() exactly (see SORT_COLUMNS),
+-- with and without the platform filter, so a page is an index range scan and never a sort
+CREATE INDEX IF NOT EXISTS idx_artifacts_sort_time ON artifacts (COALESCE(upload_time, ''), filename);
+CREATE INDEX IF NOT EXISTS idx_artifacts_platform_sort_time ON artifacts (platform, COALESCE(upload_time, ''), filename);
+CREATE INDEX IF NOT EXISTS idx_artifacts_sort_code ON artifacts (COALESCE(version_code_num, -1), filename);
+CREATE INDEX IF NOT EXISTS idx_artifacts_platform_sort_code ON artifacts (platform, COALESCE(version_code_num, -1), filename);
+CREATE INDEX IF NOT EXISTS idx_artifacts_platform_filename ON artifacts (platform, filename);
+"""
+
+# Indexes on columns that older databases only get from MIGRATIONS
+MIGRATED_INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_artifacts_package_min_sdk ON artifacts (package_name, min_sdk);
+CREATE INDEX IF NOT EXISTS idx_artifacts_cert_sha256 ON artifacts (cert_sha256);
+DROP INDEX IF EXISTS idx_artifacts_platform_time;
+DROP INDEX IF EXISTS idx_artifacts_platform_code;
+"""
+
+# Sortable columns for query(); NULLs are folded so keyset pagination stays total.
+# The expressions must stay identical to the sort indexes in SCHEMA.
+SORT_COLUMNS = {
+    "upload_time": "COALESCE(upload_time, '')",
+    "version_code": "COALESCE(version_code_num, -1)",
+    "filename": "filename",
+}
+
+COLUMNS = ("filename", "platform", "custom_name", "version_name", "version_code", "version_code_num",
+           "package_name", "sha256", "upload_time", "parse_error_sig") + DETAIL_FIELDS
+INSERT_COLUMNS = f"({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+# Columns added after the first release, with their types, for in-place upgrades
+MIGRATIONS = [
+    ("parse_error_sig", "TEXT"),
+    ("min_sdk", "INTEGER"),
+    ("target_sdk", "INTEGER"),
+    ("abis", "TEXT"),
+    ("signature_schemes", "TEXT"),
+    ("cert_sha256", "TEXT"),
+    ("cert_hashcodes", "TEXT"),
+    ("split_name", "TEXT"),
+    ("requires_splits", "INTEGER"),
+    ("min_os_version", "TEXT"),
+    ("required_capabilities", "TEXT"),
+    ("size_breakdown", "TEXT"),
+    ("inspected_sig", "TEXT"),
+    ("inspect_error", "TEXT"),
+    ("device_family", "TEXT"),
+]
+# Detail columns added after inspection shipped, with the platform they apply to:
+# rows inspected before the column existed lose inspected_sig so they are inspected again
+REINSPECT_MIGRATIONS = {"device_family": "ios"}
+
+
+def platform_of(filename):
+    return "ios" if filename.lower().endswith(".ipa") else "android"
+
+
+def version_code_num(version_code):
+    try:
+        return int(str(version_code).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+class MetadataStore:
+    """
+    Artifact metadata in SQLite (WAL mode), one row per file in the upload dir.
+    Writes touch a single row instead of rewriting the whole metadata file.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(artifacts)")}
+        with self._db:
+            for column, column_type in MIGRATIONS:
+                if column not in columns:
+                    self._db.execute(f"ALTER TABLE artifacts ADD COLUMN {column} {column_type}")
+                    if column in REINSPECT_MIGRATIONS:
+                        self._db.execute("UPDATE artifacts SET inspected_sig = NULL WHERE platform = ?",
+                                         (REINSPECT_MIGRATIONS[column],))
+        self._db.executescript(MIGRATED_INDEXES)
+
+    def _row_values(self, filename, meta):
+        return (
+            filename,
+            platform_of(filename),
+            meta.get("custom_name") or "",
+            meta.get("version_name"),
+            meta.get("version_code"),
+            version_code_num(meta.get("version_code")),
+            meta.get("package_name"),
+            meta.get("sha256"),
+            meta.get("upload_time"),
+            meta.get("parse_error_sig"),
+        ) + tuple(meta.get(field) for field in DETAIL_FIELDS)
+
+    def _row_to_meta(self, row):
+        return {field: row[field] for field in FIELDS if row[field] is not None}
+
+    def get(self, filename):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM artifacts WHERE filename = ?", (filename,)).fetchone()
+        return self._row_to_meta(row) if row else None
+
+    def all(self):
+        """Return {filename: meta} for every artifact."""
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM artifacts").fetchall()
+        return {row["filename"]: self._row_to_meta(row) for row in rows}
+
+    def filenames(self):
+        with self._lock:
+            return {row[0] for row in self._db.execute("SELECT filename FROM artifacts")}
+
+    def put(self, filename, meta):
+        """Insert or replace the metadata of `filename`."""
+        with self._lock, self._db:
+            self._db.execute(f"INSERT OR REPLACE INTO artifacts {INSERT_COLUMNS}", self._row_values(filename, meta))
+
+    def update(self, filename, **fields):
+        """Update some fields of an existing row."""
+        fields = {k: v for k, v in fields.items() if k in FIELDS}
+        if not fields:
+            return
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        params = list(fields.values())
+        if "version_code" in fields:
+            assignments += ", version_code_num = ?"
+            params.append(version_code_num(fields["version_code"]))
+        with self._lock, self._db:
+            self._db.execute(f"UPDATE artifacts SET {assignments} WHERE filename = ?", params + [filename])
+
+    def add_missing(self, rows):
+        """Insert {filename: meta} rows that don't exist yet; existing rows are left alone."""
+        if not rows:
+            return
+        with self._lock, self._db:
+            self._db.executemany(f"INSERT OR IGNORE INTO artifacts {INSERT_COLUMNS}",
+                                 [self._row_values(filename, meta) for filename, meta in rows.items()])
+
+    def delete(self, filename):
+        with self._lock, self._db:
+            return self._db.execute("DELETE FROM artifacts WHERE filename = ?", (filename,)).rowcount > 0
+
+    def delete_many(self, filenames):
+        if not filenames:
+            return
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM artifacts WHERE filename = ?", [(f,) for f in filenames])
+
+    def query(self, platform=None, package_name=None, version_code_min=None, version_code_max=None,
+              text=None, sort="upload_time", descending=True, after=None, limit=50):
+        """
+        Filtered, keyset-paginated listing. `after` is the (sort_value, filename)
+        of the last row of the previous page. Returns (rows, next_after).
+        """
+        sort_expr = SORT_COLUMNS[sort]
+        clauses, params = [], []
+        if platform:
+            clauses.append("platform = ?")
+            params.append(platform)
+        if package_name:
+            clauses.append("package_name = ?")
+            params.append(package_name)
+        if version_code_min is not None:
+            clauses.append("version_code_num >= ?")
+            params.append(int(version_code_min))
+        if version_code_max is not None:
+            clauses.append("version_code_num <= ?")
+            params.append(int(version_code_max))
+        if text:
+            clauses.append("(custom_name LIKE ? ESCAPE '\\' OR filename LIKE ? ESCAPE '\\')")
+            pattern = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            params.extend([pattern, pattern])
+        op = "<" if descending else ">"
+        if after and sort == "filename":
+            clauses.append(f"filename {op} ?")
+            params.append(after[1])
+        elif after:
+            # The plain bound on the sort expression lets SQLite seek into the index;
+            # the row value comparison breaks ties on filename
+            clauses.append(f"{sort_expr} {op}= ? AND ({sort_expr}, filename) {op} (?, ?)")
+            params.extend([after[0], after[0], after[1]])
+
+        direction = "DESC" if descending else "ASC"
+        order_by = f"filename {direction}" if sort == "filename" else f"{sort_expr} {direction}, filename {direction}"
+        sql = f"SELECT *, {sort_expr} AS sort_value FROM artifacts"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += f" ORDER BY {order_by} LIMIT ?"
+        params.append(int(limit) + 1)
+
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_after = (rows[-1]["sort_value"], rows[-1]["filename"]) if has_more else None
+        items = []
+        for row in rows:
+            meta = self._row_to_meta(row)
+            meta["filename"] = row["filename"]
+            meta["platform"] = row["platform"]
+            items.append(meta)
+        return items, next_after
+
+    def find_by_sha256(self, sha256):
+        with self._lock:
+            rows = self._db.execute("SELECT filename FROM artifacts WHERE sha256 = ?", (sha256,)).fetchall()
+        return [row[0] for row in rows]
+
+    def import_json(self, json_path):
+        """One-time import of a legacy metadata.json; the file is renamed afterwards."""
+        try:
+            with open(json_path, "r") as f:
+                metadata = json.load(f)
+        except Exception as e:
+            logger.error(f"Cannot import {json_path}: {e}")
+            return 0
+
+        with self._lock, self._db:
+            self._db.executemany(f"INSERT OR IGNORE INTO artifacts {INSERT_COLUMNS}",
+                                 [self._row_values(filename, meta) for filename, meta in metadata.items()])
+        os.replace(json_path, json_path + ".imported")
+        logger.info(f"Imported {len(metadata)} entries from {json_path}")
+        return len(metadata)
@@ -0,0 +1,63 @@
+import os
+import threading
+from collections import OrderedDict
+
+
+class ParseCache:
+    """
+    Bounded LRU of parse results keyed by file identity
+    (realpath, size, mtime_ns, inode) and parser name.
+
+    A file that is replaced or rewritten gets a new key, so stale results
+    are never served; they simply age out. Concurrent requests for the same
+    key wait for the first parse instead of decoding the file again.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._in_flight = {}  # key -> threading.Event
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, file_path, kind):
+        st = os.stat(file_path)
+        return (os.path.realpath(file_path), st.st_size, st.st_mtime_ns, st.st_ino, kind)
+
+    def get_or_parse(self, file_path, kind, parser):
+        """Return the cached result of `parser(file_path)`, parsing at most once per file version."""
+        try:
+            key = self._key(file_path, kind)
+        except OSError:
+            return parser(file_path)
+
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key]
+                waiter = self._in_flight.get(key)
+                if waiter is None:
+                    self._in_flight[key] = threading.Event()
+                    self.misses += 1
+                    break
+            # Another thread is parsing this file; use its result (or retry if it failed)
+            waiter.wait()
+
+        try:
+            result = parser(file_path)
+            with self._lock:
+                self._entries[key] = result
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            return result
+        finally:
+            with self._lock:
+                self._in_flight.pop(key).set()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses}
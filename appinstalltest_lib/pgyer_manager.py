@@ -1,20 +1,165 @@
-import requests
 import re
 import time
 import os
+import uuid
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import unquote
 from loguru import logger
+from .segmented_downloader import SegmentedDownloader
+from .http_client import default_client
+from .resolution_cache import ResolutionCache
+from .task_registry import TaskRegistry
+from .progress_reporter import ProgressReporter
 
 class PgyerManager:
-    def __init__(self, download_dir="apks", apk_manager=None):
+    def __init__(self, download_dir="apks", apk_manager=None, max_downloads=2, http_client=None, resolution_ttl=3600,
+                 events=None, tasks=None):
         self.download_dir = download_dir
         self.apk_manager = apk_manager
+        self.http = http_client or default_client
         if not os.path.exists(self.download_dir):
             os.makedirs(self.download_dir)
-        self.progress = {}
+        # Page URL -> resolved build, so repeat links skip resolution and the transfer
+        self.resolutions = ResolutionCache(os.path.join(self.download_dir, "pgyer_resolutions.json"), ttl=resolution_ttl)
+        # Progress per task id; finished tasks expire instead of piling up
+        self.tasks = tasks or TaskRegistry()
+        # Optional EventBus; every progress change is pushed as a "progress" event
+        self.events = events
+        self.downloader = SegmentedDownloader()
+        # Own bounded pool so downloads never compete with request handlers for threads
+        self.max_downloads = max_downloads
+        self._executor = ThreadPoolExecutor(max_workers=max_downloads, thread_name_prefix="pgyer-download")
+        self._lock = threading.Lock()
+        self._by_url = {}       # page url -> task_id, while queued or running
+        self._by_artifact = {}  # resolved download url (without query) -> task_id, while transferring
+        self._queued_at = {}    # task_id -> submit time, until a worker picks it up
+        self._waits = deque(maxlen=100)
+        self._running = 0
+        self.deduplicated = 0
 
     def get_progress(self, task_id):
-        return self.progress.get(task_id, {"status": "unknown", "percent": 0})
+        entry = self.tasks.get(task_id)
+        if entry and entry.get("shared_with"):
+            # This task's link resolved to a file another task is transferring
+            entry = self.tasks.get(entry["shared_with"]) or entry
+        return entry or {"status": "unknown", "percent": 0}
+
+    def list_tasks(self, active_only=False):
+        return self.tasks.list(active_only)
+
+    def _set_progress(self, task_id, **fields):
+        """Replace the progress entry of `task_id` and publish it."""
+        self._publish(task_id, self.tasks.set(task_id, **fields))
+
+    def _update_progress(self, task_id, **fields):
+        """Merge `fields` into the progress entry of `task_id` and publish it."""
+        self._publish(task_id, self.tasks.update(task_id, **fields))
+
+    def _publish(self, task_id, entry):
+        if self.events:
+            self.events.publish("progress", dict(entry, task_id=task_id))
+
+    def submit(self, url, remark=None):
+        """
+        Queue a download of a Pgyer page. Returns (task_id, is_new); a URL that is
+        already queued or downloading gets the existing task_id.
+        """
+        with self._lock:
+            task_id = self._by_url.get(url)
+            if task_id:
+                self.deduplicated += 1
+                return task_id, False
+            task_id = str(uuid.uuid4())
+            self._by_url[url] = task_id
+            self._queued_at[task_id] = time.time()
+            self._set_progress(task_id, status="queued", percent=0, message="排队中...")
+        self._executor.submit(self._run_task, url, task_id, remark)
+        return task_id, True
+
+    def stats(self):
+        with self._lock:
+            now = time.time()
+            waits = list(self._waits)
+            return {
+                "max_downloads": self.max_downloads,
+                "queued": len(self._queued_at),
+                "running": self._running,
+                "deduplicated": self.deduplicated,
+                "tasks": len(self.tasks.list()),
+                "oldest_queued_seconds": round(now - min(self._queued_at.values()), 2) if self._queued_at else 0,
+                "wait_seconds": {
+                    "last": round(waits[-1], 2) if waits else 0,
+                    "avg": round(sum(waits) / len(waits), 2) if waits else 0,
+                    "max": round(max(waits), 2) if waits else 0,
+                },
+            }
+
+    def _run_task(self, url, task_id, remark):
+        with self._lock:
+            self._waits.append(time.time() - self._queued_at.pop(task_id))
+            self._running += 1
+        try:
+            self.download_app(url, task_id, remark)
+        except Exception:
+            logger.exception(f"Pgyer task {task_id} crashed")
+        finally:
+            with self._lock:
+                self._running -= 1
+                if self._by_url.get(url) == task_id:
+                    del self._by_url[url]
+
+    def _claim_artifact(self, download_url, task_id):
+        """Return the task already transferring `download_url`, claiming it for `task_id` if none is."""
+        key = download_url.split("?")[0]
+        with self._lock:
+            owner = self._by_artifact.setdefault(key, task_id)
+            if owner != task_id:
+                self.deduplicated += 1
+        if owner != task_id:
+            # Readers and subscribers of task_id follow the owner from here on
+            self._set_progress(task_id, status="shared", shared_with=owner)
+        return owner
+
+    def _cached_artifact(self, entry):
+        """Local filename of a previously resolved build if it's still on disk unchanged, else None."""
+        if not entry or not entry.get("filename"):
+            return None
+        path = os.path.join(self.download_dir, entry["filename"])
+        if not os.path.isfile(path) or os.path.getsize(path) != entry.get("size"):
+            return None
+        return entry["filename"]
+
+    def _not_modified(self, session, download_url, entry):
+        """Conditional GET against the stored validators; True if the server answers 304."""
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        if not headers:
+            return False
+        try:
+            with session.get(download_url, headers=headers, stream=True) as r:
+                return r.status_code == 304
+        except Exception as e:
+            logger.warning(f"Conditional GET failed, downloading again: {e}")
+            return False
+
+    def _reuse(self, url, task_id, filename, remark, how):
+        logger.info(f"{url} resolves to the stored {filename} ({how}), skipping the download")
+        if self.apk_manager and self.apk_manager.store.get(filename) is None:
+            self.apk_manager.register_file(filename, remark)
+        self._set_progress(task_id, status="success", percent=100, message="已下载过，直接使用本地文件",
+                           filename=filename)
+        return {"status": "success", "message": "Already downloaded", "filename": filename, "cached": how}
+
+    def _release_artifact(self, download_url, task_id):
+        key = download_url.split("?")[0]
+        with self._lock:
+            if self._by_artifact.get(key) == task_id:
+                del self._by_artifact[key]
 
     def decode_data(self, a):
         # JS: for (var b = "", c = "", d = 0; 12 > d; d++) b += String.fromCharCode(parseInt(a.substring(2 * d, 2 * d + 2), 16)).toLowerCase();
@@ -37,15 +182,20 @@ class PgyerManager:
         Download app from Pgyer URL.
         Returns: {"status": "success/error", "message": "...", "filename": "..."}
         """
-        self.progress[task_id] = {"status": "analyzing", "percent": 0, "message": "正在解析页面..."}
+        cached = self.resolutions.get(url)
+        local = self._cached_artifact(cached)
+        if local and self.resolutions.is_fresh(cached):
+            return self._reuse(url, task_id, local, remark, "fresh")
+
+        self._set_progress(task_id, status="analyzing", percent=0, message="正在解析页面...")
         try:
             # Determine if it's likely Android or iOS based on URL or try both
             # For simplicity, we'll try a generic approach or default to Android UA first, 
             # but Pgyer often serves different content based on UA.
             # Let's try to detect from the page content or just try one then the other.
             
-            # We'll use a session
-            session = requests.Session()
+            # We'll use a session (own cookies, shared keep-alive connections)
+            session = self.http.session()
             
             # 1. Visit the page to get keys
             # Use a generic mobile UA to ensure we get the mobile install page
@@ -64,9 +214,13 @@ class PgyerManager:
             # Extract keys
             aKey_match = re.search(r"aKey\s*=\s*'([a-zA-Z0-9]+)'", text)
             if not aKey_match:
-                self.progress[task_id] = {"status": "error", "percent": 0, "message": "无法找到 aKey，页面可能无效或过期"}
+                self._set_progress(task_id, status="error", percent=0, message="无法找到 aKey，页面可能无效或过期")
                 return {"status": "error", "message": "Could not find aKey. Page might be invalid or expired."}
             aKey = aKey_match.group(1)
+            if local and cached.get("akey") == aKey:
+                # Same build as last time: no install API call, no transfer
+                self.resolutions.put(url, akey=aKey)
+                return self._reuse(url, task_id, local, remark, "same_build")
 
             token_match = re.search(r"installToken\s*=\s*\"([a-zA-Z0-9]+)\"", text)
             install_token = token_match.group(1) if token_match else ""
@@ -93,7 +247,7 @@ class PgyerManager:
                 install_api_url += f"&installToken={install_token}"
 
             logger.info(f"Requesting Install API: {install_api_url}")
-            self.progress[task_id]["message"] = "正在获取下载链接..."
+            self._update_progress(task_id, message="正在获取下载链接...")
             
             # Request install URL (don't follow redirects yet to check for itms-services)
             install_resp = session.get(install_api_url, allow_redirects=False)
@@ -108,10 +262,10 @@ class PgyerManager:
                 elif "itms-services://" in location:
                     # Handle iOS Plist
                     logger.info("Found itms-services link, parsing plist...")
-                    self.progress[task_id]["message"] = "正在解析 iOS Plist..."
+                    self._update_progress(task_id, message="正在解析 iOS Plist...")
                     download_url = self.parse_plist(location)
                     if not download_url:
-                        self.progress[task_id] = {"status": "error", "percent": 0, "message": "解析 Plist 失败"}
+                        self._set_progress(task_id, status="error", percent=0, message="解析 Plist 失败")
                         return {"status": "error", "message": "Failed to extract IPA URL from plist."}
                 else:
                     # Follow redirect
@@ -128,13 +282,30 @@ class PgyerManager:
                     pass
 
             if not download_url:
-                 self.progress[task_id] = {"status": "error", "percent": 0, "message": "无法找到下载链接"}
+                 self._set_progress(task_id, status="error", percent=0, message="无法找到下载链接")
                  return {"status": "error", "message": "Could not find download URL."}
 
+            download_key = download_url.split("?")[0]
+            if local and cached.get("download_key") == download_key and self._not_modified(session, download_url, cached):
+                self.resolutions.put(url, akey=aKey)
+                return self._reuse(url, task_id, local, remark, "not_modified")
+
+            # Another link (or a fresh token for the same link) may resolve to a file already in transfer
+            owner = self._claim_artifact(download_url, task_id)
+            if owner != task_id:
+                logger.info(f"Task {task_id} resolved to the artifact task {owner} is downloading; sharing it")
+                return {"status": "shared", "task_id": owner}
+
             # Download the file
-            result = self.download_file(download_url, task_id)
+            try:
+                result = self.download_file(download_url, task_id)
+            finally:
+                self._release_artifact(download_url, task_id)
             
             if result["status"] == "success":
+                self.resolutions.put(url, akey=aKey, download_key=download_key, filename=result["filename"],
+                                     size=result.get("size"), etag=result.get("etag"),
+                                     last_modified=result.get("last_modified"))
                 logger.info(f"Download success. Registering file with remark: '{remark}'")
                 if self.apk_manager:
                     self.apk_manager.register_file(result["filename"], remark)
@@ -145,7 +316,7 @@ class PgyerManager:
 
         except Exception as e:
             logger.error(f"Pgyer download failed: {e}")
-            self.progress[task_id] = {"status": "error", "percent": 0, "message": str(e)}
+            self._set_progress(task_id, status="error", percent=0, message=str(e))
             return {"status": "error", "message": str(e)}
 
     def parse_plist(self, url):
@@ -168,7 +339,7 @@ class PgyerManager:
             
             # Fetch plist
             headers = {"User-Agent": "itunesstored/1.0"}
-            resp = requests.get(plist_url, headers=headers)
+            resp = self.http.get(plist_url, headers=headers)
             if resp.status_code != 200:
                 logger.error(f"Failed to fetch plist: {resp.status_code}")
                 return None
@@ -210,51 +381,31 @@ class PgyerManager:
             save_path = os.path.join(self.download_dir, local_filename)
             
             logger.info(f"Downloading to {save_path}...")
-            self.progress[task_id]["message"] = "开始下载..."
-            self.progress[task_id]["status"] = "downloading"
-            
-            with requests.get(url, stream=True) as r:
-                r.raise_for_status()
-                
-                # Debug Content-Type
-                content_type = r.headers.get('Content-Type', '')
-                logger.info(f"Download Content-Type: {content_type}")
-                
-                if 'text/html' in content_type:
-                    logger.warning("Download URL returned HTML. Likely a login page or error.")
-                    # Read a bit to see what it is
-                    preview = r.content[:500].decode('utf-8', errors='ignore')
-                    logger.warning(f"Preview: {preview}")
-                    raise Exception("Download URL returned HTML instead of a file.")
-
-                total_length = int(r.headers.get('content-length', 0))
-                dl = 0
-                
-                with open(save_path, 'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        dl += len(chunk)
-                        f.write(chunk)
-                        if total_length > 0:
-                            percent = int((dl / total_length) * 100)
-                            self.progress[task_id]["percent"] = percent
-                            self.progress[task_id]["message"] = f"下载中 {percent}% ({dl//1024//1024}MB / {total_length//1024//1024}MB)"
+            self._update_progress(task_id, status="downloading", message="开始下载...")
             
+            def on_report(r):
+                fields = {"done": r["done"], "speed": r["speed"], "eta": r["eta"]}
+                speed = f"{r['speed'] / 1048576:.1f}MB/s"
+                if r["total"]:
+                    fields["percent"] = r["percent"]
+                    message = f"下载中 {r['percent']}% ({r['done'] >> 20}MB / {r['total'] >> 20}MB, {speed}"
+                else:
+                    # No Content-Length: bytes so far and speed, without a percent
+                    message = f"下载中 ({r['done'] >> 20}MB, {speed}"
+                if r["eta"] is not None:
+                    message += f", 剩余 {int(r['eta'])}s"
+                self._update_progress(task_id, message=message + ")", **fields)
+
+            # Reports only on a new percent or every 0.5 s, not per chunk
+            reporter = ProgressReporter(on_report)
+            # Parallel ranged download; an interrupted one resumes from its .part file next time
+            info = self.downloader.download(url, save_path, session=self.http.session(), progress=reporter.update)
+
             logger.info("Download complete.")
-            self.progress[task_id]["status"] = "success"
-            self.progress[task_id]["percent"] = 100
-            self.progress[task_id]["message"] = "下载完成"
-            self.progress[task_id]["filename"] = local_filename
-            return {"status": "success", "message": "Download successful", "filename": local_filename}
+            self._update_progress(task_id, status="success", percent=100, message="下载完成", filename=local_filename)
+            return {"status": "success", "message": "Download successful", "filename": local_filename, **info}
         except Exception as e:
             logger.error(f"File download failed: {e}")
-            # Cleanup failed file
-            if os.path.exists(save_path):
-                try:
-                    os.remove(save_path)
-                    logger.info(f"Deleted failed download: {save_path}")
-                except Exception as cleanup_error:
-                    logger.error(f"Failed to delete bad file: {cleanup_error}")
-            
-            self.progress[task_id]["status"] = "error"
-            self.progress[task_id]["message"] = f"下载失败: {e}"
+            # The partial data is kept next to save_path so a retry resumes instead of restarting
+            self._update_progress(task_id, status="error", message=f"下载失败: {e}")
             return {"status": "error", "message": f"File download failed: {e}"}
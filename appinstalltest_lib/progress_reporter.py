@@ -0,0 +1,52 @@
+import time
+import threading
+from collections import deque
+
+
+class ProgressReporter:
+    """
+    Turns a stream of byte counts into throttled progress reports.
+
+    `update(done, total)` is cheap enough for the per-chunk loop of a
+    download: `publish(report)` only runs when the whole percentage changes
+    or `interval` seconds passed since the last report. A report is
+    {"done", "total", "percent", "speed" (bytes/s over the last `window`
+    seconds), "eta" (seconds, None while unknown)}. Safe to call from
+    several segment threads at once.
+    """
+
+    def __init__(self, publish, interval=0.5, window=5.0):
+        self.publish = publish
+        self.interval = interval
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = deque()  # (monotonic time, done) at each report, for the speed window
+        self._last_percent = -1
+        self._last_at = 0.0
+        self._done = 0
+        self._total = 0
+
+    def update(self, done, total=0):
+        now = time.monotonic()
+        percent = done * 100 // total if total > 0 else 0
+        with self._lock:
+            if done < self._done:
+                return  # Segment threads can call in slightly out of order
+            self._done, self._total = done, total
+            if percent == self._last_percent and now - self._last_at < self.interval:
+                return
+            report = self._report(now, percent)
+        self.publish(report)
+
+    def _report(self, now, percent):
+        self._last_percent, self._last_at = percent, now
+        self._samples.append((now, self._done))
+        while len(self._samples) > 2 and now - self._samples[1][0] >= self.window:
+            self._samples.popleft()
+        started_at, started_done = self._samples[0]
+        elapsed = now - started_at
+        speed = (self._done - started_done) / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if speed > 0 and self._total > 0:
+            eta = round(max(self._total - self._done, 0) / speed, 1)
+        return {"done": self._done, "total": self._total, "percent": percent, "speed": round(speed), "eta": eta}
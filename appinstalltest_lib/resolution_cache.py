@@ -0,0 +1,63 @@
+import os
+import json
+import time
+import threading
+from loguru import logger
+
+
+class ResolutionCache:
+    """
+    Pgyer page URL -> resolved build: aKey, download URL (without its expiring
+    query), ETag/Last-Modified, size and the local filename it was saved as.
+
+    Entries younger than `ttl` are trusted as-is; older ones are still kept
+    so a re-resolution that lands on the same build can skip the transfer.
+    Persisted as JSON so restarts keep the cache.
+    """
+
+    def __init__(self, path, ttl=3600, max_entries=500):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable resolution cache {self.path}: {e}")
+            return {}
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.path)
+
+    def get(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            return dict(entry) if entry else None
+
+    def is_fresh(self, entry):
+        return bool(entry) and time.time() - entry.get("resolved_at", 0) < self.ttl
+
+    def put(self, url, **fields):
+        """Merge `fields` into the entry of `url` and mark it freshly resolved."""
+        with self._lock:
+            entry = self._entries.pop(url, {})
+            entry.update(fields)
+            entry["resolved_at"] = time.time()
+            self._entries[url] = entry  # re-inserted last: dict order doubles as LRU order
+            while len(self._entries) > self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._save()
+
+    def invalidate(self, url):
+        with self._lock:
+            if self._entries.pop(url, None) is not None:
+                self._save()
@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+from .http_client import default_client
+
+CHUNK_SIZE = 1024 * 1024
+CHECKPOINT_EVERY = 8 * 1024 * 1024  # bytes written between checkpoint saves
+
+
+class DownloadError(Exception):
+    pass
+
+
+class _RemoteChanged(Exception):
+    """A range request was answered with the whole file: it changed, or its validator is weak."""
+
+
+class SegmentedDownloader:
+    """
+    Downloads a URL into `dest_path` with N parallel HTTP Range requests.
+
+    The data goes to a preallocated `<dest>.part` file and segment progress
+    is checkpointed to `<dest>.part.json`, so a download interrupted by a
+    dropped connection or a restart resumes where it stopped. The
+    checkpoint is tied to the file size and validator (ETag/Last-Modified)
+    rather than the URL, because CDN links carry expiring signatures.
+    Servers without range support get a plain single stream, and so does a
+    file that turns out to have changed halfway (a 200 to If-Range).
+    """
+
+    def __init__(self, segments=4, min_segment_size=8 * 1024 * 1024, timeout=(10, 60), max_retries=3):
+        self.segments = segments
+        self.min_segment_size = min_segment_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+    def download(self, url, dest_path, session=None, progress=None):
+        """
+        Download `url` to `dest_path`. `progress(done_bytes, total_bytes)` is called
+        as data arrives (total is 0 when unknown). Returns {"size", "etag", "last_modified"}.
+        """
+        session = session or default_client.session()
+        part_path = dest_path + ".part"
+        checkpoint_path = part_path + ".json"
+
+        probe = session.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=self.timeout)
+        try:
+            probe.raise_for_status()
+            self._check_content_type(probe)
+            total = self._range_total(probe)
+            validator = probe.headers.get("ETag") or probe.headers.get("Last-Modified")
+            # If-Range only takes strong validators; a weak ETag would always get a 200
+            etag = probe.headers.get("ETag")
+            if_range = etag if etag and not etag.startswith("W/") else probe.headers.get("Last-Modified")
+            info = {"etag": probe.headers.get("ETag"), "last_modified": probe.headers.get("Last-Modified")}
+            if total is None:
+                logger.info(f"No usable Range support for {url}, downloading in a single stream")
+                if probe.status_code == 206:
+                    # Ranges work but the size is unknown; start over without one
+                    probe.close()
+                    probe = session.get(url, stream=True, timeout=self.timeout)
+                    probe.raise_for_status()
+                info["size"] = self._single_stream(probe, part_path, progress)
+                os.replace(part_path, dest_path)
+                self._remove(checkpoint_path)
+                return info
+        finally:
+            probe.close()
+
+        state = self._load_checkpoint(checkpoint_path, total, validator)
+        if state is None or not os.path.exists(part_path):
+            state = {"total": total, "validator": validator, "segments": self._plan(total)}
+            with open(part_path, "wb") as f:
+                f.truncate(total)
+        else:
+            logger.info(f"Resuming {dest_path} at {self._done(state)}/{total} bytes")
+
+        try:
+            self._run_segments(url, session, part_path, checkpoint_path, state, if_range, progress)
+        except _RemoteChanged:
+            logger.warning(f"{url} changed during the download, starting over in a single stream")
+            self._remove(checkpoint_path)
+            with session.get(url, stream=True, timeout=self.timeout) as r:
+                r.raise_for_status()
+                self._check_content_type(r)
+                info = {"etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified"),
+                        "size": self._single_stream(r, part_path, progress)}
+            os.replace(part_path, dest_path)
+            return info
+        if self._done(state) != total:
+            raise DownloadError(f"Incomplete download: {self._done(state)}/{total} bytes")
+        os.replace(part_path, dest_path)
+        self._remove(checkpoint_path)
+        info["size"] = total
+        return info
+
+    def _check_content_type(self, response):
+        if "text/html" in response.headers.get("Content-Type", ""):
+            preview = next(response.iter_content(500), b"").decode("utf-8", errors="ignore")
+            logger.warning(f"Download URL returned HTML: {preview}")
+            raise DownloadError("Download URL returned HTML instead of a file.")
+
+    def _range_total(self, response):
+        """Total size if the server answered the probe with a usable 206, else None."""
+        content_range = response.headers.get("Content-Range", "")
+        if response.status_code != 206 or "/" not in content_range:
+            return None
+        total = content_range.rsplit("/", 1)[1]
+        return int(total) if total.isdigit() and int(total) > 0 else None
+
+    def _plan(self, total):
+        count = max(1, min(self.segments, total // self.min_segment_size))
+        size = -(-total // count)
+        # [start, end (inclusive), bytes done]
+        return [[start, min(start + size, total) - 1, 0] for start in range(0, total, size)]
+
+    def _done(self, state):
+        return sum(segment[2] for segment in state["segments"])
+
+    def _load_checkpoint(self, checkpoint_path, total, validator):
+        try:
+            with open(checkpoint_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get("total") != total or state.get("validator") != validator:
+            logger.info("Remote file changed since the last attempt, starting over")
+            return None
+        return state
+
+    def _save_checkpoint(self, checkpoint_path, state):
+        tmp_path = checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, checkpoint_path)
+
+    def _run_segments(self, url, session, part_path, checkpoint_path, state, if_range, progress):
+        lock = threading.Lock()
+        unsaved = [0]
+        stop = threading.Event()  # set once one segment failed, so the others don't keep going
+
+        def advance(segment, n):
+            with lock:
+                segment[2] += n
+                unsaved[0] += n
+                if unsaved[0] >= CHECKPOINT_EVERY:
+                    unsaved[0] = 0
+                    self._save_checkpoint(checkpoint_path, state)
+                done = self._done(state)
+            if progress:
+                progress(done, state["total"])
+
+        pending = [s for s in state["segments"] if s[0] + s[2] <= s[1]]
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, len(pending)), thread_name_prefix="segment") as pool:
+                futures = [pool.submit(self._fetch_segment, url, session, part_path, s, if_range, advance, stop)
+                           for s in pending]
+                try:
+                    for future in futures:
+                        future.result()
+                except Exception:
+                    stop.set()
+                    raise
+        finally:
+            with lock:
+                self._save_checkpoint(checkpoint_path, state)
+
+    def _fetch_segment(self, url, session, part_path, segment, if_range, advance, stop):
+        attempt = 0
+        while segment[0] + segment[2] <= segment[1] and not stop.is_set():
+            before = segment[2]
+            headers = {"Range": f"bytes={segment[0] + segment[2]}-{segment[1]}"}
+            if if_range:
+                # The server sends the whole (new) file instead of a 206 if it changed
+                headers["If-Range"] = if_range
+            try:
+                with session.get(url, headers=headers, stream=True, timeout=self.timeout) as r:
+                    r.raise_for_status()
+                    if r.status_code == 200:
+                        raise _RemoteChanged()
+                    if r.status_code != 206:
+                        raise DownloadError(f"Server answered a range request with {r.status_code}")
+                    with open(part_path, "r+b") as f:
+                        f.seek(segment[0] + segment[2])
+                        for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                            chunk = chunk[:segment[1] + 1 - segment[0] - segment[2]]
+                            f.write(chunk)
+                            advance(segment, len(chunk))
+                            if stop.is_set():
+                                return
+                if segment[2] == before:
+                    raise ConnectionError("Range response ended without data")
+                attempt = 0
+            except (DownloadError, _RemoteChanged):
+                raise
+            except Exception as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise DownloadError(f"Segment {segment[0]}-{segment[1]} failed: {e}")
+                delay = 2 ** (attempt - 1)
+                logger.warning(f"Segment {segment[0]}-{segment[1]} interrupted ({e}), retrying in {delay}s")
+                time.sleep(delay)
+
+    def _single_stream(self, response, part_path, progress):
+        total = int(response.headers.get("Content-Length") or 0)
+        done = 0
+        with open(part_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+                done += len(chunk)
+                if progress:
+                    progress(done, total)
+        if total and done != total and "Content-Encoding" not in response.headers:
+            raise DownloadError(f"Incomplete download: {done}/{total} bytes")
+        return done
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
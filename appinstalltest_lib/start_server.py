@@ -1,12 +1,12 @@
 import uvicorn
-from .main import app
+from .main import app, SERVER_PORT
 import os
 import sys
 
 def main():
     # Ensure the current directory is in sys.path so imports work
     sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-    uvicorn.run(app, host="0.0.0.0", port=8791)
+    uvicorn.run(app, host="0.0.0.0", port=SERVER_PORT)
 
 if __name__ == "__main__":
     main()
@@ -4,6 +4,8 @@ const SERVER_API = window.location.origin;
 let selectedDevice = null;
 let currentPackageName = null;
 let isLocalConnected = false;
+let pgyerTaskId = null;      // Pgyer task whose progress is shown
+let activeInstallSerial = null; // Device whose install steps go to the log area
 
 // UI Elements
 const clientInfoEl = document.getElementById('clientInfo');
@@ -54,6 +56,92 @@ function updateClientInfo(connected) {
         `;
     }
 }
+// Server push: one EventSource per backend carries every topic
+const eventHandlers = {};
+
+function onEvent(topic, handler) {
+    (eventHandlers[topic] = eventHandlers[topic] || []).push(handler);
+}
+
+function openEventSource(base, topics, onOpen, onError) {
+    const source = new EventSource(`${base}/events?topics=${topics.join(',')}`);
+    topics.forEach(topic => {
+        source.addEventListener(topic, e => {
+            const data = JSON.parse(e.data);
+            (eventHandlers[topic] || []).forEach(handler => handler(data));
+        });
+    });
+    // EventSource reconnects on its own; these only track the connection state
+    source.onopen = onOpen || null;
+    source.onerror = onError || null;
+    return source;
+}
+
+function connectEvents() {
+    const localTopics = ['device', 'install', 'log'];
+    const serverTopics = ['progress', 'artifacts'];
+    const onLocalOpen = () => {
+        isLocalConnected = true;
+        updateClientInfo(true);
+        refreshDevices();
+    };
+    const onLocalError = () => {
+        isLocalConnected = false;
+        updateClientInfo(false);
+    };
+    if (LOCAL_API === SERVER_API) {
+        openEventSource(LOCAL_API, localTopics.concat(serverTopics), onLocalOpen, onLocalError);
+    } else {
+        openEventSource(LOCAL_API, localTopics, onLocalOpen, onLocalError);
+        openEventSource(SERVER_API, serverTopics, () => refreshApks());
+    }
+}
+
+function debounce(fn, delay) {
+    let timer = null;
+    return () => {
+        clearTimeout(timer);
+        timer = setTimeout(fn, delay);
+    };
+}
+
+const INSTALL_STEP_LABELS = {
+    fetching: '获取安装包',
+    preflight: '兼容性检查',
+    uninstalling: '卸载旧版本',
+    installing: '安装中',
+    launching: '启动应用'
+};
+
+function appendLog(line, time) {
+    const logArea = document.getElementById('logArea');
+    if (!logArea) return;
+    const stamp = (time ? new Date(time * 1000) : new Date()).toLocaleTimeString();
+    logArea.value += `[${stamp}] ${line}\n`;
+    logArea.scrollTop = logArea.scrollHeight;
+}
+
+onEvent('device', debounce(refreshDevices, 300));
+onEvent('artifacts', debounce(refreshApks, 300));
+onEvent('progress', data => {
+    if (!pgyerTaskId || data.task_id !== pgyerTaskId) return;
+    if (data.shared_with) {
+        // Same build as another task: follow that one
+        followPgyerTask(data.shared_with);
+        return;
+    }
+    renderPgyerProgress(data);
+});
+onEvent('install', data => {
+    if (data.serial !== activeInstallSerial || !INSTALL_STEP_LABELS[data.step]) return;
+    appendLog(`${INSTALL_STEP_LABELS[data.step]}${data.package_name ? ` (${data.package_name})` : ''}...`, data.time);
+});
+onEvent('log', data => {
+    if (activeInstallSerial && (data.level === 'WARNING' || data.level === 'ERROR')) {
+        appendLog(`⚠️ ${data.message}`, data.time);
+    }
+});
+
 // Toast Function
 // Toast Function
 function showToast(message, duration = 3000) {
@@ -167,9 +255,6 @@ async function refreshDevices() {
             }
         }
 
-        // Refresh APKs from Server
-        refreshApks();
-
     } catch (e) {
         console.error("Failed to fetch devices", e);
         updateClientInfo(false);
@@ -318,6 +403,12 @@ function updateTestControlOptions() {
     newSelect.value = newVal;
 }
 
+function getFileSha256(filename) {
+    const files = (selectedPlatform === 'ios' ? allFiles.ios : allFiles.android) || [];
+    const f = files.find(x => x.filename === filename);
+    return f && f.sha256 ? f.sha256 : null;
+}
+
 async function refreshApks() {
     try {
         const res = await fetch(`${SERVER_API}/apks`);
@@ -368,7 +459,7 @@ async function downloadPgyer() {
 
         const result = await res.json();
         if (result.status === 'started') {
-            pollPgyerProgress(result.task_id);
+            followPgyerTask(result.task_id);
         } else {
             showToast(`请求失败: ${result.message}`, 5000);
             setButtonLoading(btn, false);
@@ -381,41 +472,45 @@ async function downloadPgyer() {
     }
 }
 
-async function pollPgyerProgress(taskId) {
+async function followPgyerTask(taskId) {
+    // Updates arrive as "progress" events; fetch once for whatever happened before we subscribed
+    pgyerTaskId = taskId;
+    try {
+        const res = await fetch(`${SERVER_API}/pgyer/progress/${taskId}`);
+        const data = await res.json();
+        if (pgyerTaskId === taskId && data.status !== 'unknown') {
+            renderPgyerProgress(data);
+        }
+    } catch (e) {
+        console.error("Progress fetch error", e);
+    }
+}
+
+function renderPgyerProgress(data) {
     const btn = document.getElementById('btnPgyerDownload');
     const progressBar = document.getElementById('pgyerProgressBar');
     const progressText = document.getElementById('pgyerProgressText');
     const urlInput = document.getElementById('pgyerUrl');
 
-    try {
-        const res = await fetch(`${SERVER_API}/pgyer/progress/${taskId}`);
-        const data = await res.json();
-
-        if (data.percent !== undefined) {
-            progressBar.style.width = `${data.percent}%`;
-        }
-        if (data.message) {
-            progressText.textContent = data.message;
-        }
+    if (data.percent !== undefined) {
+        progressBar.style.width = `${data.percent}%`;
+    }
+    if (data.message) {
+        progressText.textContent = data.message;
+    }
 
-        if (data.status === 'success') {
-            showToast(`下载成功: ${data.filename}`, 3000);
-            setButtonLoading(btn, false);
-            urlInput.value = '';
-            refreshApks();
-            setTimeout(() => {
-                document.getElementById('pgyerProgress').style.display = 'none';
-            }, 3000);
-        } else if (data.status === 'error') {
-            showToast(`下载失败: ${data.message}`, 5000);
-            setButtonLoading(btn, false);
+    if (data.status === 'success') {
+        pgyerTaskId = null;
+        showToast(`下载成功: ${data.filename}`, 3000);
+        setButtonLoading(btn, false);
+        urlInput.value = '';
+        refreshApks();
+        setTimeout(() => {
             document.getElementById('pgyerProgress').style.display = 'none';
-        } else {
-            // Continue polling
-            setTimeout(() => pollPgyerProgress(taskId), 1000);
-        }
-    } catch (e) {
-        console.error("Polling error", e);
+        }, 3000);
+    } else if (data.status === 'error') {
+        pgyerTaskId = null;
+        showToast(`下载失败: ${data.message}`, 5000);
         setButtonLoading(btn, false);
         document.getElementById('pgyerProgress').style.display = 'none';
     }
@@ -536,6 +631,7 @@ async function runTestStep1() {
 
     const logArea = document.getElementById('logArea');
     logArea.value = `[${new Date().toLocaleTimeString()}] 开始第一步: 安装旧版本...\n`;
+    activeInstallSerial = deviceSerial;
 
     showToast("即将开始第一步：安装旧版本 App。请确保设备屏幕已解锁。", 2000);
 
@@ -560,7 +656,8 @@ async function runTestStep1() {
             body: JSON.stringify({
                 device_serial: deviceSerial,
                 old_apk_name: oldApk, // Still pass name for logging
-                apk_url: apkUrl // Pass URL for download
+                apk_url: apkUrl, // Pass URL for download
+                apk_sha256: getFileSha256(oldApk) // Lets the local service skip the download if it has this file
             })
         });
         const result = await res.json();
@@ -589,6 +686,7 @@ async function runTestStep1() {
         logArea.value += `[${new Date().toLocaleTimeString()}] ❌ 错误: ${e}\n`;
         showToast("请求错误：" + e);
     } finally {
+        activeInstallSerial = null;
         // Restore Button 1
         setButtonLoading(btn1, false);
     }
@@ -604,6 +702,7 @@ async function runTestStep2() {
     const logArea = document.getElementById('logArea');
 
     logArea.value += `\n[${new Date().toLocaleTimeString()}] 开始第二步: 覆盖安装新版本...\n`;
+    activeInstallSerial = deviceSerial;
 
     const btn2 = document.getElementById('btnStep2');
     setButtonLoading(btn2, true, "正在覆盖安装...");
@@ -621,7 +720,8 @@ async function runTestStep2() {
                 device_serial: deviceSerial,
                 new_apk_name: newApk,
                 package_name: currentPackageName,
-                apk_url: apkUrl
+                apk_url: apkUrl,
+                apk_sha256: getFileSha256(newApk)
             })
         });
         const result = await res.json();
@@ -639,6 +739,7 @@ async function runTestStep2() {
         logArea.value += `[${new Date().toLocaleTimeString()}] ❌ 错误: ${e}\n`;
         showToast("请求错误：" + e);
     } finally {
+        activeInstallSerial = null;
         setButtonLoading(btn2, false);
     }
 }
@@ -693,8 +794,9 @@ function handleFileSelect(input) {
 function initApp() {
     console.log("App initializing...");
     refreshDevices();
-    setInterval(refreshDevices, 5000);
     refreshApks();
+    // Devices, builds and progress are pushed from here on instead of polled
+    connectEvents();
 }
 
 if (document.readyState === 'loading') {
@@ -0,0 +1,140 @@
+import io
+import socket
+from loguru import logger
+from . import adb_protocol, axml
+from .http_client import default_client
+
+MIN_STREAM_SDK = 24  # First release whose `cmd package install` reads the APK from stdin
+CHUNK_SIZE = 1024 * 1024
+
+
+class StreamUnavailable(Exception):
+    """The APK can't be streamed (nothing was sent yet); stage it on disk instead."""
+
+
+class StreamInstallError(Exception):
+    pass
+
+
+class _RangeReader(io.RawIOBase):
+    """Seekable read-only view of a remote file, one HTTP Range request per read."""
+
+    def __init__(self, session, url, size):
+        self.session = session
+        self.url = url
+        self.size = size
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.pos, io.SEEK_END: self.size}[whence]
+        self.pos = max(0, base + offset)
+        return self.pos
+
+    def readinto(self, buffer):
+        if self.pos >= self.size or not len(buffer):
+            return 0
+        end = min(self.pos + len(buffer), self.size) - 1
+        r = self.session.get(self.url, headers={"Range": f"bytes={self.pos}-{end}"})
+        if r.status_code != 206:
+            raise StreamUnavailable(f"Range request answered with {r.status_code}")
+        data = r.content[:len(buffer)]
+        buffer[:len(data)] = data
+        self.pos += len(data)
+        return len(data)
+
+
+class StreamInstaller:
+    """
+    Installs an APK straight from its URL: the HTTP body is piped into
+    `cmd package install -S <size>` on an adb `exec:` stream, so nothing is
+    staged on the local disk and the device starts receiving with the first
+    bytes instead of after the whole download.
+
+    Needs a Content-Length (pm must be told the size up front) and API 24+.
+    The manifest is read beforehand with a few Range requests, since the
+    install flow needs the package name before any byte is sent.
+    """
+
+    def __init__(self, http_client=None, adb_host=adb_protocol.DEFAULT_HOST, adb_port=adb_protocol.DEFAULT_PORT,
+                 timeout=120.0, install_timeout=900.0):
+        self.http = http_client or default_client
+        self.adb_host = adb_host
+        self.adb_port = adb_port
+        # Socket timeout while connecting and sending
+        self.timeout = timeout
+        # Wait for pm's verdict once everything is sent: verification and dex2oat of a big APK take a while
+        self.install_timeout = install_timeout
+
+    def read_manifest(self, url):
+        """axml.read_manifest of a remote APK, reading only the zip directory and the manifest entry."""
+        session = self.http.session()
+        with session.get(url, headers={"Range": "bytes=0-0"}, stream=True) as probe:
+            probe.raise_for_status()
+            total = probe.headers.get("Content-Range", "").rsplit("/", 1)[-1]
+            if probe.status_code != 206 or not total.isdigit():
+                raise StreamUnavailable("Server doesn't support Range requests")
+        with io.BufferedReader(_RangeReader(session, url, int(total)), buffer_size=64 * 1024) as f:
+            return axml.read_manifest(f)
+
+    def install(self, serial, url, flags=("-r",)):
+        """
+        Stream `url` into pm on `serial`. Returns pm's output; raises StreamUnavailable
+        if the response can't be streamed, StreamInstallError if the install failed.
+        """
+        with self.http.get(url, stream=True) as r:
+            r.raise_for_status()
+            size = r.headers.get("Content-Length")
+            if not size or not size.isdigit():
+                raise StreamUnavailable("No Content-Length")
+            if r.headers.get("Content-Encoding", "identity") != "identity":
+                raise StreamUnavailable(f"Body is {r.headers['Content-Encoding']}-encoded")
+            size = int(size)
+
+            service = f"exec:cmd package install {' '.join(flags)} -S {size}"
+            sock = adb_protocol.open_device_service(serial, service, self.adb_host, self.adb_port, self.timeout)
+            try:
+                sent = 0
+                for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                    try:
+                        sock.sendall(chunk)
+                    except OSError as e:
+                        # pm gave up early (bad signature, no space, ...) and closed its end
+                        output = self._read_output(sock, 5.0)
+                        raise StreamInstallError(f"Install failed: {output or e}")
+                    sent += len(chunk)
+                if sent != size:
+                    raise StreamInstallError(f"Download ended after {sent} of {size} bytes")
+                output = self._read_output(sock, self.install_timeout)
+            finally:
+                sock.close()
+
+        if "Success" not in output:
+            raise StreamInstallError(f"Install failed: {output}")
+        logger.info(f"Streamed {size} bytes from {url} into pm on {serial}")
+        return output
+
+    def _read_output(self, sock, timeout):
+        """Whatever pm prints until it closes the stream (or `timeout` passes)."""
+        sock.settimeout(timeout)
+        output = bytearray()
+        try:
+            while True:
+                data = sock.recv(4096)
+                if not data:
+                    break
+                output.extend(data)
+        except socket.timeout:
+            if not output:
+                raise StreamInstallError(f"No answer from pm within {timeout:.0f}s")
+        except OSError:
+            pass  # Connection reset after pm printed its verdict
+        return output.decode("utf-8", errors="replace").strip()
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import threading
+from loguru import logger
+
+FINISHED_STATUSES = ("success", "error", "shared")
+
+
+class TaskRegistry:
+    """
+    Thread-safe progress entries of background tasks, keyed by task id.
+
+    Finished tasks (see FINISHED_STATUSES) expire `ttl` seconds after their
+    last update, and the registry never holds more than `max_tasks` entries:
+    the oldest finished ones go first, then the oldest active ones. Readers
+    get copies taken under the lock, never the live dicts.
+
+    With `path`, entries are saved as JSON (at most every `save_interval`
+    seconds while a task runs, immediately when one finishes) and reloaded on
+    start; tasks that were still running at that point are marked as failed.
+    """
+
+    def __init__(self, ttl=3600, max_tasks=1000, path=None, save_interval=2.0):
+        self.ttl = ttl
+        self.max_tasks = max_tasks
+        self.path = path
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._tasks = {}  # task_id -> entry, in creation order
+        self._saved_at = 0.0
+        self._dirty = False
+        if path:
+            self._load()
+
+    def set(self, task_id, **fields):
+        """Replace the entry of `task_id` with `fields`; returns a copy."""
+        return self._write(task_id, fields, replace=True)
+
+    def update(self, task_id, **fields):
+        """Merge `fields` into the entry of `task_id`; returns a copy."""
+        return self._write(task_id, fields, replace=False)
+
+    def get(self, task_id):
+        with self._lock:
+            entry = self._tasks.get(task_id)
+            return dict(entry) if entry else None
+
+    def list(self, active_only=False):
+        """Copies of all entries (or only unfinished ones), oldest first, each with its task_id."""
+        with self._lock:
+            self._evict(time.time())
+            return [dict(entry, task_id=task_id) for task_id, entry in self._tasks.items()
+                    if not active_only or entry.get("status") not in FINISHED_STATUSES]
+
+    def active(self):
+        return self.list(active_only=True)
+
+    def discard(self, task_id):
+        with self._lock:
+            if self._tasks.pop(task_id, None) is not None:
+                self._dirty = True
+
+    def flush(self):
+        """Write pending changes to disk, e.g. on shutdown."""
+        if not self.path:
+            return
+        with self._lock:
+            if self._dirty:
+                self._save(time.time())
+
+    def _write(self, task_id, fields, replace):
+        now = time.time()
+        with self._lock:
+            entry = self._tasks.get(task_id)
+            if entry is None or replace:
+                created_at = entry["created_at"] if entry else now
+                entry = self._tasks[task_id] = {"created_at": created_at}
+            entry.update(fields)
+            entry["updated_at"] = now
+            snapshot = dict(entry)
+            self._evict(now)
+            self._dirty = True
+            if self.path and (snapshot.get("status") in FINISHED_STATUSES or now - self._saved_at >= self.save_interval):
+                self._save(now)
+        return snapshot
+
+    def _evict(self, now):
+        expired = [task_id for task_id, entry in self._tasks.items()
+                   if entry.get("status") in FINISHED_STATUSES and now - entry["updated_at"] >= self.ttl]
+        for task_id in expired:
+            del self._tasks[task_id]
+        overflow = len(self._tasks) - self.max_tasks
+        if overflow > 0:
+            finished = [t for t, e in self._tasks.items() if e.get("status") in FINISHED_STATUSES]
+            active = [t for t, e in self._tasks.items() if e.get("status") not in FINISHED_STATUSES]
+            for task_id in (finished + active)[:overflow]:
+                if self._tasks[task_id].get("status") not in FINISHED_STATUSES:
+                    logger.warning(f"Task registry full, dropping active task {task_id}")
+                del self._tasks[task_id]
+        if expired or overflow > 0:
+            self._dirty = True
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                tasks = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable task registry {self.path}: {e}")
+            return
+        now = time.time()
+        for entry in tasks.values():
+            if entry.get("status") not in FINISHED_STATUSES:
+                # Whatever was running died with the previous process
+                entry.update(status="error", message="服务重启，任务已中断", updated_at=now)
+        self._tasks = tasks
+        self._evict(now)
+
+    def _save(self, now):
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(self._tasks, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not save task registry {self.path}: {e}")
+            return
+        self._saved_at = now
+        self._dirty = False
@@ -1,36 +1,117 @@
 import time
+import functools
 import adbutils
+from contextlib import nullcontext
 from loguru import logger
 import os
 from fastapi.concurrency import run_in_threadpool
+from .http_client import default_client
+from .axml import Reference
+from .stream_installer import StreamInstaller, StreamUnavailable, MIN_STREAM_SDK
+
+def wait_until(predicate, timeout, interval=0.1, max_interval=1.0):
+    """
+    Poll `predicate` with exponential backoff until it returns a truthy value
+    or `timeout` seconds pass. Exceptions count as "not yet".
+    Returns (ok, elapsed_seconds).
+    """
+    started = time.monotonic()
+    while True:
+        try:
+            if predicate():
+                return True, time.monotonic() - started
+        except Exception as e:
+            logger.debug(f"Readiness check not satisfied yet: {e}")
+        elapsed = time.monotonic() - started
+        if elapsed >= timeout:
+            return False, elapsed
+        time.sleep(min(interval, timeout - elapsed))
+        interval = min(interval * 2, max_interval)
+
+def reports_steps(action):
+    """
+    Publish "started"/"finished" install events around an install step.
+    "finished" is sent even if the step raises, with the error as its result.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(self, serial, *args, **kwargs):
+            self._emit(serial, "started", action=action)
+            result = None
+            try:
+                result = func(self, serial, *args, **kwargs)
+                return result
+            except Exception as e:
+                result = {"status": "error", "message": str(e), "error_type": type(e).__name__}
+                raise
+            finally:
+                self._emit(serial, "finished", action=action, result=result)
+        return wrapper
+    return decorate
 
 class TestRunner:
-    def __init__(self, device_manager, apk_manager):
+    def __init__(self, device_manager, apk_manager, artifact_cache=None, leases=None,
+                 launch_timeout=20.0, uninstall_timeout=10.0, compatibility=None, http_client=None,
+                 events=None, stream_installer=None):
         self.device_manager = device_manager
         self.apk_manager = apk_manager
+        # Optional ArtifactCache; without it remote files go to a throwaway temp file
+        self.artifact_cache = artifact_cache
+        # Optional DeviceLeases; the async wrappers refuse to touch a device someone else holds
+        self.leases = leases
+        # Ceilings for the readiness polls that replace fixed sleeps
+        self.launch_timeout = launch_timeout
+        self.uninstall_timeout = uninstall_timeout
+        # Optional CompatibilityChecker; rejects builds the device can't take before the upload
+        self.compatibility = compatibility
+        self.http = http_client or default_client
+        # Optional EventBus; install steps are pushed as "install" events while they run
+        self.events = events
+        # Used by install_mode="stream" to pipe remote APKs into pm without staging them
+        self.stream_installer = stream_installer or StreamInstaller(self.http)
+
+    def _emit(self, serial, step, **data):
+        if self.events:
+            self.events.publish("install", {"serial": serial, "step": step, "time": time.time(), **data})
 
-    async def install_old_apk(self, serial, old_apk_name, apk_url=None):
+    def _with_lease(self, serial, func, *args):
+        if not self.leases:
+            return func(serial, *args)
+        owner = f"request:{func.__name__}"
+        if not self.leases.try_acquire(serial, owner):
+            return {"status": "failed", "reason": f"Device is busy ({self.leases.holder(serial)}). Try again later."}
+        try:
+            return func(serial, *args)
+        finally:
+            self.leases.release(serial, owner)
+
+    async def install_old_apk(self, serial, old_apk_name, apk_url=None, apk_sha256=None, install_mode=None):
         """Step 1: Install Old APK (Async wrapper)"""
-        return await run_in_threadpool(self._install_old_sync, serial, old_apk_name, apk_url)
+        return await run_in_threadpool(self._with_lease, serial, self._install_old_sync, old_apk_name, apk_url, apk_sha256,
+                                       install_mode)
 
-    def _install_old_sync(self, serial, old_apk_name, apk_url=None):
+    @reports_steps("install_old")
+    def _install_old_sync(self, serial, old_apk_name, apk_url=None, apk_sha256=None, install_mode=None):
         platform = self.device_manager.get_platform(serial)
         if platform == "ios":
-            return self._install_ios_sync(serial, old_apk_name, apk_url, uninstall_first=True)
+            return self._install_ios_sync(serial, old_apk_name, apk_url, uninstall_first=True, apk_sha256=apk_sha256)
             
         # Android Logic
         device = self.device_manager.get_device(serial)
-        temp_file_path = None 
+        old_apk_path, is_temp = None, False
 
         try:
-            old_apk_path, is_temp = self._get_apk_path(old_apk_name, apk_url)
-            if is_temp:
-                temp_file_path = old_apk_path
+            if install_mode == "stream":
+                result = self._stream_install_old(serial, device, apk_url, apk_sha256)
+                if result:
+                    return result
 
-            if not self.device_manager.is_screen_on(device):
-                return {"status": "failed", "reason": "Screen is OFF. Please turn it on."}
-            if not self.device_manager.is_unlocked(device):
-                return {"status": "failed", "reason": "Device is LOCKED. Please unlock it."}
+            self._emit(serial, "fetching", artifact=old_apk_name or apk_url)
+            old_apk_path, is_temp = self._get_apk_path(old_apk_name, apk_url, apk_sha256)
+
+            not_ready = self._check_ready(device)
+            if not_ready:
+                return not_ready
 
             if not os.path.exists(old_apk_path):
                  return {"status": "failed", "reason": "Old APK file not found."}
@@ -40,21 +121,29 @@ class TestRunner:
             if package_name == "Unknown":
                  return {"status": "failed", "reason": "Could not parse package name from APK."}
 
+            self._emit(serial, "preflight", package_name=package_name)
+            rejected = self._preflight(serial, old_apk_path)
+            if rejected:
+                return rejected
+
             logger.info(f"Step 1: Installing Old APK {old_apk_name or apk_url} ({package_name} v{vn}) on {serial}")
 
             logger.info(f"Uninstalling {package_name}...")
+            self._emit(serial, "uninstalling", package_name=package_name)
             device.uninstall(package_name)
-            time.sleep(1)
+            gone, _ = wait_until(lambda: not self._is_package_installed(device, package_name), self.uninstall_timeout)
+            if not gone:
+                logger.warning(f"{package_name} still installed after {self.uninstall_timeout}s")
 
             logger.info("Installing Old APK...")
+            self._emit(serial, "installing", package_name=package_name)
             device.install(old_apk_path, nolaunch=True, flags=['-r', '-t'])
+            self._forget_package(serial, package_name)
 
             logger.info("Launching Old App...")
-            self._launch_android_app(device, package_name)
-            time.sleep(5)
-
-            current = device.app_current()
-            if current.package != package_name:
+            self._emit(serial, "launching", package_name=package_name)
+            launched, latency = self._launch_and_wait(device, package_name)
+            if not launched:
                  logger.warning("App might not have started correctly.")
 
             return {
@@ -62,38 +151,45 @@ class TestRunner:
                 "message": f"Old APK Installed: {package_name} (v{vn})",
                 "package_name": package_name,
                 "version_name": vn,
-                "version_code": vc
+                "version_code": vc,
+                "launch_latency_ms": latency
             }
 
         except Exception as e:
             logger.exception("Install Old APK failed")
-            return {"status": "error", "message": str(e)}
+            return {"status": "error", "message": str(e), "error_type": type(e).__name__}
         finally:
-            if temp_file_path and os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
+            self._release_apk_path(old_apk_path, is_temp)
 
 
-    async def install_new_apk(self, serial, new_apk_name=None, package_name=None, apk_url=None):
+    async def install_new_apk(self, serial, new_apk_name=None, package_name=None, apk_url=None, apk_sha256=None,
+                              install_mode=None):
         """Step 2: Install New APK (Async wrapper)"""
         if not new_apk_name and not apk_url:
             return {"status": "failed", "reason": "Either new_apk_name or apk_url must be provided."}
         if not package_name:
             return {"status": "failed", "reason": "package_name is required for new APK installation."}
-        return await run_in_threadpool(self._install_new_sync, serial, new_apk_name, package_name, apk_url)
+        return await run_in_threadpool(self._with_lease, serial, self._install_new_sync, new_apk_name, package_name, apk_url,
+                                       apk_sha256, install_mode)
 
-    def _install_new_sync(self, serial, new_apk_name, package_name, apk_url):
+    @reports_steps("install_new")
+    def _install_new_sync(self, serial, new_apk_name, package_name, apk_url, apk_sha256=None, install_mode=None):
         platform = self.device_manager.get_platform(serial)
         if platform == "ios":
-            return self._install_ios_sync(serial, new_apk_name, apk_url, uninstall_first=False, expected_package=package_name)
+            return self._install_ios_sync(serial, new_apk_name, apk_url, uninstall_first=False, expected_package=package_name, apk_sha256=apk_sha256)
 
         # Android Logic
         device = self.device_manager.get_device(serial)
-        temp_file_path = None
+        new_apk_path, is_temp = None, False
 
         try:
-            new_apk_path, is_temp = self._get_apk_path(new_apk_name, apk_url)
-            if is_temp:
-                temp_file_path = new_apk_path
+            if install_mode == "stream":
+                result = self._stream_install_new(serial, device, package_name, apk_url, apk_sha256)
+                if result:
+                    return result
+
+            self._emit(serial, "fetching", artifact=new_apk_name or apk_url)
+            new_apk_path, is_temp = self._get_apk_path(new_apk_name, apk_url, apk_sha256)
 
             if not os.path.exists(new_apk_path):
                  return {"status": "failed", "reason": "New APK file not found."}
@@ -104,42 +200,91 @@ class TestRunner:
             if new_pkg != "Unknown" and new_pkg != package_name:
                 return {"status": "failed", "reason": f"Package name mismatch! Old: {package_name}, New: {new_pkg}"}
 
+            self._emit(serial, "preflight", package_name=package_name)
+            rejected = self._preflight(serial, new_apk_path, replace=True, device=device)
+            if rejected:
+                return rejected
+
             logger.info(f"Step 2: Updating to New APK {new_apk_name or apk_url} ({new_pkg} v{new_ver})")
 
+            self._emit(serial, "installing", package_name=package_name)
             device.install(new_apk_path, nolaunch=True, flags=['-r'])
+            self._forget_package(serial, package_name)
             
             logger.info("Launching New App...")
-            self._launch_android_app(device, package_name)
-            time.sleep(5)
+            self._emit(serial, "launching", package_name=package_name)
+            launched, latency = self._launch_and_wait(device, package_name)
 
-            current = device.app_current()
-            if current.package == package_name:
+            if launched:
                 return {
                     "status": "success", 
-                    "message": f"Update Success! App is running. Version: {new_ver} ({new_code})"
+                    "message": f"Update Success! App is running. Version: {new_ver} ({new_code})",
+                    "launch_latency_ms": latency
                 }
             else:
+                try:
+                    current_package = device.app_current().package
+                except Exception:
+                    current_package = "unknown"
                 return {
                     "status": "failed", 
-                    "reason": f"App is not in foreground after update. Current: {current.package}"
+                    "reason": f"App is not in foreground after {self.launch_timeout}s. Current: {current_package}"
                 }
 
         except Exception as e:
             logger.exception("Install New APK failed")
-            return {"status": "error", "message": str(e)}
+            return {"status": "error", "message": str(e), "error_type": type(e).__name__}
         finally:
-            if temp_file_path and os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
+            self._release_apk_path(new_apk_path, is_temp)
+
+    def _run_upgrade_sync(self, serial, pair, step_guard=None):
+        """
+        Full upgrade test for one (old, new) pair: install old -> launch -> install new -> verify.
+        `step_guard` is an optional context manager held around each install step.
+        """
+        started = time.time()
+        result = {"pair": pair, "status": "failed", "step1": None, "step2": None}
+
+        rejected = self._preflight_pair(serial, pair)
+        if rejected:
+            result.update(rejected)
+            result["message"] = rejected["reason"]
+            result["duration"] = round(time.time() - started, 2)
+            return result
 
-    def _install_ios_sync(self, serial, filename, apk_url, uninstall_first=False, expected_package=None):
+        with step_guard or nullcontext():
+            step1 = self._install_old_sync(
+                serial, pair.get("old_apk_name"), pair.get("old_apk_url"), pair.get("old_apk_sha256"),
+                pair.get("install_mode"))
+        result["step1"] = step1
+        if step1.get("status") != "success":
+            result["status"] = step1.get("status", "failed")
+            result["message"] = step1.get("message") or step1.get("reason")
+            result["error_type"] = step1.get("error_type")
+            result["duration"] = round(time.time() - started, 2)
+            return result
+
+        package_name = step1.get("package_name")
+        with step_guard or nullcontext():
+            step2 = self._install_new_sync(
+                serial, pair.get("new_apk_name"), package_name, pair.get("new_apk_url"), pair.get("new_apk_sha256"),
+                pair.get("install_mode"))
+        result["step2"] = step2
+        result["status"] = step2.get("status", "failed")
+        result["message"] = step2.get("message") or step2.get("reason")
+        result["error_type"] = step2.get("error_type")
+        result["duration"] = round(time.time() - started, 2)
+        return result
+
+    def _install_ios_sync(self, serial, filename, apk_url, uninstall_first=False, expected_package=None, apk_sha256=None):
         device = self.device_manager.get_ios_device(serial)
         if not device:
              return {"status": "failed", "reason": "Device not found or not iOS"}
         
-        temp_file_path = None
+        file_path, is_temp = None, False
         try:
-            file_path, is_temp = self._get_apk_path(filename, apk_url)
-            if is_temp: temp_file_path = file_path
+            self._emit(serial, "fetching", artifact=filename or apk_url)
+            file_path, is_temp = self._get_apk_path(filename, apk_url, apk_sha256)
             
             if not os.path.exists(file_path):
                 return {"status": "failed", "reason": "File not found"}
@@ -152,19 +297,27 @@ class TestRunner:
             if expected_package and pkg != expected_package:
                  return {"status": "failed", "reason": f"Package mismatch: {pkg} != {expected_package}"}
 
+            self._emit(serial, "preflight", package_name=pkg)
+            rejected = self._preflight(serial, file_path)
+            if rejected:
+                return rejected
+
             logger.info(f"Installing IPA {pkg} on {serial} (Uninstall first: {uninstall_first})...")
             
             if uninstall_first:
                 try:
                     logger.info(f"Uninstalling {pkg}...")
+                    self._emit(serial, "uninstalling", package_name=pkg)
                     device.app_uninstall(pkg)
                 except:
                     pass
             
             logger.info("Installing IPA...")
+            self._emit(serial, "installing", package_name=pkg)
             device.app_install(file_path)
             
             logger.info("Launching App...")
+            self._emit(serial, "launching", package_name=pkg)
             try:
                 device.app_start(pkg)
             except Exception as e:
@@ -179,14 +332,171 @@ class TestRunner:
             }
         except Exception as e:
             logger.exception("iOS Install failed")
-            return {"status": "error", "message": str(e)}
+            return {"status": "error", "message": str(e), "error_type": type(e).__name__}
         finally:
-             if temp_file_path and os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
+            self._release_apk_path(file_path, is_temp)
+
+    def _stream_install_old(self, serial, device, apk_url, apk_sha256=None):
+        """Step 1 with the APK piped from apk_url into pm. None means stage it as usual instead."""
+        info = self._stream_manifest(serial, device, apk_url, apk_sha256)
+        if not info or info.get("status"):
+            return info
+        package_name, vn, vc = info["package_name"], info["version_name"], info["version_code"]
+
+        not_ready = self._check_ready(device)
+        if not_ready:
+            return not_ready
+
+        logger.info(f"Step 1: Streaming Old APK {apk_url} ({package_name} v{vn}) to {serial}")
+        self._emit(serial, "uninstalling", package_name=package_name)
+        device.uninstall(package_name)
+        gone, _ = wait_until(lambda: not self._is_package_installed(device, package_name), self.uninstall_timeout)
+        if not gone:
+            logger.warning(f"{package_name} still installed after {self.uninstall_timeout}s")
+
+        self._emit(serial, "installing", package_name=package_name, streamed=True)
+        if not self._stream_to_device(serial, apk_url, ("-r", "-t")):
+            return None
+        self._forget_package(serial, package_name)
+
+        self._emit(serial, "launching", package_name=package_name)
+        launched, latency = self._launch_and_wait(device, package_name)
+        if not launched:
+            logger.warning("App might not have started correctly.")
+        return {
+            "status": "success",
+            "message": f"Old APK Installed: {package_name} (v{vn})",
+            "package_name": package_name,
+            "version_name": vn,
+            "version_code": vc,
+            "launch_latency_ms": latency,
+            "streamed": True
+        }
+
+    def _stream_install_new(self, serial, device, package_name, apk_url, apk_sha256=None):
+        """Step 2 with the APK piped from apk_url into pm. None means stage it as usual instead."""
+        info = self._stream_manifest(serial, device, apk_url, apk_sha256)
+        if not info or info.get("status"):
+            return info
+        if info["package_name"] != package_name:
+            return {"status": "failed", "reason": f"Package name mismatch! Old: {package_name}, New: {info['package_name']}"}
+
+        logger.info(f"Step 2: Streaming New APK {apk_url} ({package_name} v{info['version_name']}) to {serial}")
+        self._emit(serial, "installing", package_name=package_name, streamed=True)
+        if not self._stream_to_device(serial, apk_url, ("-r",)):
+            return None
+        self._forget_package(serial, package_name)
+
+        self._emit(serial, "launching", package_name=package_name)
+        launched, latency = self._launch_and_wait(device, package_name)
+        if not launched:
+            return {"status": "failed", "reason": f"App is not in foreground after {self.launch_timeout}s."}
+        return {
+            "status": "success",
+            "message": f"Update Success! App is running. Version: {info['version_name']} ({info['version_code']})",
+            "launch_latency_ms": latency,
+            "streamed": True
+        }
+
+    def _stream_manifest(self, serial, device, apk_url, apk_sha256=None):
+        """
+        Package and version of a remote APK when it can be streamed to `device`, read with
+        a few Range requests. Returns None when streaming doesn't apply, or a failure result.
+        """
+        if not apk_url or self.apk_manager.resolve_local(apk_url, apk_sha256):
+            return None  # Local copies are installed in place anyway
+        try:
+            sdk = int(device.prop.get("ro.build.version.sdk") or 0)
+            if sdk < MIN_STREAM_SDK:
+                logger.info(f"{serial} runs API {sdk}, streamed install needs {MIN_STREAM_SDK}+; staging instead")
+                return None
+            manifest = self.stream_installer.read_manifest(apk_url)
+        except Exception as e:
+            logger.info(f"Can't stream {apk_url} ({e}); staging instead")
+            return None
+
+        values = (manifest.get("package"), manifest.get("versionName"), manifest.get("versionCode"))
+        if any(v is None or v == "" or isinstance(v, Reference) for v in values):
+            return None  # Missing or needs resources.arsc; the staged path parses it fully
+        min_sdk = next((attrs.get("minSdkVersion") for tag, attrs in manifest["elements"] if tag == "uses-sdk"), None)
+        if isinstance(min_sdk, int) and not isinstance(min_sdk, Reference) and min_sdk > sdk:
+            return {"status": "failed",
+                    "reason": f"Incompatible with {serial}: minSdkVersion {min_sdk} is above the device API level {sdk}"}
+        return {"package_name": values[0], "version_name": str(values[1]), "version_code": str(values[2])}
+
+    def _stream_to_device(self, serial, apk_url, flags):
+        """Pipe apk_url into pm; False if it turned out not to be streamable (nothing installed)."""
+        try:
+            self.stream_installer.install(serial, apk_url, flags)
+            return True
+        except StreamUnavailable as e:
+            logger.info(f"Can't stream {apk_url} ({e}); staging instead")
+            return False
+
+    def _check_ready(self, device):
+        """Failure result if the screen is off or the device locked, else None (one parallel probe)."""
+        state = self.device_manager.probe_state(device)
+        if not state["screen_on"]:
+            return {"status": "failed", "reason": "Screen is OFF. Please turn it on."}
+        if not state["unlocked"]:
+            return {"status": "failed", "reason": "Device is LOCKED. Please unlock it."}
+        return None
+
+    def _preflight(self, serial, file_path, replace=False, device=None):
+        """Return a failure result if the build can't be installed on `serial`, else None."""
+        if not self.compatibility:
+            return None
+        try:
+            verdict = self.compatibility.check(serial, file_path, replace=replace, device=device)
+        except Exception as e:
+            logger.warning(f"Pre-flight check for {serial} skipped: {e}")
+            return None
+        if verdict["compatible"]:
+            return None
+        reasons = "; ".join(p["reason"] for p in verdict["problems"])
+        return {"status": "failed", "reason": f"Incompatible with {serial}: {reasons}", "problems": verdict["problems"]}
+
+    def _preflight_pair(self, serial, pair):
+        """Check both builds of an upgrade pair up front when both are already local."""
+        if not self.compatibility:
+            return None
+        old_path = self._local_apk_path(pair.get("old_apk_name"), pair.get("old_apk_url"), pair.get("old_apk_sha256"))
+        new_path = self._local_apk_path(pair.get("new_apk_name"), pair.get("new_apk_url"), pair.get("new_apk_sha256"))
+        if not old_path or not new_path:
+            return None  # Remote builds are checked per step once downloaded
+        try:
+            verdict = self.compatibility.check_pair(serial, old_path, new_path)
+        except Exception as e:
+            logger.warning(f"Pre-flight check for {serial} skipped: {e}")
+            return None
+        if verdict["compatible"]:
+            return None
+        reasons = "; ".join(f"{p['build']}: {p['reason']}" for p in verdict["problems"])
+        return {"status": "failed", "reason": f"Incompatible with {serial}: {reasons}", "problems": verdict["problems"]}
+
+    def _forget_package(self, serial, package_name):
+        if self.compatibility:
+            self.compatibility.forget(serial, package_name)
+
+    def _local_apk_path(self, apk_name, apk_url, apk_sha256=None):
+        """Path of a build that is already on disk, without downloading anything."""
+        local_path = self.apk_manager.resolve_local(apk_url, apk_sha256)
+        if local_path:
+            return local_path
+        if apk_name and not apk_url:
+            path = self.apk_manager.get_apk_path(apk_name)
+            if path and os.path.isfile(path):
+                return path
+        return None
+
+    def _get_apk_path(self, apk_name, apk_url, apk_sha256=None):
+        # Files already in the local store are installed in place
+        local_path = self.apk_manager.resolve_local(apk_url, apk_sha256)
+        if local_path:
+            logger.info(f"Using local copy {local_path} for {apk_url or apk_sha256}")
+            return local_path, False
 
-    def _get_apk_path(self, apk_name, apk_url):
         if apk_url:
-            import requests
             import tempfile
             logger.info(f"Downloading file from {apk_url}...")
             try:
@@ -194,23 +504,52 @@ class TestRunner:
                 suffix = ".apk"
                 if ".ipa" in apk_url.lower():
                     suffix = ".ipa"
+
+                if self.artifact_cache:
+                    return self.artifact_cache.fetch(apk_url, suffix), False
                 
                 fd, temp_path = tempfile.mkstemp(suffix=suffix)
                 os.close(fd)
-                with requests.get(apk_url, stream=True) as r:
+                with self.http.get(apk_url, stream=True) as r:
                     r.raise_for_status()
                     with open(temp_path, 'wb') as f:
-                        for chunk in r.iter_content(chunk_size=8192):
+                        for chunk in r.iter_content(chunk_size=1024 * 1024):
                             f.write(chunk)
                 return temp_path, True
             except Exception as e:
                 raise Exception(f"Failed to download file: {e}")
-                raise Exception(f"Failed to download APK: {e}")
         elif apk_name:
-            apk_path = os.path.join("apks", apk_name)
+            apk_path = self.apk_manager.get_apk_path(apk_name)
             return apk_path, False
         else:
             raise ValueError("Neither apk_name nor apk_url provided")
 
+    def _release_apk_path(self, path, is_temp):
+        """Give back a path obtained from _get_apk_path."""
+        if not path:
+            return
+        if is_temp:
+            if os.path.exists(path):
+                os.remove(path)
+        elif self.artifact_cache and self.artifact_cache.owns(path):
+            self.artifact_cache.release(path)
+
     def _launch_android_app(self, device, package_name):
         device.shell(f"monkey -p {package_name} -c android.intent.category.LAUNCHER 1")
+
+    def _launch_and_wait(self, device, package_name):
+        """
+        Launch the app and poll until it is in the foreground.
+        Returns (in_foreground, time_to_foreground_ms or None).
+        """
+        started = time.monotonic()
+        self._launch_android_app(device, package_name)
+        ok, _ = wait_until(lambda: device.app_current().package == package_name, self.launch_timeout)
+        if not ok:
+            return False, None
+        latency = int((time.monotonic() - started) * 1000)
+        logger.info(f"{package_name} reached the foreground in {latency} ms")
+        return True, latency
+
+    def _is_package_installed(self, device, package_name):
+        return bool(device.shell(f"pm path {package_name}").strip())
@@ -0,0 +1,85 @@
+import os
+import struct
+import zipfile
+import pytest
+
+ANDROID_NS = "http://schemas.android.com/apk/res/android"
+
+
+def _string_pool(strings, utf8):
+    offsets, body = [], b""
+    for s in strings:
+        offsets.append(len(body))
+        if utf8:
+            encoded = s.encode("utf-8")
+            body += bytes([len(s), len(encoded)]) + encoded + b"\0"
+        else:
+            body += struct.pack("<H", len(s)) + s.encode("utf-16-le") + b"\0\0"
+    body += b"\0" * (-len(body) % 4)
+    start = 28 + 4 * len(offsets)
+    header = struct.pack("<HHIIIIII", 0x0001, 28, start + len(body), len(strings), 0,
+                         0x100 if utf8 else 0, start, 0)
+    return header + struct.pack(f"<{len(offsets)}I", *offsets) + body
+
+
+def _node(chunk_type, *fields):
+    body = struct.pack("<II", 1, 0xFFFFFFFF) + struct.pack(f"<{len(fields)}I", *fields)
+    return struct.pack("<HHI", chunk_type, 16, 8 + len(body)) + body
+
+
+def _start_element(name, attributes):
+    # attributes: (namespace, name, raw value, data type, data)
+    attrs = b"".join(struct.pack("<IIIHBBI", ns, attr, raw, 8, 0, data_type, data)
+                     for ns, attr, raw, data_type, data in attributes)
+    ext = struct.pack("<IIHHHHHH", 0xFFFFFFFF, name, 20, 20, len(attributes), 0, 0, 0)
+    body = struct.pack("<II", 1, 0xFFFFFFFF) + ext + attrs
+    return struct.pack("<HHI", 0x0102, 16, 8 + len(body)) + body
+
+
+def build_manifest(package="com.example.demo", version_code=42, version_name="1.2.3", min_sdk=21,
+                   utf8=False, obfuscated=False, version_name_ref=None):
+    """
+    Binary AndroidManifest.xml with <manifest>, <uses-sdk> and <application>, as aapt2 lays it out.
+    With `version_name_ref`, versionName points at that resource id instead of holding a string.
+    """
+    attribute_names = ["", "", ""] if obfuscated else ["versionCode", "versionName", "minSdkVersion"]
+    strings = attribute_names + ["package", "android", ANDROID_NS, "manifest", "uses-sdk", "application",
+                                 package, version_name]
+    ns, none = 5, 0xFFFFFFFF
+    resource_map = [0x0101021B, 0x0101021C, 0x0101020C]
+    chunks = _string_pool(strings, utf8)
+    chunks += struct.pack("<HHI", 0x0180, 8, 8 + 4 * len(resource_map))
+    chunks += struct.pack(f"<{len(resource_map)}I", *resource_map)
+    chunks += _node(0x0100, 4, ns)
+    version_name_attr = (ns, 1, none, 0x01, version_name_ref) if version_name_ref else (ns, 1, 10, 0x03, 10)
+    chunks += _start_element(6, [(ns, 0, none, 0x10, version_code), version_name_attr, (none, 3, 9, 0x03, 9)])
+    chunks += _start_element(7, [(ns, 2, none, 0x10, min_sdk)]) + _node(0x0103, none, 7)
+    chunks += _start_element(8, []) + _node(0x0103, none, 8)
+    chunks += _node(0x0103, none, 6) + _node(0x0101, 4, ns)
+    return struct.pack("<HHI", 0x0003, 8, 8 + len(chunks)) + chunks
+
+
+@pytest.fixture
+def make_apk(tmp_path):
+    """make_apk(name, padding=0, **manifest) writes an APK into tmp_path, `padding` random bytes bigger."""
+    def make(name="demo.apk", padding=0, **manifest):
+        path = str(tmp_path / name)
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr("AndroidManifest.xml", build_manifest(**manifest))
+            z.writestr("classes.dex", b"dex\n035\0" + b"\0" * 1024)
+            if padding:
+                z.writestr("assets/blob.bin", os.urandom(padding), zipfile.ZIP_STORED)
+        return path
+    return make
+
+
+@pytest.fixture(scope="session")
+def main_module(tmp_path_factory):
+    """appinstalltest_lib.main, imported in a scratch working directory (it creates apks/ and jobs.db)."""
+    previous = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("server"))
+    try:
+        from appinstalltest_lib import main
+        yield main
+    finally:
+        os.chdir(previous)
@@ -0,0 +1,155 @@
+import socket
+import threading
+
+
+def _block(text):
+    data = text.encode("utf-8")
+    return b"%04x" % len(data) + data
+
+
+class FakeAdbServer:
+    """
+    adb server speaking just enough of the smart-socket protocol for adbutils,
+    adb_protocol and DeviceWatcher: host:version, host:devices,
+    host:track-devices, host:transport, host-serial features/get-state, and
+    shell:/exec: services answered by per-serial handlers.
+    """
+
+    def __init__(self, version=40):
+        self.version = version
+        self.devices = {}  # serial -> adb state
+        # serial -> handler(command) returning the output (str); may sleep to simulate a slow device
+        self.shell_handlers = {}
+        # serial -> handler(command, conn) talking to the exec: stream itself
+        self.exec_handlers = {}
+        self.requests = []
+        self._trackers = []
+        self._lock = threading.Lock()
+        self._sock = socket.socket()
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen(128)
+        self.host, self.port = self._sock.getsockname()
+        self._closed = False
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def set_devices(self, devices):
+        """Replace the device list and push it to every host:track-devices client."""
+        with self._lock:
+            self.devices = dict(devices)
+            trackers = list(self._trackers)
+        for conn in trackers:
+            self._send_tracked(conn)
+
+    def drop_trackers(self):
+        """Close every track-devices stream, as a restarting adb server does."""
+        with self._lock:
+            trackers, self._trackers = self._trackers, []
+        for conn in trackers:
+            self._close(conn)
+
+    def tracker_count(self):
+        with self._lock:
+            return len(self._trackers)
+
+    def close(self):
+        self._closed = True
+        self.drop_trackers()
+        self._close(self._sock)
+
+    def _device_list(self):
+        with self._lock:
+            return "".join(f"{serial}\t{state}\n" for serial, state in self.devices.items())
+
+    def _send_tracked(self, conn):
+        try:
+            conn.sendall(_block(self._device_list()))
+        except OSError:
+            with self._lock:
+                if conn in self._trackers:
+                    self._trackers.remove(conn)
+
+    @staticmethod
+    def _close(sock):
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _read_request(self, conn):
+        header = self._recv_exact(conn, 4)
+        return self._recv_exact(conn, int(header, 16)).decode("utf-8")
+
+    @staticmethod
+    def _recv_exact(conn, size):
+        data = b""
+        while len(data) < size:
+            chunk = conn.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("client went away")
+            data += chunk
+        return data
+
+    def _serve(self, conn):
+        keep_open = False
+        try:
+            serial = None
+            while True:
+                request = self._read_request(conn)
+                self.requests.append(request)
+                if request == "host:version":
+                    conn.sendall(b"OKAY" + _block("%04x" % self.version))
+                    return
+                if request == "host:devices":
+                    conn.sendall(b"OKAY" + _block(self._device_list()))
+                    return
+                if request == "host:track-devices":
+                    conn.sendall(b"OKAY")
+                    with self._lock:
+                        self._trackers.append(conn)
+                    self._send_tracked(conn)
+                    keep_open = True
+                    return
+                if request.startswith("host:transport:"):
+                    serial = request[len("host:transport:"):]
+                    if self.devices.get(serial) != "device":
+                        conn.sendall(b"FAIL" + _block(f"device '{serial}' not found"))
+                        return
+                    conn.sendall(b"OKAY")
+                    continue  # the service request follows on the same connection
+                if request.startswith("host-serial:"):
+                    _, target, command = request.split(":", 2)
+                    if target not in self.devices:
+                        conn.sendall(b"FAIL" + _block(f"device '{target}' not found"))
+                    elif command == "features":
+                        conn.sendall(b"OKAY" + _block("cmd"))
+                    elif command == "get-state":
+                        conn.sendall(b"OKAY" + _block(self.devices[target]))
+                    else:
+                        conn.sendall(b"FAIL" + _block(f"unsupported {command}"))
+                    return
+                if request.startswith("shell:") and serial:
+                    handler = self.shell_handlers.get(serial, lambda command: "")
+                    conn.sendall(b"OKAY")
+                    conn.sendall(handler(request[len("shell:"):]).encode("utf-8"))
+                    return
+                if request.startswith("exec:") and serial in self.exec_handlers:
+                    conn.sendall(b"OKAY")
+                    self.exec_handlers[serial](request[len("exec:"):], conn)
+                    return
+                conn.sendall(b"FAIL" + _block(f"unknown service {request}"))
+                return
+        except OSError:
+            pass
+        finally:
+            if not keep_open:
+                self._close(conn)
@@ -0,0 +1,56 @@
+import hashlib
+import shutil
+import pytest
+from appinstalltest_lib.apk_manager import ApkManager
+
+
+@pytest.fixture
+def store(tmp_path, make_apk):
+    manager = ApkManager(str(tmp_path / "apks"), server_port=8791)
+    shutil.copy(make_apk("demo.apk"), tmp_path / "apks" / "demo.apk")
+    manager.register_file("demo.apk")
+    return manager
+
+
+@pytest.mark.parametrize("url", [
+    "http://localhost:8791/uploads/demo.apk",
+    "http://127.0.0.1:8791/uploads/demo.apk",
+    "http://localhost:8791/uploads/%64emo.apk",
+])
+def test_resolves_own_upload_urls(store, url):
+    assert store.resolve_local(url) == store.get_apk_path("demo.apk")
+
+
+@pytest.mark.parametrize("url", [
+    "http://localhost:8792/uploads/demo.apk",  # another instance on this host has its own store
+    "http://localhost/uploads/demo.apk",
+    "http://localhost:99999/uploads/demo.apk",
+    "http://build.example.com:8791/uploads/demo.apk",
+    "http://localhost:8791/uploads/..%2Fapks%2Fdemo.apk",
+    "http://localhost:8791/uploads/missing.apk",
+    "http://localhost:8791/static/demo.apk",
+])
+def test_ignores_other_urls(store, url):
+    assert store.resolve_local(url) is None
+
+
+def test_resolves_any_url_by_sha256(store):
+    with open(store.get_apk_path("demo.apk"), "rb") as f:
+        sha256 = hashlib.sha256(f.read()).hexdigest()
+    assert store.resolve_local("http://localhost:8792/uploads/demo.apk", sha256) == store.get_apk_path("demo.apk")
+    assert store.resolve_local("https://cdn.example.com/app.apk", sha256) == store.get_apk_path("demo.apk")
+
+
+def test_listing_repair_keeps_inspection_fields(store, monkeypatch):
+    store.store.update("demo.apk", version_name="Unknown", version_code="Unknown", package_name="Unknown")
+    stale = store.store.all()
+    # The inspection pool finishes between the listing's read and its repair
+    store.store.update("demo.apk", inspected_sig="1:2", min_sdk=21, abis="arm64-v8a")
+    monkeypatch.setattr(store.store, "all", lambda: stale)
+    monkeypatch.setattr(store, "schedule_inspection", lambda filename: None)
+
+    listing = store._build_listing()
+    assert listing["android"][0]["version_code"] == "42"
+    meta = store.store.get("demo.apk")
+    assert (meta["version_name"], meta["package_name"]) == ("1.2.3", "com.example.demo")
+    assert (meta["inspected_sig"], meta["min_sdk"], meta["abis"]) == ("1:2", 21, "arm64-v8a")
@@ -0,0 +1,144 @@
+import os
+import time
+import threading
+import pytest
+from appinstalltest_lib.artifact_cache import ArtifactCache
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b"", headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+
+class FakeHttp:
+    """url -> (body, etag); answers If-None-Match with a 304. `gate` holds every download until set."""
+
+    def __init__(self):
+        self.files = {}
+        self.requests = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def get(self, url, stream=False, headers=None):
+        self.requests.append((url, dict(headers or {})))
+        body, etag = self.files[url]
+        if headers and headers.get("If-None-Match") == etag:
+            return FakeResponse(304)
+        self.gate.wait(5)
+        return FakeResponse(200, body, {"ETag": etag})
+
+
+@pytest.fixture
+def http():
+    return FakeHttp()
+
+
+@pytest.fixture
+def cache(tmp_path, http):
+    return ArtifactCache(str(tmp_path / "cache"), http_client=http)
+
+
+def test_repeat_fetch_is_a_conditional_hit(cache, http):
+    http.files["http://cdn/a.apk"] = (b"a" * 100, '"a1"')
+    first = cache.fetch("http://cdn/a.apk")
+    cache.release(first)
+    second = cache.fetch("http://cdn/a.apk")
+    assert second == first
+    assert http.requests[1] == ("http://cdn/a.apk", {"If-None-Match": '"a1"'})
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+
+def test_changed_content_is_downloaded_again(cache, http):
+    http.files["http://cdn/a.apk"] = (b"a" * 100, '"a1"')
+    first = cache.fetch("http://cdn/a.apk")
+    http.files["http://cdn/a.apk"] = (b"b" * 100, '"a2"')
+    second = cache.fetch("http://cdn/a.apk")
+    assert second != first
+    with open(second, "rb") as f:
+        assert f.read() == b"b" * 100
+
+
+def test_same_content_under_two_urls_is_stored_once(cache, http):
+    http.files["http://cdn/a.apk"] = (b"same" * 25, '"a"')
+    http.files["http://mirror/a.apk?sig=1"] = (b"same" * 25, '"m"')
+    assert cache.fetch("http://cdn/a.apk") == cache.fetch("http://mirror/a.apk?sig=1")
+    stats = cache.stats()
+    assert (stats["entries"], stats["urls"], stats["bytes"]) == (1, 2, 100)
+    assert len([f for f in os.listdir(cache.cache_dir) if f.endswith(".apk")]) == 1
+
+
+def test_concurrent_fetches_share_one_download(cache, http):
+    http.files["http://cdn/a.apk"] = (b"a" * 100, '"a1"')
+    http.gate.clear()
+    paths = []
+    threads = [threading.Thread(target=lambda: paths.append(cache.fetch("http://cdn/a.apk"))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    while not http.requests:
+        time.sleep(0.001)
+    http.gate.set()
+    for t in threads:
+        t.join(5)
+    assert len(set(paths)) == 1 and len(paths) == 4
+    assert len(http.requests) + cache.stats()["shared"] == 4
+    assert cache._pins[os.path.basename(paths[0]).split(".")[0]] == 4
+
+
+def test_least_recently_used_blob_is_evicted(tmp_path, http):
+    cache = ArtifactCache(str(tmp_path / "cache"), max_bytes=250, http_client=http)
+    paths = {}
+    for name in "abc":
+        http.files[f"http://cdn/{name}.apk"] = (name.encode() * 100, f'"{name}"')
+        paths[name] = cache.fetch(f"http://cdn/{name}.apk")
+        cache.release(paths[name])
+    assert not os.path.exists(paths["a"])
+    assert os.path.exists(paths["b"]) and os.path.exists(paths["c"])
+    assert cache.stats()["urls"] == 2
+    # The evicted URL is fetched unconditionally
+    cache.fetch("http://cdn/a.apk")
+    assert http.requests[-1] == ("http://cdn/a.apk", {})
+
+
+def test_pinned_blob_survives_eviction_until_released(tmp_path, http):
+    cache = ArtifactCache(str(tmp_path / "cache"), max_bytes=150, http_client=http)
+    http.files["http://cdn/a.apk"] = (b"a" * 100, '"a"')
+    http.files["http://cdn/b.apk"] = (b"b" * 100, '"b"')
+    pinned = cache.fetch("http://cdn/a.apk")
+    released = cache.fetch("http://cdn/b.apk")
+    cache.release(released)
+    # "a" is older but in use, so the newer unpinned blob goes instead
+    assert os.path.exists(pinned) and not os.path.exists(released)
+    http.files["http://cdn/c.apk"] = (b"c" * 100, '"c"')
+    other = cache.fetch("http://cdn/c.apk")
+    assert os.path.exists(pinned)
+    cache.release(pinned)
+    assert not os.path.exists(pinned) and os.path.exists(other)
+
+
+def test_index_survives_restart(tmp_path, http):
+    http.files["http://cdn/a.apk"] = (b"a" * 100, '"a"')
+    http.files["http://cdn/b.apk"] = (b"b" * 100, '"b"')
+    cache = ArtifactCache(str(tmp_path / "cache"), http_client=http)
+    kept = cache.fetch("http://cdn/a.apk")
+    os.remove(cache.fetch("http://cdn/b.apk"))  # lost behind the cache's back
+
+    reloaded = ArtifactCache(str(tmp_path / "cache"), http_client=http)
+    assert reloaded.stats()["urls"] == 1
+    assert reloaded.fetch("http://cdn/a.apk") == kept
+    assert http.requests[-1][1] == {"If-None-Match": '"a"'}
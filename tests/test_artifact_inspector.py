@@ -0,0 +1,187 @@
+import io
+import struct
+import sqlite3
+import zipfile
+import plistlib
+import pytest
+from appinstalltest_lib import artifact_inspector
+from appinstalltest_lib.artifact_inspector import (java_hash_code, pkcs7_certificates, read_signing_block,
+                                                   size_breakdown)
+from appinstalltest_lib.metadata_store import MetadataStore
+from conftest import build_manifest
+
+V2_SCHEME_ID = 0x7109871a
+V3_SCHEME_ID = 0xf05368c0
+CERT_A = b"\x30\x06\x02\x01\x01\x04\x01\xaa"  # DER-shaped stand-ins for X.509 certificates
+CERT_B = b"\x30\x06\x02\x01\x02\x04\x01\xbb"
+
+
+def _lp(data):
+    return struct.pack("<I", len(data)) + data
+
+
+def _scheme_block(*certs):
+    """v2/v3 signature scheme value with one signer per certificate."""
+    signers = b""
+    for cert in certs:
+        signed_data = _lp(b"") + _lp(_lp(cert))  # digests, certificates
+        signers += _lp(_lp(signed_data) + _lp(b"") + _lp(b""))  # signed data, signatures, public key
+    return _lp(signers)
+
+
+def _der(tag, content):
+    if len(content) < 0x80:
+        return bytes([tag, len(content)]) + content
+    length = len(content).to_bytes(2, "big")
+    return bytes([tag, 0x82]) + length + content
+
+
+def _pkcs7(*certs):
+    signed_data = _der(0x30, _der(0x02, b"\x01") + _der(0x31, b"") + _der(0x30, b"")
+                       + _der(0xA0, b"".join(certs)) + _der(0x31, b""))
+    return _der(0x30, _der(0x06, b"\x2a\x86\x48\x86\xf7\x0d\x01\x07\x02") + _der(0xA0, signed_data))
+
+
+def _with_signing_block(zip_bytes, pairs):
+    """Insert an APK Signing Block before the central directory, as apksigner does."""
+    eocd = zip_bytes.rfind(b"PK\x05\x06")
+    (cd_offset,) = struct.unpack_from("<I", zip_bytes, eocd + 16)
+    body = b"".join(struct.pack("<QI", len(value) + 4, pair_id) + value for pair_id, value in pairs)
+    size = len(body) + 8 + 16
+    block = struct.pack("<Q", size) + body + struct.pack("<Q", size) + b"APK Sig Block 42"
+    eocd_record = bytearray(zip_bytes[eocd:])
+    struct.pack_into("<I", eocd_record, 16, cd_offset + len(block))
+    return zip_bytes[:cd_offset] + block + zip_bytes[cd_offset:eocd] + bytes(eocd_record)
+
+
+@pytest.fixture
+def signed_apk(tmp_path):
+    """APK with a v3 and a v2 signature (rotated key) plus a v1 PKCS#7 signature and native libs."""
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr("AndroidManifest.xml", build_manifest(min_sdk=24))
+        z.writestr("classes.dex", b"dex\n035\0" + b"\0" * 1024)
+        z.writestr("lib/arm64-v8a/libdemo.so", b"\0" * 256)
+        z.writestr("lib/x86_64/libdemo.so", b"\0" * 256)
+        z.writestr("META-INF/CERT.RSA", _pkcs7(CERT_A))
+    path = tmp_path / "signed.apk"
+    path.write_bytes(_with_signing_block(buf.getvalue(), [(V2_SCHEME_ID, _scheme_block(CERT_A)),
+                                                          (V3_SCHEME_ID, _scheme_block(CERT_B))]))
+    return str(path)
+
+
+@pytest.fixture
+def make_ipa(tmp_path):
+    def make(name="demo.ipa", **plist):
+        info = {"CFBundleIdentifier": "com.example.demo", "CFBundleShortVersionString": "1.2.3", **plist}
+        path = str(tmp_path / name)
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr("Payload/Demo.app/Info.plist", plistlib.dumps(info))
+            z.writestr("Payload/Demo.app/Demo", b"\xcf\xfa\xed\xfe" + b"\0" * 4096)
+            z.writestr("iTunesMetadata.plist", plistlib.dumps({}))
+        return path
+    return make
+
+
+def _java_reference(data):
+    h = 1
+    for b in data:
+        h = (31 * h + (b - 256 if b > 127 else b) + 2 ** 31) % 2 ** 32 - 2 ** 31
+    return h & 0xFFFFFFFF
+
+
+@pytest.mark.parametrize("data, expected", [
+    (b"", "1"),
+    (bytes([1, 2, 3]), "7861"),
+    (bytes([0xFF]), "1e"),  # bytes are signed in Java: 31 * 1 + (-1)
+])
+def test_java_hash_code(data, expected):
+    assert java_hash_code(data) == expected
+
+
+def test_java_hash_code_wraps_like_int32():
+    data = bytes(range(256)) * 4
+    assert java_hash_code(data) == f"{_java_reference(data):x}"
+
+
+def test_read_signing_block(signed_apk):
+    with open(signed_apk, "rb") as f:
+        pairs = read_signing_block(f)
+    assert set(pairs) == {V2_SCHEME_ID, V3_SCHEME_ID}
+    assert artifact_inspector.signer_certificates(pairs[V2_SCHEME_ID]) == [CERT_A]
+    assert artifact_inspector.signer_certificates(pairs[V3_SCHEME_ID]) == [CERT_B]
+
+
+def test_read_signing_block_without_block(make_apk):
+    with open(make_apk(), "rb") as f:
+        assert read_signing_block(f) == {}
+
+
+def test_read_signing_block_not_a_zip():
+    assert read_signing_block(io.BytesIO(b"not a zip at all" * 10)) == {}
+
+
+def test_pkcs7_certificates():
+    assert pkcs7_certificates(_pkcs7(CERT_A, CERT_B)) == [CERT_A, CERT_B]
+
+
+def test_pkcs7_certificates_long_form_length():
+    big_cert = _der(0x30, _der(0x04, b"\x5a" * 300))
+    assert pkcs7_certificates(_pkcs7(big_cert, CERT_A)) == [big_cert, CERT_A]
+
+
+def test_pkcs7_without_certificates():
+    assert pkcs7_certificates(_der(0x30, _der(0x06, b"\x2a") + _der(0xA0, _der(0x30, _der(0x02, b"\x01"))))) == []
+
+
+def test_size_breakdown(signed_apk):
+    with zipfile.ZipFile(signed_apk) as z:
+        infos = z.infolist()
+        sizes = size_breakdown(infos)
+    assert set(sizes) == {"/", "lib", "META-INF"}
+    assert sizes["lib"]["size"] == 512
+    assert sizes["/"]["size"] == sum(i.file_size for i in infos if "/" not in i.filename)
+    assert sum(s["compressed"] for s in sizes.values()) == sum(i.compress_size for i in infos)
+
+
+def test_inspect_apk(signed_apk):
+    details = artifact_inspector.inspect(signed_apk)
+    assert details["min_sdk"] == 24 and details["target_sdk"] == 24
+    assert details["abis"] == ["arm64-v8a", "x86_64"]
+    assert details["signature_schemes"] == ["v1", "v2", "v3"]
+    # Newest scheme first, duplicates collapsed
+    assert [c["hashcode"] for c in details["certificates"]] == [java_hash_code(CERT_B), java_hash_code(CERT_A)]
+
+
+@pytest.mark.parametrize("capabilities", [["arm64", "metal"], {"arm64": True, "metal": True, "nfc": False}])
+def test_inspect_ipa(make_ipa, capabilities):
+    details = artifact_inspector.inspect(make_ipa(MinimumOSVersion="14.0", UIDeviceFamily=[1, 2],
+                                                  UIRequiredDeviceCapabilities=capabilities))
+    assert details["min_os_version"] == "14.0"
+    assert details["required_capabilities"] == ["arm64", "metal"]
+    assert details["device_family"] == [1, 2]
+    assert set(details["size_breakdown"]) == {"Payload", "/"}
+
+
+def test_device_family_is_stored(tmp_path, make_ipa):
+    details = artifact_inspector.inspect(make_ipa(MinimumOSVersion="15.0", UIDeviceFamily=[2]))
+    store = MetadataStore(str(tmp_path / "meta.db"))
+    store.put("demo.ipa", {"version_name": "1.2.3"})
+    store.update("demo.ipa", **artifact_inspector.to_store_fields(details))
+    assert store.get("demo.ipa")["device_family"] == "2"
+
+
+def test_device_family_migration_reinspects_ios_rows(tmp_path):
+    db_path = str(tmp_path / "meta.db")
+    store = MetadataStore(db_path)
+    store.put("demo.ipa", {"inspected_sig": "1:2", "min_os_version": "14.0"})
+    store.put("demo.apk", {"inspected_sig": "3:4", "min_sdk": 21})
+    store._db.close()
+    db = sqlite3.connect(db_path)
+    db.execute("ALTER TABLE artifacts DROP COLUMN device_family")  # as written before the column existed
+    db.commit()
+    db.close()
+
+    store = MetadataStore(db_path)
+    assert "inspected_sig" not in store.get("demo.ipa")
+    assert store.get("demo.apk")["inspected_sig"] == "3:4"
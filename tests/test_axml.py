@@ -0,0 +1,82 @@
+import os
+import sys
+import subprocess
+import pytest
+from pyaxmlparser import APK
+from appinstalltest_lib import axml
+
+VARIANTS = [
+    {},
+    {"utf8": True},
+    {"obfuscated": True},  # attribute names stripped from the string pool, only resource ids left
+    {"package": "com.example.ünïcode", "version_name": "2.0.0-beta+ß", "version_code": 2147483647, "utf8": True},
+]
+
+
+@pytest.mark.parametrize("manifest", VARIANTS)
+def test_matches_pyaxmlparser(make_apk, manifest):
+    path = make_apk(**manifest)
+    apk = APK(path)
+    result = axml.read_manifest(path)
+    assert result["package"] == apk.package
+    assert str(result["versionCode"]) == str(apk.version_code)
+    assert result["versionName"] == apk.version_name
+    assert dict(result["elements"])["uses-sdk"]["minSdkVersion"] == int(apk.get_min_sdk_version())
+
+
+def test_reference_value(make_apk):
+    # versionName="@string/app_version" needs resources.arsc; the caller decides what to do with it
+    version_name = axml.read_manifest(make_apk(version_name_ref=0x7F0E0001))["versionName"]
+    assert isinstance(version_name, axml.Reference)
+    assert version_name == 0x7F0E0001
+
+
+
+# Runs one parser in a fresh interpreter that imports only that parser, so the peak RSS is its own
+BENCH_SCRIPT = """
+import sys, time, tracemalloc
+path, parser, rounds = sys.argv[1], sys.argv[2], int(sys.argv[3])
+if parser == "axml":
+    from appinstalltest_lib.axml import read_manifest as parse
+else:
+    from pyaxmlparser import APK as parse
+parse(path)  # warm-up: lazy imports and caches
+times = []
+for _ in range(rounds):
+    started = time.perf_counter()
+    parse(path)
+    times.append(time.perf_counter() - started)
+tracemalloc.start()
+parse(path)
+peak_alloc = tracemalloc.get_traced_memory()[1]
+tracemalloc.stop()
+# VmHWM starts over at exec, unlike ru_maxrss which keeps the parent's peak
+with open("/proc/self/status") as f:
+    peak_rss = next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+print(min(times), peak_alloc, peak_rss)
+"""
+
+
+def _bench(parser, path, rounds=20):
+    """(best seconds per parse, peak traced allocation of one parse in bytes, process peak RSS in KiB)."""
+    output = subprocess.run([sys.executable, "-c", BENCH_SCRIPT, path, parser, str(rounds)],
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            capture_output=True, text=True, check=True).stdout.split()
+    return float(output[0]), int(output[1]), int(output[2])
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="reads VmHWM from procfs")
+def test_parse_time_and_peak_memory_against_pyaxmlparser(make_apk, record_property):
+    """Benchmark: manifest parse of a 64 MB APK, axml vs pyaxmlparser.APK."""
+    path = make_apk("big.apk", padding=64 * 1024 * 1024)
+    results = {parser: _bench(parser, path) for parser in ("axml", "pyaxmlparser")}
+    for parser, (seconds, peak_alloc, peak_rss) in results.items():
+        record_property(f"{parser}_ms_per_parse", round(seconds * 1000, 3))
+        record_property(f"{parser}_peak_alloc_bytes", peak_alloc)
+        record_property(f"{parser}_peak_rss_kib", peak_rss)
+        print(f"{parser}: {seconds * 1000:.3f} ms per parse, peak allocation {peak_alloc / 1024:.0f} KiB, "
+              f"process peak RSS {peak_rss / 1024:.1f} MiB")
+    # Both read only the manifest entry, so per-parse allocations are close; the gap is
+    # pyaxmlparser's decoding work and the lxml/asn1crypto stack it pulls in
+    assert results["axml"][0] < results["pyaxmlparser"][0]
+    assert results["axml"][2] < results["pyaxmlparser"][2]
@@ -0,0 +1,58 @@
+import time
+import threading
+from appinstalltest_lib.batch_runner import BatchRunner
+from appinstalltest_lib.device_leases import DeviceLeases
+
+
+class FakeTestRunner:
+    def __init__(self):
+        self.runs = []
+        self.lock = threading.Lock()
+
+    def _run_upgrade_sync(self, serial, pair, slots):
+        with slots, self.lock:
+            self.runs.append((serial, pair["new_apk_name"]))
+        return {"status": "success", "new_apk_name": pair["new_apk_name"]}
+
+
+def wait_finished(runner, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = runner.get_job(job_id)
+        if job["status"] == "finished":
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"batch job still running: {job}")
+
+
+def test_runs_every_pair_on_every_device():
+    test_runner = FakeTestRunner()
+    runner = BatchRunner(test_runner, leases=DeviceLeases())
+    pairs = [{"old_apk_name": "a.apk", "new_apk_name": "b.apk"}, {"old_apk_name": "b.apk", "new_apk_name": "c.apk"}]
+    job = wait_finished(runner, runner.submit(["s1", "s2"], pairs))
+    assert job["summary"] == {"passed": 4, "failed": 0, "busy": 0}
+    assert [r["new_apk_name"] for r in job["results"]["s1"]] == ["b.apk", "c.apk"]
+
+
+def test_leased_device_is_reported_busy():
+    leases = DeviceLeases()
+    leases.acquire("s1", "job:other")
+    test_runner = FakeTestRunner()
+    runner = BatchRunner(test_runner, leases=leases, lease_timeout=0.1)
+    job = wait_finished(runner, runner.submit(["s1", "s2"], [{"old_apk_name": "a.apk", "new_apk_name": "b.apk"}]))
+    assert job["results"]["s1"][0]["status"] == "busy"
+    assert job["summary"] == {"passed": 1, "failed": 0, "busy": 1}
+    assert test_runner.runs == [("s2", "b.apk")]
+    # The other holder keeps its lease
+    assert leases.holder("s1") == "job:other"
+
+
+def test_batch_endpoint_rejects_malformed_payloads(main_module):
+    from fastapi.testclient import TestClient
+    client = TestClient(main_module.app)
+    pair = {"old_apk_name": "a.apk", "new_apk_name": "b.apk"}
+    for payload in ({"device_serials": "s1", "pairs": [pair]},
+                    {"device_serials": ["s1", 2], "pairs": [pair]},
+                    {"device_serials": ["s1"], "pairs": "a.apk"},
+                    {"device_serials": ["s1"], "pairs": [pair, "b.apk"]}):
+        assert client.post("/batch", json=payload).status_code == 400, payload
@@ -0,0 +1,99 @@
+import pytest
+from appinstalltest_lib.compatibility import evaluate
+
+PHONE = {"platform": "android", "sdk": 30, "abilist": ["arm64-v8a", "armeabi-v7a", "armeabi"]}
+IPHONE = {"platform": "ios", "os_version": "16.4.1"}
+BUILD = {"min_sdk": 21, "abis": ["arm64-v8a"], "cert_hashcodes": ["1a2b"], "version_code": "42"}
+
+
+def checks(details, device=PHONE, installed=None):
+    return [p["check"] for p in evaluate(details, device, installed)]
+
+
+def test_compatible_build():
+    assert evaluate(BUILD, PHONE, {"version_code": 42, "signatures": ["1a2b"]}) == []
+
+
+@pytest.mark.parametrize("min_sdk, expected", [(29, []), (30, []), (31, ["min_sdk"])])
+def test_min_sdk_boundary(min_sdk, expected):
+    assert checks(dict(BUILD, min_sdk=min_sdk)) == expected
+
+
+@pytest.mark.parametrize("device, expected", [
+    (dict(PHONE, sdk=None), ["abi"]),
+    (dict(PHONE, abilist=[]), ["min_sdk"]),
+    ({"platform": "android"}, []),
+])
+def test_unknown_device_properties_are_skipped(device, expected):
+    assert checks(dict(BUILD, min_sdk=99, abis=["x86"]), device) == expected
+
+
+@pytest.mark.parametrize("abis, expected", [
+    ([], []),  # no native code runs anywhere
+    (["x86_64", "armeabi-v7a"], []),  # one usable ABI is enough
+    (["x86", "x86_64"], ["abi"]),
+])
+def test_abis(abis, expected):
+    assert checks(dict(BUILD, abis=abis)) == expected
+
+
+def test_splits():
+    assert checks(dict(BUILD, split_name="config.arm64_v8a")) == ["split"]
+    assert checks(dict(BUILD, requires_splits=True)) == ["split"]
+    # A split that itself requires splits is still reported once
+    assert checks(dict(BUILD, split_name="config.xxhdpi", requires_splits=True)) == ["split"]
+
+
+@pytest.mark.parametrize("signatures, expected", [
+    (["1a2b"], []),
+    (["ffff", "1a2b"], []),  # rotated key: any shared signer is enough
+    (["ffff"], ["signature"]),
+    ([], []),
+    (None, []),
+])
+def test_signature(signatures, expected):
+    assert checks(BUILD, installed={"version_code": 1, "signatures": signatures}) == expected
+
+
+def test_unsigned_build_skips_the_signature_check():
+    assert checks(dict(BUILD, cert_hashcodes=[]), installed={"signatures": ["ffff"]}) == []
+
+
+@pytest.mark.parametrize("version_code, installed_code, expected", [
+    ("42", 41, []),
+    ("42", 42, []),
+    ("42", 43, ["downgrade"]),
+    (" 42 ", 43, ["downgrade"]),
+    ("Unknown", 43, []),
+    ("42", None, []),
+])
+def test_downgrade(version_code, installed_code, expected):
+    details = dict(BUILD, version_code=version_code)
+    assert checks(details, installed={"version_code": installed_code, "signatures": ["1a2b"]}) == expected
+
+
+def test_every_problem_is_reported():
+    details = dict(BUILD, min_sdk=33, abis=["x86"], requires_splits=True, version_code="1")
+    assert checks(details, installed={"version_code": 2, "signatures": ["ffff"]}) == [
+        "min_sdk", "abi", "split", "signature", "downgrade"]
+
+
+@pytest.mark.parametrize("min_os, os_version, compatible", [
+    ("16.0", "16.4.1", True),
+    ("16.4.1", "16.4.1", True),
+    ("16.4.0", "16.4", True),
+    ("16.4", "16.4.0", True),
+    ("16.5", "16.4.1", False),
+    ("17", "16.4.1", False),
+    ("9.0", "10.3", True),  # numeric, not string, comparison
+    ("17.0", "17.0b2", True),  # pre-release suffixes are ignored
+    (None, "16.4.1", True),
+    ("16.0", None, True),
+])
+def test_ios_min_os_version(min_os, os_version, compatible):
+    problems = evaluate({"min_os_version": min_os}, dict(IPHONE, os_version=os_version))
+    assert (problems == []) == compatible
+
+
+def test_ios_ignores_android_fields():
+    assert evaluate(dict(BUILD, min_sdk=99, abis=["x86"], split_name="config"), IPHONE) == []
@@ -0,0 +1,204 @@
+import time
+import adbutils
+import pytest
+from fake_adb import FakeAdbServer
+from appinstalltest_lib.device_manager import DeviceManager, STATE_PROBE_COMMAND, parse_state_probe
+
+# Filtered output of STATE_PROBE_COMMAND on an awake, unlocked Pixel (API 33)
+AWAKE_UNLOCKED = """\
+#power
+  mWakefulness=Awake
+#deviceidle
+  mScreenOn=true
+#display
+  Display Power: state=ON
+#window
+    mShowingLockscreen=false mShowingDream=false mDreamingLockscreen=false
+#trust
+ mDeviceLocked=false
+#activity
+  mKeyguardShowing=false
+"""
+
+# Screen off on the lock screen; some sections print nothing on this release
+ASLEEP_LOCKED = """\
+#power
+  mWakefulness=Asleep
+#deviceidle
+  mScreenOn=false
+#display
+  Display Power: state=OFF
+#window
+    mShowingLockscreen=true mShowingDream=false mDreamingLockscreen=true
+#trust
+#activity
+"""
+
+# Old device without grep in its toybox: every filter fails, only the section markers remain
+GREP_MISSING = """\
+#power
+/system/bin/sh: grep: not found
+#deviceidle
+/system/bin/sh: grep: not found
+#display
+/system/bin/sh: grep: not found
+#window
+/system/bin/sh: grep: not found
+#trust
+/system/bin/sh: grep: not found
+#activity
+/system/bin/sh: grep: not found
+"""
+
+
+class FakeDevice:
+    """adbutils device answering shell commands from a dict; an Exception value is raised instead."""
+
+    def __init__(self, outputs, serial="emulator-5554"):
+        self.serial = serial
+        self.outputs = outputs
+        self.commands = []
+
+    def shell(self, command, timeout=None):
+        self.commands.append(command)
+        output = self.outputs.get(command, "")
+        if isinstance(output, Exception):
+            raise output
+        if output == "hang":
+            time.sleep(timeout * 3)  # still running when the probe deadline passes
+            return ""
+        return output
+
+
+def test_parse_awake_unlocked():
+    assert parse_state_probe(AWAKE_UNLOCKED) == {"screen_on": True, "unlocked": True}
+
+
+def test_parse_asleep_locked():
+    assert parse_state_probe(ASLEEP_LOCKED) == {"screen_on": False, "unlocked": False}
+
+
+def test_parse_any_section_is_enough():
+    # The display section alone decides when power and deviceidle printed nothing
+    output = "#power\n#deviceidle\n#display\n  Display Power: state=ON\n#window\n#trust\n mDeviceLocked=true\n#activity\n"
+    assert parse_state_probe(output) == {"screen_on": True, "unlocked": False}
+
+
+def test_parse_grep_missing_is_unknown():
+    assert parse_state_probe(GREP_MISSING) == {"screen_on": None, "unlocked": None}
+    assert parse_state_probe("") == {"screen_on": None, "unlocked": None}
+
+
+def test_probe_state_combined():
+    device = FakeDevice({STATE_PROBE_COMMAND: AWAKE_UNLOCKED})
+    assert DeviceManager(max_workers=2).probe_state(device) == {"screen_on": True, "unlocked": True}
+    assert device.commands == [STATE_PROBE_COMMAND]
+
+
+def test_probe_state_falls_back_without_grep():
+    device = FakeDevice({
+        STATE_PROBE_COMMAND: GREP_MISSING,
+        "dumpsys power": "Power Manager State:\n  mWakefulness=Awake\n",
+        "dumpsys window policy": "    mShowingLockscreen=true mDreamingLockscreen=false\n",
+    })
+    manager = DeviceManager(max_workers=2)
+    assert manager.probe_state(device) == {"screen_on": True, "unlocked": True}
+
+    # The combined probe isn't retried on a device that can't run it
+    device.commands.clear()
+    manager.probe_state(device)
+    assert STATE_PROBE_COMMAND not in device.commands
+
+
+def test_failed_combined_probe_is_retried():
+    # One adb timeout must not send the device to the slower fallbacks for good
+    device = FakeDevice({STATE_PROBE_COMMAND: TimeoutError("adb read timeout"),
+                         "dumpsys power": "  mWakefulness=Awake\n", "dumpsys trust": " mDeviceLocked=false\n"})
+    manager = DeviceManager(max_workers=2)
+    assert manager.probe_state(device) == {"screen_on": True, "unlocked": True}
+
+    device.outputs[STATE_PROBE_COMMAND] = AWAKE_UNLOCKED
+    device.commands.clear()
+    assert manager.probe_state(device) == {"screen_on": True, "unlocked": True}
+    assert device.commands == [STATE_PROBE_COMMAND]
+
+
+def test_probe_state_lenient_when_nothing_answers():
+    # A device we can't read at all shouldn't block installs
+    failure = RuntimeError("device offline")
+    device = FakeDevice({STATE_PROBE_COMMAND: failure, "dumpsys power": failure, "dumpsys deviceidle": failure,
+                         "dumpsys display": failure, "dumpsys window policy": failure, "dumpsys trust": failure,
+                         "dumpsys activity activities": failure})
+    assert DeviceManager(max_workers=2).probe_state(device) == {"screen_on": True, "unlocked": True}
+
+
+def test_probe_state_timeout_is_not_ready():
+    device = FakeDevice({STATE_PROBE_COMMAND: GREP_MISSING, "dumpsys power": "hang", "dumpsys deviceidle": "hang",
+                         "dumpsys display": "hang", "dumpsys activity activities": "  mKeyguardShowing=false\n"})
+    started = time.monotonic()
+    result = DeviceManager(max_workers=4, probe_timeout=0.3).probe_state(device)
+    assert result == {"screen_on": False, "unlocked": True}
+    assert time.monotonic() - started < 1.5
+
+
+def test_fan_out_isolates_hung_and_failing_devices():
+    def describe(serial):
+        if serial == "hung":
+            time.sleep(1)
+        if serial == "broken":
+            raise RuntimeError("device offline")
+        return {"serial": serial}
+
+    started = time.monotonic()
+    results = DeviceManager(max_workers=4).fan_out(describe, ["a", "hung", "broken", "b"], timeout=0.2)
+    assert time.monotonic() - started < 0.5
+    assert [(item, result) for item, result, error in results if error is None] == [("a", {"serial": "a"}),
+                                                                                    ("b", {"serial": "b"})]
+    errors = {item: error for item, _, error in results if error is not None}
+    assert isinstance(errors["hung"], TimeoutError)
+    assert isinstance(errors["broken"], RuntimeError)
+
+
+def test_hung_device_does_not_pile_up_probes():
+    hung = FakeDevice({STATE_PROBE_COMMAND: GREP_MISSING, "dumpsys power": "hang", "dumpsys deviceidle": "hang",
+                       "dumpsys display": "hang", "dumpsys window policy": "hang", "dumpsys trust": "hang",
+                       "dumpsys activity activities": "hang"}, serial="hung")
+    manager = DeviceManager(max_workers=4, probe_timeout=0.2)  # 8 command workers
+    for _ in range(5):
+        assert manager.probe_state(hung) == {"screen_on": False, "unlocked": False}
+    # Only the first round reached the pool; the later ones saw it still hanging
+    assert len(manager._running_probes["hung"]) == 6
+
+    healthy = FakeDevice({STATE_PROBE_COMMAND: GREP_MISSING, "dumpsys power": "  mWakefulness=Awake\n",
+                          "dumpsys trust": " mDeviceLocked=false\n"}, serial="healthy")
+    assert manager.probe_state(healthy) == {"screen_on": True, "unlocked": True}
+
+
+@pytest.fixture
+def fake_adb():
+    server = FakeAdbServer()
+    yield server
+    server.close()
+
+
+def test_probe_latency_vs_device_count(fake_adb):
+    """Benchmark: probing N devices behind a (simulated) adb server takes about as long as probing one."""
+    def slow_shell(command):
+        time.sleep(0.2)  # dumpsys on a real device
+        return AWAKE_UNLOCKED if command == STATE_PROBE_COMMAND else ""
+
+    client = adbutils.AdbClient(host=fake_adb.host, port=fake_adb.port)
+    timings = {}
+    for count in (1, 4, 16):
+        serials = [f"emulator-{5554 + 2 * i}" for i in range(count)]
+        fake_adb.set_devices({serial: "device" for serial in serials})
+        for serial in serials:
+            fake_adb.shell_handlers[serial] = slow_shell
+        manager = DeviceManager(max_workers=16)
+        started = time.monotonic()
+        results = manager.fan_out(manager.probe_state, [client.device(serial) for serial in serials], timeout=5)
+        timings[count] = time.monotonic() - started
+        assert all(result == {"screen_on": True, "unlocked": True} for _, result, _ in results)
+    print("devices -> seconds:", {count: round(t, 2) for count, t in timings.items()})
+    # One at a time, 16 devices would take 16 x 0.2 s
+    assert timings[16] < 2 * timings[1] + 0.2
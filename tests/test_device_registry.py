@@ -0,0 +1,80 @@
+import threading
+from appinstalltest_lib.device_manager import DeviceManager
+from appinstalltest_lib.device_registry import DeviceRegistry
+
+
+class RecordingBus:
+    def __init__(self):
+        self.events = []
+
+    def publish(self, topic, data):
+        self.events.append(data)
+
+
+class FakeManager(DeviceManager):
+    """DeviceManager over an in-memory device list; state probes can be held back with `release`."""
+
+    def __init__(self):
+        super().__init__(max_workers=4, probe_timeout=1.0)
+        self.serials = {}
+        self.release = threading.Event()
+        self.release.set()
+        self.probing = threading.Event()
+
+    def list_android_serials(self):
+        return list(self.serials.items())
+
+    def list_ios_devices(self, property_cache=None):
+        return []
+
+    def get_device(self, serial):
+        return serial
+
+    def get_android_properties(self, d):
+        return {"model": f"Pixel {d}", "product": "p", "device": "d", "abilist": ["arm64-v8a"], "sdk": 33}
+
+    def get_android_state(self, d):
+        self.probing.set()
+        self.release.wait(5)
+        return {"state": "device", "screen_on": True, "unlocked": True}
+
+
+def test_refresh_tracks_connects_and_disconnects():
+    manager, bus = FakeManager(), RecordingBus()
+    registry = DeviceRegistry(manager, events=bus)
+    manager.serials = {"a": "device", "b": "unauthorized"}
+    registry.refresh()
+    assert {d["serial"]: d["state"] for d in registry.list_devices()} == {"a": "device", "b": "unauthorized"}
+    assert registry.get_properties("a")["model"] == "Pixel a"
+
+    del manager.serials["a"]
+    registry.refresh()
+    assert [d["serial"] for d in registry.list_devices()] == ["b"]
+    assert registry.get_properties("a") is None
+    assert {"event": "disconnected", "serial": "a", "platform": "android"} in bus.events
+
+
+def test_disconnect_during_probe_is_not_undone():
+    manager, bus = FakeManager(), RecordingBus()
+    registry = DeviceRegistry(manager, events=bus)
+    manager.serials = {"a": "device"}
+    manager.release.clear()
+    refresh = threading.Thread(target=registry.refresh)
+    refresh.start()
+    assert manager.probing.wait(5)
+
+    # Unplugged while its state probe is still running
+    manager.serials = {}
+    registry._on_device_event("disconnected", "a", "android")
+    manager.release.set()
+    refresh.join(5)
+
+    assert registry.list_devices() == []
+    assert registry.get_device("a") is None
+    assert bus.events[-1]["event"] == "disconnected"
+
+    # Plugged back in: tracked again
+    manager.serials = {"a": "device"}
+    registry._on_device_event("connected", "a", "android")
+    registry.refresh()
+    assert [d["serial"] for d in registry.list_devices()] == ["a"]
@@ -0,0 +1,107 @@
+import time
+import socket
+import pytest
+from fake_adb import FakeAdbServer
+from appinstalltest_lib import adb_protocol
+from appinstalltest_lib.device_watcher import DeviceWatcher
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return
+        time.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+
+def test_parse_device_list():
+    payload = b"emulator-5554\tdevice\nR58M123\tunauthorized\n192.168.1.7:5555\toffline\n\n"
+    assert adb_protocol.parse_device_list(payload) == {
+        "emulator-5554": "device", "R58M123": "unauthorized", "192.168.1.7:5555": "offline"}
+    assert adb_protocol.parse_device_list(b"") == {}
+    # `adb devices -l` style extra columns are ignored
+    assert adb_protocol.parse_device_list(b"R58M123\tdevice usb:1-1 product:a52 model:SM_A525F\n") == {
+        "R58M123": "device usb:1-1 product:a52 model:SM_A525F"}
+
+
+def test_read_hex_block():
+    left, right = socket.socketpair()
+    with left, right:
+        left.sendall(b"0005hello0000")
+        left.sendall(b"000")
+        left.sendall(b"3abc")  # a block split across two sends
+        assert adb_protocol.read_hex_block(right) == b"hello"
+        assert adb_protocol.read_hex_block(right) == b""
+        assert adb_protocol.read_hex_block(right) == b"abc"
+        left.sendall(b"0010short")
+        left.shutdown(socket.SHUT_WR)
+        with pytest.raises(adb_protocol.AdbProtocolError):
+            adb_protocol.read_hex_block(right)
+
+
+def test_send_request_reports_fail_message():
+    server = FakeAdbServer()
+    try:
+        sock = adb_protocol.connect(server.host, server.port)
+        with sock, pytest.raises(adb_protocol.AdbProtocolError, match="device 'nope' not found"):
+            adb_protocol.send_request(sock, "host:transport:nope")
+    finally:
+        server.close()
+
+
+@pytest.fixture
+def watcher_on_fake_adb():
+    server = FakeAdbServer()
+    watcher = DeviceWatcher(adb_host=server.host, adb_port=server.port, reconnect_interval=0.05)
+    events = []
+    watcher.subscribe(lambda event, serial, platform: events.append((event, serial, platform)))
+    yield server, watcher, events
+    watcher.stop()
+    server.close()
+
+
+def test_track_devices_stream(watcher_on_fake_adb):
+    server, watcher, events = watcher_on_fake_adb
+    server.set_devices({"emulator-5554": "device"})
+    watcher.start()
+    wait_for(lambda: watcher.android_ready)
+    assert events == [("connected", "emulator-5554", "android")]
+    assert watcher.get_platform("emulator-5554") == "android"
+
+    # Plugged in, then authorized on the device
+    server.set_devices({"emulator-5554": "device", "R58M123": "unauthorized"})
+    wait_for(lambda: len(events) == 2)
+    server.set_devices({"emulator-5554": "device", "R58M123": "device"})
+    wait_for(lambda: len(events) == 3)
+    assert events[1:] == [("connected", "R58M123", "android"), ("changed", "R58M123", "android")]
+    assert sorted(watcher.android_devices()) == [("R58M123", "device"), ("emulator-5554", "device")]
+
+    server.set_devices({"R58M123": "device"})
+    wait_for(lambda: len(events) == 4)
+    assert events[3] == ("disconnected", "emulator-5554", "android")
+    assert watcher.get_platform("emulator-5554") is None
+
+
+def test_adb_server_restart(watcher_on_fake_adb):
+    server, watcher, events = watcher_on_fake_adb
+    server.set_devices({"R58M123": "device"})
+    watcher.start()
+    wait_for(lambda: watcher.android_ready)
+
+    # The stream drops: nothing tracked can be trusted until the watcher reconnects
+    server.drop_trackers()
+    wait_for(lambda: ("disconnected", "R58M123", "android") in events)
+    wait_for(lambda: server.tracker_count() == 1 and watcher.android_ready)
+    wait_for(lambda: events.count(("connected", "R58M123", "android")) == 2)
+    assert watcher.android_devices() == [("R58M123", "device")]
+
+
+def test_stop_closes_the_stream(watcher_on_fake_adb):
+    server, watcher, events = watcher_on_fake_adb
+    watcher.start()
+    wait_for(lambda: server.tracker_count() == 1)
+    started = time.monotonic()
+    watcher.stop()
+    assert time.monotonic() - started < 1
+    assert not any(t.is_alive() for t in watcher._threads)
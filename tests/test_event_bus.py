@@ -0,0 +1,177 @@
+import json
+import time
+import asyncio
+import threading
+import httpx
+import pytest
+from appinstalltest_lib.event_bus import EventBus
+
+
+async def _subscribe(bus, topics=None):
+    """An SSE stream that is registered with the bus (its retry line already read)."""
+    stream = bus.stream(topics)
+    assert await stream.__anext__() == f"retry: {bus.retry_ms}\n\n"
+    return stream
+
+
+async def _next(stream):
+    return await asyncio.wait_for(stream.__anext__(), 1)
+
+
+def _frame(topic, data):
+    return f"event: {topic}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def test_fan_out_to_every_subscriber():
+    async def run():
+        bus = EventBus()
+        a, b = await _subscribe(bus), await _subscribe(bus)
+        bus.publish("install", {"serial": "s1", "status": "running"})
+        assert await _next(a) == await _next(b) == _frame("install", {"serial": "s1", "status": "running"})
+        await a.aclose()
+        await b.aclose()
+    asyncio.run(run())
+
+
+def test_topic_filter():
+    async def run():
+        bus = EventBus()
+        progress_only = await _subscribe(bus, ["progress"])
+        bus.publish("log", {"message": "ignored"})
+        bus.publish("progress", {"percent": 5})
+        assert await _next(progress_only) == _frame("progress", {"percent": 5})
+        await progress_only.aclose()
+    asyncio.run(run())
+
+
+def test_publish_from_other_threads_keeps_order():
+    async def run():
+        bus = EventBus()
+        stream = await _subscribe(bus)
+        publisher = threading.Thread(target=lambda: [bus.publish("progress", {"n": n}) for n in range(50)])
+        publisher.start()
+        received = [json.loads((await _next(stream)).split("data: ", 1)[1])["n"] for _ in range(50)]
+        publisher.join()
+        assert received == list(range(50))
+        await stream.aclose()
+    asyncio.run(run())
+
+
+def test_slow_subscriber_loses_the_oldest_events():
+    async def run():
+        bus = EventBus(queue_size=3)
+        slow = await _subscribe(bus)
+        started = time.perf_counter()
+        for n in range(10000):
+            bus.publish("progress", {"n": n})
+        # publish never waits for the client
+        assert time.perf_counter() - started < 1
+        await asyncio.sleep(0.05)  # let the queued offers run on the loop
+        assert [await _next(slow) for _ in range(3)] == [_frame("progress", {"n": n}) for n in (9997, 9998, 9999)]
+        await slow.aclose()
+    asyncio.run(run())
+
+
+def test_unsubscribe_on_close():
+    async def run():
+        bus = EventBus()
+        stream = await _subscribe(bus)
+        assert bus.subscriber_count() == 1
+        await stream.aclose()
+        assert bus.subscriber_count() == 0
+        bus.publish("progress", {})  # nobody left to deliver to
+    asyncio.run(run())
+
+
+def test_close_ends_streams():
+    async def run():
+        bus = EventBus()
+        stream = await _subscribe(bus)
+        bus.close()
+        with pytest.raises(StopAsyncIteration):
+            await _next(stream)
+        assert bus.subscriber_count() == 0
+    asyncio.run(run())
+
+
+def test_keepalive_comment_while_idle():
+    async def run():
+        bus = EventBus(keepalive=0.02)
+        stream = await _subscribe(bus)
+        assert await _next(stream) == ": keepalive\n\n"
+        await stream.aclose()
+    asyncio.run(run())
+
+
+def test_payload_encoding():
+    async def run():
+        bus = EventBus()
+        stream = await _subscribe(bus)
+        bus.publish("log", {"message": "安装成功\nnext line", "at": object})
+        frame = await _next(stream)
+        # One data line (newlines stay escaped inside the JSON), non-ASCII kept, odd values stringified
+        assert frame.count("\n") == 3 and "安装成功" in frame and "<class 'object'>" in frame
+        await stream.aclose()
+    asyncio.run(run())
+
+
+async def _sse_request(app, query_string, until):
+    """
+    Drive GET /events over raw ASGI (httpx buffers whole bodies) until `until(body)`
+    is true, then disconnect. Returns (response start message, body text).
+    """
+    start, body, disconnected = {}, [], asyncio.Event()
+
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            start.update(message)
+        elif message["type"] == "http.response.body":
+            body.append(message.get("body", b"").decode())
+            if until("".join(body)):
+                disconnected.set()
+
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": "/events", "raw_path": b"/events", "root_path": "",
+             "query_string": query_string.encode(), "headers": [], "client": ("127.0.0.1", 1),
+             "server": ("test", 80)}
+    await asyncio.wait_for(app(scope, receive, send), 5)
+    return start, "".join(body)
+
+
+def test_events_endpoint_framing_and_disconnect_cleanup(main_module):
+    bus = main_module.event_bus
+
+    async def run():
+        subscribers = bus.subscriber_count()
+
+        async def publish_when_subscribed():
+            while bus.subscriber_count() == subscribers:
+                await asyncio.sleep(0.005)
+            bus.publish("install", {"serial": "s1"})  # filtered out
+            bus.publish("progress", {"task_id": "t1", "percent": 50})
+
+        publisher = asyncio.create_task(publish_when_subscribed())
+        start, body = await _sse_request(main_module.app, "topics=progress", lambda b: "event: progress" in b)
+        await publisher
+        return subscribers, start, body
+
+    subscribers, start, body = asyncio.run(run())
+    headers = {k.decode(): v.decode() for k, v in start["headers"]}
+    assert start["status"] == 200
+    assert headers["content-type"].startswith("text/event-stream")
+    assert (headers["cache-control"], headers["x-accel-buffering"]) == ("no-cache", "no")
+    assert body == f"retry: {bus.retry_ms}\n\n" + _frame("progress", {"task_id": "t1", "percent": 50})
+    # The client went away: its subscription is gone
+    assert bus.subscriber_count() == subscribers
+
+
+def test_events_endpoint_rejects_unknown_topics(main_module):
+    async def get():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main_module.app), base_url="http://test") as c:
+            return await c.get("/events", params={"topics": "progress,bogus"})
+    response = asyncio.run(get())
+    assert response.status_code == 400 and "bogus" in response.text
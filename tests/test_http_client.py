@@ -0,0 +1,128 @@
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+import requests
+from appinstalltest_lib.http_client import HttpClient
+
+
+class FlakyServer:
+    """HTTP/1.1 keep-alive server answering the first `failures` requests with `status`."""
+
+    def __init__(self):
+        self.failures = 0
+        self.status = 503
+        self.headers = {}
+        self.delay = 0
+        self.requests = []  # (method, time, client port)
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.handle(self)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                server.handle(self)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/"
+        threading.Thread(target=self.httpd.serve_forever, args=(0.05,), daemon=True).start()
+
+    def handle(self, request):
+        self.requests.append((request.command, time.monotonic(), request.client_address[1]))
+        if self.delay:
+            time.sleep(self.delay)
+        failing = len(self.requests) <= self.failures
+        body = b"busy" if failing else b"ok"
+        request.send_response(self.status if failing else 200)
+        for name, value in (self.headers.items() if failing else ()):
+            request.send_header(name, value)
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    s = FlakyServer()
+    yield s
+    s.close()
+
+
+def test_retries_5xx_until_success(server):
+    server.failures = 2
+    r = HttpClient(backoff_factor=0).get(server.url)
+    assert (r.status_code, r.text) == (200, "ok")
+    assert len(server.requests) == 3
+
+
+def test_gives_up_with_the_last_response(server):
+    server.failures, server.status = 10, 500
+    r = HttpClient(retries=3, backoff_factor=0).get(server.url)
+    assert r.status_code == 500
+    assert len(server.requests) == 4
+
+
+def test_client_errors_are_not_retried(server):
+    server.failures, server.status = 10, 404
+    assert HttpClient(backoff_factor=0).get(server.url).status_code == 404
+    assert len(server.requests) == 1
+
+
+def test_post_is_not_retried(server):
+    server.failures = 10
+    r = HttpClient(backoff_factor=0).session().post(server.url, data=b"x")
+    assert r.status_code == 503 and len(server.requests) == 1
+
+
+def test_backoff_grows_exponentially(server):
+    server.failures = 3
+    HttpClient(retries=3, backoff_factor=0.05).get(server.url)
+    times = [t for _, t, _ in server.requests]
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    # urllib3 sleeps 0, then factor * 2, then factor * 4
+    assert gaps[1] >= 0.1 and gaps[2] >= 0.2, gaps
+    assert gaps[2] > gaps[1]
+
+
+def test_retry_after_is_respected(server):
+    server.failures, server.headers = 1, {"Retry-After": "1"}
+    started = time.monotonic()
+    assert HttpClient(backoff_factor=0).get(server.url).status_code == 200
+    assert time.monotonic() - started >= 1
+
+
+def test_sessions_share_keep_alive_connections(server):
+    client = HttpClient()
+    for _ in range(5):
+        session = client.session()
+        assert session.get(server.url).status_code == 200
+        session.close()
+    # One TCP connection for all five sessions: their close() leaves the shared pool alone
+    assert len({port for _, _, port in server.requests}) == 1
+
+
+def test_sessions_keep_their_own_cookies_and_headers(server):
+    client = HttpClient()
+    a, b = client.session(headers={"User-Agent": "a"}), client.session()
+    a.cookies.set("sid", "1")
+    assert "sid" not in b.cookies and b.headers["User-Agent"] != "a"
+
+
+def test_default_timeout(server):
+    server.delay = 0.5
+    client = HttpClient(timeout=(1, 0.1), retries=0)
+    started = time.monotonic()
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.get(server.url)
+    assert time.monotonic() - started < 0.5
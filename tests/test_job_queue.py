@@ -0,0 +1,78 @@
+import time
+import pytest
+from appinstalltest_lib.device_leases import DeviceLeases
+from appinstalltest_lib.job_queue import JobQueue, is_transient
+
+
+@pytest.mark.parametrize("result, transient", [
+    ({"status": "error", "message": "adb read timeout", "error_type": "AdbTimeout"}, True),
+    ({"status": "error", "message": "[Errno 104] Connection reset by peer", "error_type": "ConnectionResetError"}, True),
+    ({"status": "error", "message": "device offline", "error_type": "AdbError"}, True),
+    ({"status": "error", "message": "device 'R58M' not found", "error_type": "AdbError"}, True),
+    # Real install failures that merely contain the old substrings
+    ({"status": "error", "message": "Install failed: INSTALL_FAILED_TIMEOUT", "error_type": "StreamInstallError"}, False),
+    ({"status": "error", "message": "Failure [INSTALL_PARSE_FAILED_UNEXPECTED_EOF]", "error_type": "AdbInstallError"},
+     False),
+    ({"status": "error", "message": "Session closed by the installer", "error_type": "AdbError"}, False),
+    ({"status": "error", "message": "device offline"}, False),
+    ({"status": "failed", "reason": "Screen is OFF. Please turn it on.", "error_type": "AdbTimeout"}, False),
+])
+def test_is_transient(result, transient):
+    assert is_transient(result) is transient
+
+
+class FlakyTestRunner:
+    def __init__(self, results):
+        self.results = list(results)
+        self.calls = 0
+
+    def _install_old_sync(self, serial, *args):
+        self.calls += 1
+        return self.results.pop(0)
+
+
+def run_until_done(queue, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job still {job['status']}")
+
+
+@pytest.mark.parametrize("first, status, calls", [
+    ({"status": "error", "message": "device offline", "error_type": "AdbError"}, "succeeded", 2),
+    ({"status": "error", "message": "Install failed: INSTALL_FAILED_TIMEOUT", "error_type": "StreamInstallError"},
+     "failed", 1),
+])
+def test_retries_only_transient_errors(tmp_path, first, status, calls):
+    runner = FlakyTestRunner([first, {"status": "success"}])
+    queue = JobQueue(str(tmp_path / "jobs.db"), runner, DeviceLeases(), retry_delay=0.01)
+    queue.start()
+    try:
+        job = run_until_done(queue, queue.submit("install_old", "s1", {"old_apk_name": "a.apk"}))
+    finally:
+        queue.stop()
+    assert job["status"] == status
+    assert runner.calls == calls
+
+
+@pytest.mark.parametrize("payload", [
+    {"kind": "install_old", "device_serial": "s1"},
+    {"kind": "install_new", "device_serial": "s1", "new_apk_name": "b.apk"},
+    {"kind": "install_new", "device_serial": "s1", "package_name": "com.example.demo"},
+    {"kind": "upgrade", "device_serial": "s1", "old_apk_name": "a.apk"},
+    {"kind": "upgrade", "device_serial": "s1", "new_apk_url": "http://example.com/b.apk"},
+])
+def test_jobs_endpoint_requires_the_install_fields(main_module, payload):
+    from fastapi.testclient import TestClient
+    response = TestClient(main_module.app).post("/jobs", json=payload)
+    assert response.json()["status"] == "error"
+    assert main_module.job_queue.list(serial="s1") == []
+
+
+def test_jobs_endpoint_rejects_bad_priority(main_module):
+    from fastapi.testclient import TestClient
+    payload = {"kind": "install_old", "device_serial": "s1", "old_apk_name": "a.apk", "priority": "high"}
+    assert TestClient(main_module.app).post("/jobs", json=payload).status_code == 400
@@ -0,0 +1,118 @@
+import json
+import sqlite3
+import pytest
+from appinstalltest_lib.metadata_store import MetadataStore, COLUMNS
+
+# The artifacts table as the first SQLite release created it, plus the platform indexes
+# the first search release added (and later replaced)
+FIRST_RELEASE_SCHEMA = """
+CREATE TABLE artifacts (
+    filename TEXT PRIMARY KEY,
+    platform TEXT NOT NULL,
+    custom_name TEXT NOT NULL DEFAULT '',
+    version_name TEXT,
+    version_code TEXT,
+    version_code_num INTEGER,
+    package_name TEXT,
+    sha256 TEXT,
+    upload_time TEXT
+);
+CREATE INDEX idx_artifacts_package_name ON artifacts (package_name);
+CREATE INDEX idx_artifacts_platform_time ON artifacts (platform, upload_time, filename);
+CREATE INDEX idx_artifacts_platform_code ON artifacts (platform, version_code_num, filename);
+INSERT INTO artifacts VALUES ('old.apk', 'android', 'legacy', '1.0', '7', 7, 'com.example.old', 'abc', '2025-01-01 00:00:00');
+INSERT INTO artifacts VALUES ('old.ipa', 'ios', '', '2.0', '8', 8, 'com.example.old', 'def', '2025-01-02 00:00:00');
+"""
+
+LEGACY_METADATA = {
+    "a.apk": {"custom_name": "first", "version_name": "1.0", "version_code": "10", "package_name": "com.example.a",
+              "sha256": "aa", "upload_time": "2025-01-01 00:00:00"},
+    "b.ipa": {"custom_name": "", "version_name": "IPA File", "version_code": "Unknown", "package_name": "Unknown",
+              "upload_time": "2025-01-02 00:00:00"},
+    "c.apk": {"version_code": 12},
+}
+
+
+def _columns(db_path):
+    db = sqlite3.connect(db_path)
+    try:
+        return [row[1] for row in db.execute("PRAGMA table_info(artifacts)")]
+    finally:
+        db.close()
+
+
+def _indexes(store):
+    return {row[0] for row in store._db.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+
+@pytest.fixture
+def old_db(tmp_path):
+    db_path = str(tmp_path / "metadata.db")
+    db = sqlite3.connect(db_path)
+    db.executescript(FIRST_RELEASE_SCHEMA)
+    db.close()
+    return db_path
+
+
+def test_migrates_first_release_database(old_db):
+    store = MetadataStore(old_db)
+    assert set(_columns(old_db)) == set(COLUMNS)
+    assert store.get("old.apk") == {"custom_name": "legacy", "version_name": "1.0", "version_code": "7",
+                                    "package_name": "com.example.old", "sha256": "abc",
+                                    "upload_time": "2025-01-01 00:00:00"}
+    store.update("old.apk", min_sdk=21, cert_sha256="ff", device_family="1,2")
+    assert store.get("old.apk")["min_sdk"] == 21
+
+
+def test_migration_replaces_indexes(old_db):
+    indexes = _indexes(MetadataStore(old_db))
+    assert {"idx_artifacts_package_min_sdk", "idx_artifacts_cert_sha256", "idx_artifacts_platform_sort_time",
+            "idx_artifacts_platform_sort_code"} <= indexes
+    assert not {"idx_artifacts_platform_time", "idx_artifacts_platform_code"} & indexes
+
+
+def test_migrated_database_serves_queries(old_db):
+    items, after = MetadataStore(old_db).query(sort="version_code", package_name="com.example.old")
+    assert [i["filename"] for i in items] == ["old.ipa", "old.apk"] and after is None
+
+
+def test_reopening_is_idempotent(old_db):
+    MetadataStore(old_db).put("new.apk", {"version_code": "3"})
+    columns = _columns(old_db)
+    store = MetadataStore(old_db)
+    assert _columns(old_db) == columns
+    assert store.filenames() == {"old.apk", "old.ipa", "new.apk"}
+
+
+def test_import_json(tmp_path):
+    json_path = tmp_path / "metadata.json"
+    json_path.write_text(json.dumps(LEGACY_METADATA))
+    store = MetadataStore(str(tmp_path / "metadata.db"))
+
+    assert store.import_json(str(json_path)) == 3
+    assert not json_path.exists() and (tmp_path / "metadata.json.imported").exists()
+    assert store.get("a.apk") == LEGACY_METADATA["a.apk"]
+    assert store.get("c.apk") == {"custom_name": "", "version_code": "12"}  # old writers sometimes stored ints
+    # Platform and the numeric version code are derived on import
+    items, _ = store.query(platform="ios")
+    assert [i["filename"] for i in items] == ["b.ipa"]
+    items, _ = store.query(version_code_min=11)
+    assert [i["filename"] for i in items] == ["c.apk"]
+
+
+def test_import_json_keeps_existing_rows(tmp_path):
+    json_path = tmp_path / "metadata.json"
+    json_path.write_text(json.dumps(LEGACY_METADATA))
+    store = MetadataStore(str(tmp_path / "metadata.db"))
+    store.put("a.apk", {"custom_name": "newer", "version_code": "11"})
+    store.import_json(str(json_path))
+    assert store.get("a.apk") == {"custom_name": "newer", "version_code": "11"}
+    assert len(store.filenames()) == 3
+
+
+def test_unreadable_json_is_left_alone(tmp_path):
+    json_path = tmp_path / "metadata.json"
+    json_path.write_text('{"a.apk": {')
+    store = MetadataStore(str(tmp_path / "metadata.db"))
+    assert store.import_json(str(json_path)) == 0
+    assert json_path.exists() and store.filenames() == set()
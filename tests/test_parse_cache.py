@@ -0,0 +1,150 @@
+import os
+import threading
+import pytest
+from appinstalltest_lib.parse_cache import ParseCache
+
+
+class CountingParser:
+    def __init__(self, gate=None, fail_first=False):
+        self.calls = 0
+        self.gate = gate
+        self.fail_first = fail_first
+        self.started = threading.Event()
+
+    def __call__(self, path):
+        self.calls += 1
+        self.started.set()
+        if self.gate:
+            self.gate.wait(5)
+        if self.fail_first and self.calls == 1:
+            raise ValueError("corrupt")
+        with open(path, "rb") as f:
+            return f.read()
+
+
+@pytest.fixture
+def artifact(tmp_path):
+    path = tmp_path / "demo.apk"
+    path.write_bytes(b"v1")
+    return path
+
+
+def test_same_file_is_parsed_once(artifact):
+    cache, parser = ParseCache(), CountingParser()
+    assert cache.get_or_parse(str(artifact), "manifest", parser) == b"v1"
+    assert cache.get_or_parse(str(artifact), "manifest", parser) == b"v1"
+    assert parser.calls == 1 and cache.stats()["hits"] == 1
+
+
+def test_kinds_are_cached_separately(artifact):
+    cache, parser = ParseCache(), CountingParser()
+    cache.get_or_parse(str(artifact), "manifest", parser)
+    cache.get_or_parse(str(artifact), "inspect", parser)
+    assert parser.calls == 2
+
+
+def test_size_change_invalidates(artifact):
+    cache, parser = ParseCache(), CountingParser()
+    cache.get_or_parse(str(artifact), "manifest", parser)
+    st = os.stat(artifact)
+    artifact.write_bytes(b"v2 longer")
+    os.utime(artifact, ns=(st.st_atime_ns, st.st_mtime_ns))  # same mtime, only the size differs
+    assert cache.get_or_parse(str(artifact), "manifest", parser) == b"v2 longer"
+
+
+def test_mtime_change_invalidates(artifact):
+    cache, parser = ParseCache(), CountingParser()
+    cache.get_or_parse(str(artifact), "manifest", parser)
+    st = os.stat(artifact)
+    artifact.write_bytes(b"v3")  # same size
+    os.utime(artifact, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert cache.get_or_parse(str(artifact), "manifest", parser) == b"v3"
+
+
+def test_replaced_file_invalidates(artifact, tmp_path):
+    cache, parser = ParseCache(), CountingParser()
+    cache.get_or_parse(str(artifact), "manifest", parser)
+    st = os.stat(artifact)
+    replacement = tmp_path / "upload.tmp"
+    replacement.write_bytes(b"v4")  # same size, and the same mtime below: only the inode differs
+    os.utime(replacement, ns=(st.st_atime_ns, st.st_mtime_ns))
+    keep_inode_busy = open(artifact, "rb")  # so the new file can't reuse the old inode number
+    try:
+        os.replace(replacement, artifact)
+        assert os.stat(artifact).st_ino != st.st_ino
+        assert cache.get_or_parse(str(artifact), "manifest", parser) == b"v4"
+    finally:
+        keep_inode_busy.close()
+
+
+def test_symlink_shares_the_entry(artifact, tmp_path):
+    cache, parser = ParseCache(), CountingParser()
+    link = tmp_path / "link.apk"
+    link.symlink_to(artifact)
+    cache.get_or_parse(str(artifact), "manifest", parser)
+    cache.get_or_parse(str(link), "manifest", parser)
+    assert parser.calls == 1
+
+
+def test_concurrent_requests_wait_for_the_first_parse(artifact):
+    gate = threading.Event()
+    cache, parser = ParseCache(), CountingParser(gate=gate)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_parse(str(artifact), "m", parser)))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    assert parser.started.wait(5)
+    gate.set()
+    for t in threads:
+        t.join(5)
+    assert results == [b"v1"] * 8 and parser.calls == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_waiters_retry_after_a_failed_parse(artifact):
+    gate = threading.Event()
+    cache, parser = ParseCache(), CountingParser(gate=gate, fail_first=True)
+    errors, results = [], []
+
+    def first():
+        try:
+            cache.get_or_parse(str(artifact), "m", parser)
+        except ValueError as e:
+            errors.append(e)
+
+    owner = threading.Thread(target=first)
+    owner.start()
+    assert parser.started.wait(5)
+    waiter = threading.Thread(target=lambda: results.append(cache.get_or_parse(str(artifact), "m", parser)))
+    waiter.start()
+    gate.set()
+    owner.join(5)
+    waiter.join(5)
+    # The failure isn't cached: the waiter parses again instead of getting the error
+    assert len(errors) == 1 and results == [b"v1"] and parser.calls == 2
+
+
+def test_lru_bound(tmp_path):
+    cache, parser = ParseCache(max_entries=2), CountingParser()
+    paths = []
+    for name in "abc":
+        path = tmp_path / f"{name}.apk"
+        path.write_bytes(name.encode())
+        paths.append(str(path))
+    cache.get_or_parse(paths[0], "m", parser)
+    cache.get_or_parse(paths[1], "m", parser)
+    cache.get_or_parse(paths[0], "m", parser)  # a is now the most recently used
+    cache.get_or_parse(paths[2], "m", parser)
+    assert cache.stats()["entries"] == 2
+    cache.get_or_parse(paths[0], "m", parser)
+    assert parser.calls == 3
+    cache.get_or_parse(paths[1], "m", parser)
+    assert parser.calls == 4
+
+
+def test_missing_file_is_not_cached(tmp_path):
+    cache = ParseCache()
+    with pytest.raises(FileNotFoundError):
+        cache.get_or_parse(str(tmp_path / "gone.apk"), "m", CountingParser())
+    assert cache.stats()["entries"] == 0
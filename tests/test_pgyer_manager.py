@@ -0,0 +1,163 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from appinstalltest_lib.pgyer_manager import PgyerManager
+from test_segmented_downloader import RangeServer
+
+GB = 1024 ** 3
+BENCH_SIZE = 64 * 1024 * 1024
+
+
+class Events:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload):
+        self.published.append((topic, payload))
+
+    def downloading(self):
+        return [p for topic, p in self.published if topic == "progress" and "done" in p and p["status"] == "downloading"]
+
+
+@pytest.fixture
+def manager(tmp_path):
+    events = Events()
+    manager = PgyerManager(download_dir=str(tmp_path / "apks"), events=events)
+    manager.tasks.set("t1", status="pending", percent=0)
+    return manager, events
+
+
+def test_reports_progress_without_content_length(manager):
+    manager, events = manager
+    server = RangeServer(os.urandom(3 * 1024 * 1024))
+    server.ranges = False
+    server.content_length = False
+    try:
+        result = manager.download_file(server.url, "t1")
+    finally:
+        server.close()
+
+    assert result["status"] == "success" and result["size"] == 3 * 1024 * 1024
+    reports = events.downloading()
+    assert reports, events.published
+    # Bytes and speed, but the percent isn't guessed
+    assert all(r["percent"] == 0 and r["eta"] is None for r in reports)
+    assert reports[0]["message"].startswith("下载中 (") and "MB/s" in reports[0]["message"]
+    assert manager.get_progress("t1")["percent"] == 100
+
+
+def test_download_loop_cpu_per_gb(manager, record_property):
+    """Microbenchmark: CPU time (client and local server threads) per GB through download_file."""
+    manager, events = manager
+    server = RangeServer(os.urandom(BENCH_SIZE))
+    try:
+        started, started_cpu = time.perf_counter(), time.process_time()
+        result = manager.download_file(server.url, "t1")
+        cpu, elapsed = time.process_time() - started_cpu, time.perf_counter() - started
+    finally:
+        server.close()
+
+    assert result["status"] == "success" and result["size"] == BENCH_SIZE
+    cpu_per_gb = cpu * GB / BENCH_SIZE
+    record_property("download_cpu_seconds_per_gb", round(cpu_per_gb, 2))
+    print(f"download loop: {cpu_per_gb:.2f} s CPU per GB, {BENCH_SIZE / elapsed / 1048576:.0f} MB/s")
+    # Publishing is throttled to whole-percent changes and the 0.5 s interval, not per chunk
+    assert len(events.downloading()) <= 101 + elapsed / 0.5 + 1
+
+
+class GatedDownloads:
+    """Stands in for download_app: records calls and holds each one until `gate` is set."""
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.calls = []
+        self.gate = threading.Event()
+        self.started = threading.Semaphore(0)
+
+    def __call__(self, url, task_id, remark=None):
+        self.calls.append(url)
+        self.started.release()
+        self.gate.wait(5)
+        self.manager._set_progress(task_id, status="success", percent=100)
+
+
+@pytest.fixture
+def gated(manager, monkeypatch):
+    manager, _ = manager
+    downloads = GatedDownloads(manager)
+    monkeypatch.setattr(manager, "download_app", downloads)
+    yield manager, downloads
+    downloads.gate.set()
+    manager._executor.shutdown(wait=True)
+
+
+def test_concurrent_submits_of_one_link_share_a_task(gated):
+    manager, downloads = gated
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(manager.submit("https://www.pgyer.com/abcd")))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert len({task_id for task_id, _ in results}) == 1
+    assert sorted(is_new for _, is_new in results) == [False] * 7 + [True]
+    assert manager.stats()["deduplicated"] == 7
+
+    downloads.gate.set()
+    manager._executor.shutdown(wait=True)
+    assert downloads.calls == ["https://www.pgyer.com/abcd"]
+    # Finished links can be submitted again
+    manager._executor = ThreadPoolExecutor(max_workers=manager.max_downloads)
+    task_id, is_new = manager.submit("https://www.pgyer.com/abcd")
+    assert is_new and task_id != results[0][0]
+
+
+def test_worker_pool_is_bounded(gated):
+    manager, downloads = gated
+    for i in range(5):
+        manager.submit(f"https://www.pgyer.com/app{i}")
+    for _ in range(manager.max_downloads):
+        assert downloads.started.acquire(timeout=5)
+    assert not downloads.started.acquire(timeout=0.1)
+    stats = manager.stats()
+    assert (stats["running"], stats["queued"]) == (2, 3)
+    downloads.gate.set()
+    manager._executor.shutdown(wait=True)
+    assert len(downloads.calls) == 5 and manager.stats()["running"] == 0
+
+
+def test_claim_artifact_dedups_across_tokens(manager):
+    manager, _ = manager
+    manager.tasks.set("t2", status="analyzing", percent=0)
+    manager.tasks.update("t1", status="downloading", percent=40)
+    assert manager._claim_artifact("https://cdn.pgyer.com/app.apk?token=1", "t1") == "t1"
+    assert manager._claim_artifact("https://cdn.pgyer.com/app.apk?token=2", "t2") == "t1"
+    assert manager.tasks.get("t2")["status"] == "shared"
+    # Polling the sharing task shows the owner's progress
+    assert manager.get_progress("t2")["percent"] == 40
+
+    manager._release_artifact("https://cdn.pgyer.com/app.apk?token=2", "t2")  # not the owner: no effect
+    assert manager._claim_artifact("https://cdn.pgyer.com/app.apk", "t3") == "t1"
+    manager._release_artifact("https://cdn.pgyer.com/app.apk?token=1", "t1")
+    assert manager._claim_artifact("https://cdn.pgyer.com/app.apk", "t3") == "t3"
+    assert manager.stats()["deduplicated"] == 2
+
+
+def test_concurrent_claims_have_one_owner(manager):
+    manager, _ = manager
+    owners = []
+    barrier = threading.Barrier(8)
+
+    def claim(i):
+        barrier.wait()
+        owners.append(manager._claim_artifact(f"https://cdn.pgyer.com/app.apk?token={i}", f"task{i}"))
+
+    threads = [threading.Thread(target=claim, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert len(owners) == 8 and len(set(owners)) == 1
@@ -0,0 +1,66 @@
+import time
+import threading
+from appinstalltest_lib.progress_reporter import ProgressReporter
+
+GB = 1024 ** 3
+CHUNK = 64 * 1024
+
+
+def test_reports_only_on_percent_change():
+    reports = []
+    reporter = ProgressReporter(reports.append, interval=3600)
+    for done in range(CHUNK, GB + 1, CHUNK):
+        reporter.update(done, GB)
+    assert [r["percent"] for r in reports] == list(range(101))
+    assert reports[-1]["done"] == GB and reports[-1]["eta"] == 0
+
+
+def test_hot_loop_overhead():
+    # 16384 updates per GB; the old per-chunk dict writes cost ~200 ms of CPU per GB
+    reporter = ProgressReporter(lambda report: None)
+    started = time.process_time()
+    for done in range(CHUNK, GB + 1, CHUNK):
+        reporter.update(done, GB)
+    assert time.process_time() - started < 0.1
+
+
+def test_interval_reports_without_percent_change():
+    reports = []
+    reporter = ProgressReporter(reports.append, interval=0.05)
+    reporter.update(1, GB)
+    time.sleep(0.06)
+    reporter.update(2, GB)
+    reporter.update(3, GB)
+    assert [r["done"] for r in reports] == [1, 2]
+    assert reports[1]["speed"] > 0 and reports[1]["eta"] > 0
+
+
+def test_unknown_total():
+    reports = []
+    ProgressReporter(reports.append).update(CHUNK)
+    assert reports == [{"done": CHUNK, "total": 0, "percent": 0, "speed": 0, "eta": None}]
+
+
+def test_out_of_order_updates_from_segment_threads():
+    reports = []
+    reporter = ProgressReporter(reports.append, interval=0)
+    total = 4 * 1000 * CHUNK
+    counter = [0]
+    lock = threading.Lock()
+
+    def segment():
+        for _ in range(1000):
+            with lock:
+                counter[0] += CHUNK
+                done = counter[0]
+            reporter.update(done, total)
+
+    threads = [threading.Thread(target=segment) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # A stale count arriving late never moves the progress backwards
+    assert max(r["done"] for r in reports) == total
+    reporter.update(total - CHUNK, total)
+    assert reporter._done == total
@@ -0,0 +1,113 @@
+import os
+import time
+import pytest
+from appinstalltest_lib.resolution_cache import ResolutionCache
+from appinstalltest_lib.pgyer_manager import PgyerManager
+
+PAGE = "https://www.pgyer.com/abcd"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResolutionCache(str(tmp_path / "resolutions.json"), ttl=60)
+
+
+def _age(cache, url, seconds):
+    cache._entries[url]["resolved_at"] = time.time() - seconds
+
+
+def test_fresh_until_ttl(cache):
+    cache.put(PAGE, akey="k1", filename="app.apk")
+    assert cache.is_fresh(cache.get(PAGE))
+    _age(cache, PAGE, 59)
+    assert cache.is_fresh(cache.get(PAGE))
+    _age(cache, PAGE, 61)
+    entry = cache.get(PAGE)
+    # Stale entries are kept for the same-build shortcut, just not trusted on their own
+    assert not cache.is_fresh(entry) and entry["filename"] == "app.apk"
+
+
+def test_put_merges_and_refreshes(cache):
+    cache.put(PAGE, akey="k1", filename="app.apk", size=10)
+    _age(cache, PAGE, 3600)
+    cache.put(PAGE, akey="k1")
+    entry = cache.get(PAGE)
+    assert cache.is_fresh(entry) and (entry["filename"], entry["size"]) == ("app.apk", 10)
+
+
+def test_missing_entry_is_not_fresh(cache):
+    assert cache.get(PAGE) is None and not cache.is_fresh(None)
+
+
+def test_get_returns_a_copy(cache):
+    cache.put(PAGE, akey="k1")
+    cache.get(PAGE)["akey"] = "changed"
+    assert cache.get(PAGE)["akey"] == "k1"
+
+
+def test_least_recently_resolved_entries_are_dropped(tmp_path):
+    cache = ResolutionCache(str(tmp_path / "resolutions.json"), max_entries=2)
+    cache.put("a", akey="1")
+    cache.put("b", akey="2")
+    cache.put("a", akey="1")  # re-resolved, so "b" is now the oldest
+    cache.put("c", akey="3")
+    assert cache.get("a") and cache.get("c") and cache.get("b") is None
+
+
+def test_persists_across_restarts(tmp_path, cache):
+    cache.put(PAGE, akey="k1")
+    cache.put("https://www.pgyer.com/gone", akey="k2")
+    cache.invalidate("https://www.pgyer.com/gone")
+    reloaded = ResolutionCache(cache.path, ttl=60)
+    assert reloaded.get(PAGE)["akey"] == "k1" and reloaded.is_fresh(reloaded.get(PAGE))
+    assert reloaded.get("https://www.pgyer.com/gone") is None
+
+
+def test_unreadable_file_starts_empty(tmp_path):
+    path = tmp_path / "resolutions.json"
+    path.write_text("{not json")
+    assert ResolutionCache(str(path)).get(PAGE) is None
+
+
+class OfflineHttp:
+    """Counts sessions and refuses to connect, so every real resolution fails."""
+
+    def __init__(self):
+        self.sessions = 0
+
+    def session(self, headers=None):
+        self.sessions += 1
+        raise ConnectionError("offline")
+
+
+@pytest.fixture
+def manager(tmp_path):
+    http = OfflineHttp()
+    manager = PgyerManager(download_dir=str(tmp_path / "apks"), http_client=http, resolution_ttl=60)
+    with open(os.path.join(manager.download_dir, "app.apk"), "wb") as f:
+        f.write(b"x" * 10)
+    manager.resolutions.put(PAGE, akey="k1", filename="app.apk", size=10)
+    return manager, http
+
+
+def test_fresh_resolution_skips_the_network(manager):
+    manager, http = manager
+    result = manager.download_app(PAGE, "t1")
+    assert (result["status"], result["cached"], result["filename"]) == ("success", "fresh", "app.apk")
+    assert http.sessions == 0
+    assert manager.get_progress("t1")["status"] == "success"
+
+
+def test_stale_resolution_resolves_again(manager):
+    manager, http = manager
+    _age(manager.resolutions, PAGE, 61)
+    assert manager.download_app(PAGE, "t1")["status"] == "error"
+    assert http.sessions == 1
+
+
+def test_changed_local_file_resolves_again(manager):
+    manager, http = manager
+    with open(os.path.join(manager.download_dir, "app.apk"), "ab") as f:
+        f.write(b"more")
+    manager.download_app(PAGE, "t1")
+    assert http.sessions == 1
@@ -0,0 +1,8 @@
+from collections import Counter
+
+
+def test_every_route_is_registered_once(main_module):
+    # A second registration of a path and method is dead code: the first one always matches
+    routes = Counter((method, route.path) for route in main_module.app.routes
+                     for method in getattr(route, "methods", None) or ())
+    assert [route for route, count in routes.items() if count > 1] == []
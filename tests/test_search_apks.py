@@ -0,0 +1,149 @@
+import json
+import base64
+import asyncio
+import shutil
+import httpx
+import pytest
+from appinstalltest_lib.apk_manager import ApkManager, InvalidCursor
+from appinstalltest_lib.metadata_store import MetadataStore
+
+TIMES = ["2026-01-01 10:00:00", "2026-01-02 10:00:00", None]
+
+
+@pytest.fixture
+def rows():
+    """Rows with many ties on every sort column, and NULLs in both sort columns."""
+    rows = {}
+    for i in range(30):
+        filename = f"app{i:02d}.{'ipa' if i % 5 == 0 else 'apk'}"
+        rows[filename] = {
+            "custom_name": "nightly" if i % 3 == 0 else "release",
+            "version_code": None if i % 7 == 0 else str(100 + i % 4),
+            "package_name": f"com.example.p{i % 2}",
+            "upload_time": TIMES[i % 3],
+        }
+    return rows
+
+
+@pytest.fixture
+def store(tmp_path, rows):
+    store = MetadataStore(str(tmp_path / "meta.db"))
+    store.add_missing(rows)
+    return store
+
+
+def _pages(store, limit, **filters):
+    seen, after = [], None
+    while True:
+        items, after = store.query(after=after, limit=limit, **filters)
+        assert len(items) <= limit
+        seen.extend(item["filename"] for item in items)
+        if after is None:
+            return seen
+
+
+def _pages_from(store, after, limit):
+    seen = []
+    while after is not None:
+        items, after = store.query(after=after, limit=limit)
+        seen.extend(item["filename"] for item in items)
+    return seen
+
+
+def _expected(rows, sort="upload_time", descending=True, predicate=lambda meta: True):
+    def key(filename):
+        meta = rows[filename]
+        if sort == "upload_time":
+            return meta["upload_time"] or "", filename
+        if sort == "version_code":
+            return int(meta["version_code"]) if meta["version_code"] else -1, filename
+        return (filename,)
+    return sorted((f for f, meta in rows.items() if predicate(meta | {"filename": f})), key=key, reverse=descending)
+
+
+@pytest.mark.parametrize("sort", ["upload_time", "version_code", "filename"])
+@pytest.mark.parametrize("descending", [True, False])
+@pytest.mark.parametrize("limit", [1, 4, 7, 30, 31])
+def test_pages_are_stable_across_ties(store, rows, sort, descending, limit):
+    pages = _pages(store, limit, sort=sort, descending=descending)
+    assert pages == _expected(rows, sort, descending)
+
+
+def test_rows_added_between_pages_do_not_shift_the_rest(store, rows):
+    first, after = store.query(after=None, limit=10)
+    # Newest upload, so it sorts ahead of the cursor: the next pages neither repeat nor skip a row
+    store.put("new.apk", {"upload_time": "2027-01-01 00:00:00", "version_code": "1"})
+    rest = _pages_from(store, after, limit=10)
+    assert [i["filename"] for i in first] + rest == _expected(rows)
+
+
+@pytest.mark.parametrize("filters, predicate", [
+    ({"platform": "ios"}, lambda m: m["filename"].endswith(".ipa")),
+    ({"platform": "android", "package_name": "com.example.p1"},
+     lambda m: m["filename"].endswith(".apk") and m["package_name"] == "com.example.p1"),
+    ({"version_code_min": 101, "version_code_max": 102},
+     lambda m: m["version_code"] is not None and 101 <= int(m["version_code"]) <= 102),
+    ({"text": "night", "platform": "android", "version_code_min": 100},
+     lambda m: m["custom_name"] == "nightly" and m["filename"].endswith(".apk") and m["version_code"] is not None),
+    ({"text": "%"}, lambda m: False),  # LIKE wildcards are matched literally
+])
+@pytest.mark.parametrize("sort", ["upload_time", "version_code"])
+def test_filter_combinations(store, rows, filters, predicate, sort):
+    assert _pages(store, 3, sort=sort, **filters) == _expected(rows, sort, predicate=predicate)
+
+
+def _cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+@pytest.fixture
+def manager(tmp_path, make_apk):
+    manager = ApkManager(str(tmp_path / "apks"), server_port=8791)
+    for i in range(5):
+        shutil.copy(make_apk(f"demo{i}.apk", version_code=10 + i % 2), tmp_path / "apks" / f"demo{i}.apk")
+        manager.register_file(f"demo{i}.apk")
+    return manager
+
+
+def test_cursor_round_trip(manager):
+    seen, cursor = [], None
+    while True:
+        page = manager.search_apks(sort="version_code", order="asc", cursor=cursor, limit=2)
+        seen.extend(item["filename"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == ["demo0.apk", "demo2.apk", "demo4.apk", "demo1.apk", "demo3.apk"]
+
+
+TAMPERED_CURSORS = [
+    "not base64!",
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),  # not UTF-8
+    _cursor({"after": 1}),
+    _cursor([1]),
+    _cursor([1, 2]),
+    _cursor([{"x": 1}, "demo0.apk"]),
+    _cursor([True, "demo0.apk"]),
+    base64.urlsafe_b64encode(b"[1, ").decode(),
+]
+
+
+@pytest.mark.parametrize("cursor", TAMPERED_CURSORS)
+def test_tampered_cursor_is_rejected(manager, cursor):
+    with pytest.raises(InvalidCursor):
+        manager.search_apks(cursor=cursor)
+
+
+async def _get(app, path, **params):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return await client.get(path, params=params)
+
+
+@pytest.mark.parametrize("params", [{"cursor": c} for c in TAMPERED_CURSORS] + [
+    {"order": "sideways"},
+    {"sort": "sha256"},
+    {"platform": "windows"},
+])
+def test_search_endpoint_rejects_bad_parameters(main_module, params):
+    response = asyncio.run(_get(main_module.app, "/apks/search", **params))
+    assert response.status_code == 400, response.text
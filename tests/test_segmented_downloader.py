@@ -0,0 +1,169 @@
+import os
+import re
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+import requests
+from appinstalltest_lib.segmented_downloader import SegmentedDownloader, DownloadError
+
+SEGMENT = 64 * 1024
+
+
+class RangeServer:
+    """Local HTTP server for one file, with switches for the misbehaviours a CDN shows."""
+
+    def __init__(self, data, etag='"v1"'):
+        self.data = data
+        self.etag = etag
+        self.ranges = True  # answer Range requests with 206
+        self.drop_at = None  # cut the response to the range starting here in half, once
+        self.content_length = True  # False: close-delimited bodies, as some CDNs send them
+        self.requests = []  # (Range, If-Range) of every request
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.handle(self)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_port}/app.apk"
+        threading.Thread(target=self.httpd.serve_forever, args=(0.05,), daemon=True).start()
+
+    def handle(self, request):
+        range_header, if_range = request.headers.get("Range"), request.headers.get("If-Range")
+        self.requests.append((range_header, if_range))
+        partial = range_header and self.ranges and (if_range is None or if_range == self.etag)
+        if partial:
+            start, end = re.match(r"bytes=(\d+)-(\d*)", range_header).groups()
+            start, end = int(start), int(end) if end else len(self.data) - 1
+            body = self.data[start:end + 1]
+            request.send_response(206)
+            request.send_header("Content-Range", f"bytes {start}-{end}/{len(self.data)}")
+        else:
+            body = self.data
+            request.send_response(200)
+        if self.content_length:
+            request.send_header("Content-Length", str(len(body)))
+        request.send_header("Content-Type", "application/vnd.android.package-archive")
+        if self.etag:
+            request.send_header("ETag", self.etag)
+        request.end_headers()
+        try:
+            if partial and start == self.drop_at:
+                self.drop_at = None
+                request.wfile.write(body[:len(body) // 2])
+                request.wfile.flush()
+                request.close_connection = True
+                return
+            request.wfile.write(body)
+        except (ConnectionError, BrokenPipeError):
+            pass  # The client gave up on a 200 it didn't want
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    s = RangeServer(os.urandom(4 * SEGMENT + 123))
+    yield s
+    s.close()
+
+
+def downloader(**kwargs):
+    kwargs.setdefault("segments", 4)
+    kwargs.setdefault("min_segment_size", SEGMENT)
+    return SegmentedDownloader(**kwargs)
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_parallel_download(server, tmp_path):
+    dest = str(tmp_path / "app.apk")
+    progress = []
+    info = downloader().download(server.url, dest, session=requests.Session(), progress=lambda d, t: progress.append(d))
+    assert read(dest) == server.data
+    assert info == {"etag": '"v1"', "last_modified": None, "size": len(server.data)}
+    assert sum(1 for r, _ in server.requests if r != "bytes=0-0") == 4
+    assert all(if_range == '"v1"' for r, if_range in server.requests if r != "bytes=0-0")
+    assert progress[-1] == len(server.data)
+    assert os.listdir(tmp_path) == ["app.apk"]
+
+
+def test_resume_after_interruption(server, tmp_path):
+    dest = str(tmp_path / "app.apk")
+    # The last segment fails; the others complete and are kept
+    server.drop_at = 3 * (len(server.data) // 4 + 1)
+    with pytest.raises(DownloadError):
+        downloader(max_retries=0).download(server.url, dest, session=requests.Session())
+    with open(dest + ".part.json") as f:
+        state = json.load(f)
+    done = sum(s[2] for s in state["segments"])
+    assert 0 < done < len(server.data)
+
+    server.requests.clear()
+    downloader().download(server.url, dest, session=requests.Session())
+    assert read(dest) == server.data
+    # Only what was missing is fetched again
+    fetched = 0
+    for range_header, _ in server.requests[1:]:
+        start, end = map(int, re.match(r"bytes=(\d+)-(\d+)", range_header).groups())
+        fetched += end - start + 1
+    assert fetched == len(server.data) - done
+    assert not os.path.exists(dest + ".part.json")
+
+
+def test_remote_change_restarts_in_single_stream(server, tmp_path):
+    dest = str(tmp_path / "app.apk")
+    new_data = os.urandom(len(server.data))
+
+    # The file is replaced right after the probe: every If-Range now gets a 200
+    original_handle = server.handle
+
+    def replace_after_probe(request):
+        original_handle(request)
+        if server.etag == '"v1"':
+            server.data, server.etag = new_data, '"v2"'
+
+    server.handle = replace_after_probe
+    info = downloader().download(server.url, dest, session=requests.Session())
+    assert read(dest) == new_data
+    assert info["etag"] == '"v2"' and info["size"] == len(new_data)
+    assert not os.path.exists(dest + ".part.json")
+
+
+def test_weak_etag_is_not_sent_as_if_range(server, tmp_path):
+    dest = str(tmp_path / "app.apk")
+    server.etag = 'W/"v1"'
+    downloader().download(server.url, dest, session=requests.Session())
+    assert read(dest) == server.data
+    assert all(if_range is None for _, if_range in server.requests)
+
+
+def test_checkpoint_of_other_size_starts_over(server, tmp_path):
+    dest = str(tmp_path / "app.apk")
+    stale = {"total": len(server.data) + 1, "validator": '"v1"', "segments": [[0, len(server.data), 1000]]}
+    with open(dest + ".part.json", "w") as f:
+        json.dump(stale, f)
+    with open(dest + ".part", "wb") as f:
+        f.write(b"\0" * (len(server.data) + 1))
+
+    downloader().download(server.url, dest, session=requests.Session())
+    assert read(dest) == server.data
+
+
+def test_no_range_support(server, tmp_path):
+    dest = str(tmp_path / "app.apk")
+    server.ranges = False
+    info = downloader().download(server.url, dest, session=requests.Session())
+    assert read(dest) == server.data
+    assert info["size"] == len(server.data)
+    assert len(server.requests) == 1
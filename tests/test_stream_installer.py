@@ -0,0 +1,123 @@
+import time
+import pytest
+from appinstalltest_lib.adb_protocol import AdbProtocolError
+from appinstalltest_lib.stream_installer import StreamInstaller, StreamInstallError, StreamUnavailable
+from fake_adb import FakeAdbServer
+from test_segmented_downloader import RangeServer
+
+SERIAL = "emulator-5554"
+
+
+@pytest.fixture
+def adb():
+    server = FakeAdbServer()
+    server.devices = {SERIAL: "device"}
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def apk(make_apk):
+    with open(make_apk(padding=4 * 1024 * 1024), "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def http(apk):
+    server = RangeServer(apk)
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def installer(adb):
+    return StreamInstaller(adb_host=adb.host, adb_port=adb.port, timeout=5, install_timeout=5)
+
+
+def _read(conn, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = conn.recv(min(65536, size - len(data)))
+        if not chunk:
+            break
+        data.extend(chunk)
+    return bytes(data)
+
+
+def pm(verdict="Success", read_limit=None, silent=False):
+    """exec: handler acting like `cmd package install -S <size>`; records what it received."""
+    received = {}
+
+    def handler(command, conn):
+        size = int(command.rsplit("-S ", 1)[1])
+        received["command"] = command
+        received["data"] = _read(conn, min(size, read_limit) if read_limit else size)
+        if silent:
+            time.sleep(1)
+            return
+        conn.sendall(verdict.encode() + b"\n")
+    handler.received = received
+    return handler
+
+
+def test_streams_the_body_into_pm(adb, http, installer, apk):
+    adb.exec_handlers[SERIAL] = handler = pm()
+    assert installer.install(SERIAL, http.url) == "Success"
+    assert handler.received["command"] == f"cmd package install -r -S {len(apk)}"
+    assert handler.received["data"] == apk
+    assert f"host:transport:{SERIAL}" in adb.requests
+
+
+def test_flags_are_passed_through(adb, http, installer, apk):
+    adb.exec_handlers[SERIAL] = handler = pm()
+    installer.install(SERIAL, http.url, flags=("-r", "-d", "-t"))
+    assert handler.received["command"] == f"cmd package install -r -d -t -S {len(apk)}"
+
+
+def test_pm_failure_after_the_transfer(adb, http, installer):
+    adb.exec_handlers[SERIAL] = pm("Failure [INSTALL_FAILED_UPDATE_INCOMPATIBLE: signatures do not match]")
+    with pytest.raises(StreamInstallError, match="INSTALL_FAILED_UPDATE_INCOMPATIBLE"):
+        installer.install(SERIAL, http.url)
+
+
+def test_pm_rejecting_early_fails_fast(adb, http, installer):
+    # pm reads the first bytes, prints its verdict and closes while we are still sending
+    adb.exec_handlers[SERIAL] = pm("Failure [INSTALL_FAILED_INSUFFICIENT_STORAGE]", read_limit=64 * 1024)
+    started = time.monotonic()
+    with pytest.raises(StreamInstallError, match="Install failed"):
+        installer.install(SERIAL, http.url)
+    assert time.monotonic() - started < installer.install_timeout
+
+
+def test_silent_pm_times_out(adb, http):
+    adb.exec_handlers[SERIAL] = pm(silent=True)
+    installer = StreamInstaller(adb_host=adb.host, adb_port=adb.port, timeout=5, install_timeout=0.2)
+    with pytest.raises(StreamInstallError, match="No answer from pm"):
+        installer.install(SERIAL, http.url)
+
+
+def test_missing_content_length_falls_back_before_touching_the_device(adb, http, installer):
+    adb.exec_handlers[SERIAL] = pm()
+    http.content_length = False
+    with pytest.raises(StreamUnavailable):
+        installer.install(SERIAL, http.url)
+    assert not any(r.startswith("exec:") for r in adb.requests)
+
+
+def test_unknown_device(adb, http, installer):
+    with pytest.raises(AdbProtocolError, match="not found"):
+        installer.install("missing-serial", http.url)
+
+
+def test_read_manifest_uses_range_requests(http, installer, apk):
+    manifest = installer.read_manifest(http.url)
+    assert (manifest["package"], manifest["versionCode"]) == ("com.example.demo", 42)
+    # Probe plus a few reads of the zip directory and the manifest, not the 4 MB body
+    assert len(http.requests) < 10
+    assert all(range_header for range_header, _ in http.requests)
+
+
+def test_read_manifest_without_range_support(http, installer):
+    http.ranges = False
+    with pytest.raises(StreamUnavailable):
+        installer.read_manifest(http.url)
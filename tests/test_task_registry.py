@@ -0,0 +1,101 @@
+import json
+import time
+from appinstalltest_lib.task_registry import TaskRegistry
+
+
+def _age(registry, task_id, seconds):
+    registry._tasks[task_id]["updated_at"] = time.time() - seconds
+
+
+def test_update_merges_and_set_replaces():
+    registry = TaskRegistry()
+    registry.set("t1", status="queued", percent=0)
+    registry.update("t1", status="downloading", percent=10)
+    entry = registry.get("t1")
+    assert (entry["status"], entry["percent"]) == ("downloading", 10)
+    registry.set("t1", status="error")
+    entry = registry.get("t1")
+    assert "percent" not in entry and entry["created_at"] <= entry["updated_at"]
+
+
+def test_readers_get_copies():
+    registry = TaskRegistry()
+    returned = registry.set("t1", status="queued")
+    returned["status"] = "tampered"
+    registry.get("t1")["status"] = "tampered"
+    registry.list()[0]["status"] = "tampered"
+    assert registry.get("t1")["status"] == "queued"
+
+
+def test_finished_tasks_expire_after_ttl():
+    registry = TaskRegistry(ttl=60)
+    registry.set("done", status="success")
+    registry.set("failed", status="error")
+    registry.set("running", status="downloading")
+    _age(registry, "done", 59)
+    _age(registry, "failed", 61)
+    _age(registry, "running", 3600)  # active tasks never expire
+    assert [e["task_id"] for e in registry.list()] == ["done", "running"]
+    assert [e["task_id"] for e in registry.active()] == ["running"]
+
+
+def test_cap_drops_finished_tasks_first():
+    registry = TaskRegistry(max_tasks=3)
+    registry.set("a", status="downloading")
+    registry.set("b", status="success")
+    registry.set("c", status="downloading")
+    registry.set("d", status="queued")
+    assert [e["task_id"] for e in registry.list()] == ["a", "c", "d"]
+    # Nothing finished left to drop: the oldest active task goes
+    registry.set("e", status="queued")
+    assert [e["task_id"] for e in registry.list()] == ["c", "d", "e"]
+
+
+def test_finished_tasks_are_saved_immediately(tmp_path):
+    path = tmp_path / "tasks.json"
+    registry = TaskRegistry(path=str(path), save_interval=3600)
+    registry.set("t1", status="downloading", percent=0)  # first write saves
+    registry.update("t1", percent=50)  # throttled
+    assert json.loads(path.read_text())["t1"]["percent"] == 0
+    registry.update("t1", status="success", percent=100)
+    assert json.loads(path.read_text())["t1"]["status"] == "success"
+
+
+def test_flush_writes_throttled_changes(tmp_path):
+    path = tmp_path / "tasks.json"
+    registry = TaskRegistry(path=str(path), save_interval=3600)
+    registry.set("t1", status="downloading", percent=0)
+    registry.update("t1", percent=70)
+    registry.discard("gone")
+    registry.flush()
+    assert json.loads(path.read_text())["t1"]["percent"] == 70
+
+
+def test_reload_marks_interrupted_tasks_failed(tmp_path):
+    path = str(tmp_path / "tasks.json")
+    registry = TaskRegistry(path=path)
+    registry.set("done", status="success", filename="app.apk")
+    registry.set("running", status="downloading", percent=40)
+    registry.flush()
+
+    reloaded = TaskRegistry(path=path)
+    assert reloaded.get("done")["filename"] == "app.apk"
+    running = reloaded.get("running")
+    assert running["status"] == "error" and running["percent"] == 40
+    assert reloaded.active() == []
+
+
+def test_reload_drops_expired_tasks(tmp_path):
+    path = tmp_path / "tasks.json"
+    path.write_text(json.dumps({"old": {"status": "success", "created_at": 0, "updated_at": 0},
+                                "new": {"status": "success", "created_at": 0, "updated_at": time.time()}}))
+    assert [e["task_id"] for e in TaskRegistry(ttl=60, path=str(path)).list()] == ["new"]
+
+
+def test_unreadable_file_starts_empty(tmp_path):
+    path = tmp_path / "tasks.json"
+    path.write_text("[")
+    registry = TaskRegistry(path=str(path))
+    assert registry.list() == []
+    registry.set("t1", status="success")
+    assert "t1" in json.loads(path.read_text())
@@ -0,0 +1,41 @@
+import pytest
+from appinstalltest_lib import test_runner
+from appinstalltest_lib.test_runner import reports_steps
+
+
+class RecordingBus:
+    def __init__(self):
+        self.events = []
+
+    def publish(self, topic, data):
+        self.events.append((topic, data))
+
+
+class StepRunner(test_runner.TestRunner):
+    __test__ = False
+
+    @reports_steps("install_old")
+    def ok_step(self, serial):
+        return {"status": "success"}
+
+    @reports_steps("install_old")
+    def crashing_step(self, serial):
+        raise RuntimeError("adb server died")
+
+
+def steps(bus):
+    return [(data["step"], data.get("result")) for topic, data in bus.events if topic == "install"]
+
+
+def test_reports_started_and_finished():
+    bus = RecordingBus()
+    StepRunner(None, None, events=bus).ok_step("s1")
+    assert steps(bus) == [("started", None), ("finished", {"status": "success"})]
+
+
+def test_reports_finished_when_the_step_raises():
+    bus = RecordingBus()
+    with pytest.raises(RuntimeError):
+        StepRunner(None, None, events=bus).crashing_step("s1")
+    assert steps(bus) == [("started", None), ("finished", {"status": "error", "message": "adb server died",
+                                                           "error_type": "RuntimeError"})]
@@ -0,0 +1,78 @@
+import os
+import time
+import asyncio
+import hashlib
+from types import SimpleNamespace
+import httpx
+from appinstalltest_lib.apk_manager import ApkManager
+
+UPLOAD_SIZE = 128 * 1024 * 1024
+
+
+async def _poll_devices(client, until_done, latencies):
+    while not until_done():
+        # Timed from the moment the request is due, so a stalled loop shows up
+        # even if it stalls between two requests
+        due = time.perf_counter() + 0.01
+        await asyncio.sleep(0.01)
+        r = await client.get("/devices")
+        latencies.append(time.perf_counter() - due)
+        assert r.status_code == 200
+
+
+async def _upload_while_polling(app, apk_path):
+    """(upload result, /devices latencies without an upload, latencies during the upload)."""
+    baseline, latencies = [], []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        await _poll_devices(client, lambda: len(baseline) >= 20, baseline)
+        with open(apk_path, "rb") as f:
+            upload = asyncio.create_task(client.post("/upload", files={"file": ("big.apk", f)},
+                                                     data={"remark": "latency"}))
+            await _poll_devices(client, upload.done, latencies)
+            response = await upload
+    return response.json(), baseline, latencies
+
+
+def test_devices_stay_responsive_during_upload(main_module, make_apk):
+    apk_path = make_apk("big.apk", padding=UPLOAD_SIZE)
+    result, baseline, latencies = asyncio.run(_upload_while_polling(main_module.app, apk_path))
+
+    with open(apk_path, "rb") as f:
+        assert result == {"filename": "big.apk", "status": "success", "sha256": hashlib.sha256(f.read()).hexdigest()}
+    assert len(latencies) > 3
+    # Writing and hashing run off the event loop, so /devices never waits for the upload.
+    # Relative to this machine's own latency: hashing 128 MB on the loop stalls it far longer
+    bound = 5 * max(baseline) + 0.05
+    assert max(latencies) < bound, (latencies, baseline)
+
+
+def test_upload_is_parsed_inline(main_module, make_apk):
+    async def upload():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main_module.app), base_url="http://test") as client:
+            with open(make_apk("demo.apk"), "rb") as f:
+                await client.post("/upload", files={"file": ("demo.apk", f)})
+            return (await client.get("/apks")).json()
+
+    listed = {item["filename"]: item for item in asyncio.run(upload())["android"]}
+    assert listed["demo.apk"]["package_name"] == "com.example.demo"
+    assert listed["demo.apk"]["version_code"] == "42"
+
+
+def test_listeners_are_notified_after_the_row_is_written(tmp_path, make_apk):
+    seen = []
+
+    class Events:
+        def publish(self, topic, payload):
+            seen.append((os.path.exists(manager.get_apk_path("demo.apk")), manager.store.get("demo.apk")))
+
+    manager = ApkManager(str(tmp_path / "apks"), server_port=8791, events=Events())
+    manager.schedule_inspection = lambda filename: None
+    with open(make_apk("demo.apk"), "rb") as f:
+        result = asyncio.run(manager.save_apk(SimpleNamespace(filename="demo.apk", file=f), remark="nightly"))
+
+    assert result["status"] == "success"
+    # One notification, and by then both the file and its parsed row are there
+    assert len(seen) == 1
+    exists, row = seen[0]
+    assert exists and (row["package_name"], row["version_code"], row["custom_name"]) == (
+        "com.example.demo", "42", "nightly")